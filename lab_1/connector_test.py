@@ -1,62 +1,42 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
-import psycopg2
-import redis
-from neo4j import GraphDatabase
-from pymongo import MongoClient
-from elasticsearch import Elasticsearch
+import os
+import sys
 import time
 import uuid
 import json
 
-# --- Конфигурация подключений ---
-POSTGRES_CONFIG = {
-    "dbname": "mydb",
-    "user": "admin",
-    "password": "secret",
-    "host": "postgres", 
-    "port": "5432"      
-}
-
-REDIS_CONFIG = {
-    "host": "redis", 
-    "port": 6379,
-    "db": 0
-}
-
-NEO4J_CONFIG = {
-    "uri": "bolt://neo4j:7687", 
-    "user": "neo4j",
-    "password": "neo4j" 
-}
-
-MONGODB_CONFIG = {
-    "uri": "mongodb://mongo:27017/", 
-    "database": "university"
-}
-
-ELASTICSEARCH_CONFIG = {
-    "hosts": ["http://elasticsearch:9200"] 
-}
+# backends.py лежит рядом в контейнере и в python-script/ в репозитории
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "python-script"))
+import backends
+# Драйверы баз загружаются при первом подключении (backends.lazy_import)
+from backends import IMPORT_TIMES
+
+# --- Конфигурация подключений (общая с generate_data.py) ---
+from backends import NEO4J_CONFIG
+
+# Тест всегда подключался к Neo4j как neo4j/neo4j; без NEO4J_AUTH так и остаётся
+if "NEO4J_AUTH" not in os.environ:
+    NEO4J_CONFIG["auth"] = ("neo4j", "neo4j")
 
 # --- Вспомогательные функции ---
 
 def get_postgres_connection():
-    return psycopg2.connect(**POSTGRES_CONFIG)
+    """Соединение из общего пула; вернуть – backends.release_postgres_connection()."""
+    return backends.acquire_postgres_connection()
 
 def get_redis_connection():
-    return redis.Redis(**REDIS_CONFIG, decode_responses=True)
+    return backends.redis_client()
 
 def get_neo4j_driver():
-    return GraphDatabase.driver(NEO4J_CONFIG["uri"], auth=(NEO4J_CONFIG["user"], NEO4J_CONFIG["password"]))
+    return backends.neo4j_driver()
 
 def get_mongodb_client():
-    client = MongoClient(MONGODB_CONFIG["uri"])
-    return client[MONGODB_CONFIG["database"]]
+    return backends.mongodb_database()
 
 def get_elasticsearch_client():
-    return Elasticsearch(**ELASTICSEARCH_CONFIG)
+    return backends.elasticsearch_client()
 
 def get_es_data(es_doc):
     """Извлекает актуальные данные из сообщения Debezium"""
@@ -1350,54 +1330,22 @@ def test_users_crud(pg_conn, es_client_generic):
 
 def main():
     pg_conn = None
-    redis_conn = None
-    neo4j_driver = None
-    mongo_client_obj = None # MongoClient object
-    es_client_generic = None # For elastic-sink (most tables)
-    es_client_specific = None # For elasticsearch-sink (student table)
-
     try:
         # --- Подключения ---
-        print("Подключение к базам данных...")
-        pg_conn = get_postgres_connection()
-        print("  PostgreSQL: подключено")
-        redis_conn = get_redis_connection()
-        # Проверка подключения Redis
-        try:
-            redis_conn.ping()
-            print("  Redis: подключено")
-        except redis.exceptions.ConnectionError as e:
-            print(f"  Redis: ОШИБКА подключения - {e}")
+        # Все базы проверяются одновременно: ожидание длится до готовности самой медленной
+        print("Проверка готовности баз данных...")
+        readiness = backends.wait_for_backends()
+        for name, result in readiness.items():
+            print(f"  {backends.describe_readiness(name, result)}")
+        if not all(result["ready"] for result in readiness.values()):
             return
 
+        pg_conn = get_postgres_connection()
+        redis_conn = get_redis_connection()
         neo4j_driver = get_neo4j_driver()
-        # Проверка подключения Neo4j
-        try:
-            with neo4j_driver.session(database=NEO4J_CONFIG.get("database", "neo4j")) as session:
-                session.run("RETURN 1")
-            print("  Neo4j: подключено")
-        except Exception as e:
-            print(f"  Neo4j: ОШИБКА подключения - {e}")
-            # neo4j_driver.close() # Закрываем, если не удалось подключиться
-            return
-        
-        mongo_client_obj = MongoClient(MONGODB_CONFIG["uri"])
-        # Проверка подключения MongoDB
-        try:
-            mongo_client_obj.admin.command('ping')  # Правильный способ проверки
-            print("  MongoDB: подключено")
-        except Exception as e:
-            print(f"  MongoDB: ОШИБКА подключения - {e}")
-            return
-        mongo_db = mongo_client_obj[MONGODB_CONFIG["database"]]
-
+        mongo_db = get_mongodb_client()
         es_client_generic = get_elasticsearch_client()
-        es_client_specific = get_elasticsearch_client() # Тот же клиент, но для логического разделения
-        if es_client_generic.ping():
-            print("  Elasticsearch: подключено")
-        else:
-            print("  Elasticsearch: ОШИБКА подключения")
-            return
+        es_client_specific = es_client_generic # Тот же клиент, но для логического разделения
         
         print(f"\nВАЖНО: Задержка между операциями в PostgreSQL и проверками в других БД установлена на {KAFKA_CONNECT_DELAY} секунд.")
         print("Это время необходимо Kafka Connect для обработки изменений. Возможно, его потребуется скорректировать.")
@@ -1438,21 +1386,13 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
+        # Клиенты и пулы переиспользуются тестами и закрываются один раз
         if pg_conn:
-            pg_conn.close()
-            print("\nPostgreSQL: соединение закрыто")
-        if redis_conn:
-            # redis.close() не стандартный метод для объекта redis.Redis
-            pass # Соединение обычно управляется пулом и закрывается при выходе из программы
-            print("Redis: клиент будет закрыт при выходе")
-        if neo4j_driver:
-            neo4j_driver.close()
-            print("Neo4j: драйвер закрыт")
-        if mongo_client_obj:
-            mongo_client_obj.close()
-            print("MongoDB: клиент закрыт")
-        # Elasticsearch клиент не требует явного close() для базового использования
-        print("Elasticsearch: клиент будет закрыт при выходе")
+            backends.release_postgres_connection(pg_conn)
+        backends.close_clients()
+        print("\nСоединения с базами закрыты")
+        for name, started, finished in IMPORT_TIMES:
+            print(f"Импорт {name}: {(finished - started) * 1000:.0f} мс")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
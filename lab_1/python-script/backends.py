@@ -0,0 +1,300 @@
+"""
+Общие параметры подключения к базам стенда, параллельная проверка их готовности
+и переиспользуемые клиенты. Используется generate_data.py и connector_test.py, а при
+запуске как скрипта – для ожидания баз при старте контейнера:
+
+    python backends.py                            # все базы
+    python backends.py postgres elasticsearch --timeout 120
+
+Базы проверяются одновременно, каждая в своём потоке с экспоненциальной задержкой
+между попытками (от BACKEND_RETRY_INITIAL до BACKEND_RETRY_MAX), поэтому ожидание
+длится столько, сколько готовится самая медленная база, а не сумму по всем. Для
+каждой базы сообщается время до готовности и число попыток.
+
+Клиенты (пул соединений PostgreSQL, Redis, драйвер Neo4j, MongoClient, Elasticsearch)
+создаются при первом обращении и переиспользуются до close_clients().
+"""
+import argparse
+import importlib
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Время импорта модулей, загруженных через lazy_import: (имя, начало, конец) по time.time()
+IMPORT_TIMES = []
+_imports_lock = threading.Lock()
+
+def lazy_import(name):
+    """
+    Импортирует модуль при первом обращении и запоминает время импорта. Драйверы баз,
+    bcrypt и Faker нужны не всем этапам и не всем скриптам, поэтому загружаются только там,
+    где используются.
+    """
+    module = sys.modules.get(name)
+    if module is None:
+        with _imports_lock:
+            module = sys.modules.get(name)
+            if module is None:
+                started = time.time()
+                module = importlib.import_module(name)
+                IMPORT_TIMES.append((name, started, time.time()))
+    return module
+
+
+def _neo4j_auth(value):
+    """NEO4J_AUTH в формате образа neo4j: "none" или "пользователь/пароль"."""
+    if value.lower() == "none":
+        return None
+    user, _, password = value.partition("/")
+    return (user, password)
+
+##########################################################################
+# Параметры подключения
+##########################################################################
+
+POSTGRES_CONFIG = {
+    "host": os.environ.get("POSTGRES_HOST", "postgres"),
+    "port": int(os.environ.get("POSTGRES_PORT", "5432")),
+    "user": os.environ.get("POSTGRES_USER", "admin"),
+    "password": os.environ.get("POSTGRES_PASSWORD", "secret"),
+    "dbname": os.environ.get("POSTGRES_DB", "mydb"),
+}
+
+REDIS_CONFIG = {
+    "host": os.environ.get("REDIS_HOST", "redis"),
+    "port": int(os.environ.get("REDIS_PORT", "6379")),
+    "db": int(os.environ.get("REDIS_DB", "0")),
+}
+
+NEO4J_CONFIG = {
+    "uri": os.environ.get("NEO4J_URI", "bolt://neo4j:7687"),
+    "auth": _neo4j_auth(os.environ.get("NEO4J_AUTH", "none")),
+    "database": os.environ.get("NEO4J_DATABASE", "neo4j"),
+}
+
+MONGODB_CONFIG = {
+    "uri": os.environ.get("MONGODB_URI", "mongodb://mongo:27017/"),
+    "database": os.environ.get("MONGODB_DATABASE", "university"),
+}
+
+ELASTICSEARCH_CONFIG = {
+    "hosts": os.environ.get("ELASTICSEARCH_HOSTS", "http://elasticsearch:9200").split(","),
+}
+
+# Сколько ждать готовности баз, секунды (0 – без ограничения)
+BACKEND_WAIT_TIMEOUT = float(os.environ.get("BACKEND_WAIT_TIMEOUT", "300"))
+# Задержка перед повторной проверкой: начальная и предельная, секунды
+BACKEND_RETRY_INITIAL = float(os.environ.get("BACKEND_RETRY_INITIAL", "0.5"))
+BACKEND_RETRY_MAX = float(os.environ.get("BACKEND_RETRY_MAX", "5"))
+# Таймаут одной попытки подключения, секунды
+BACKEND_PROBE_TIMEOUT = int(os.environ.get("BACKEND_PROBE_TIMEOUT", "5"))
+# Размер пула соединений PostgreSQL (скрипт может увеличить его до первого обращения к пулу;
+# ThreadedConnectionPool не ждёт свободного соединения, а сразу выдаёт ошибку)
+POSTGRES_POOL_SIZE = int(os.environ.get("POSTGRES_POOL_SIZE", "4"))
+
+##########################################################################
+# Проверка готовности
+##########################################################################
+
+def _probe_postgres():
+    conn = lazy_import("psycopg2").connect(connect_timeout=BACKEND_PROBE_TIMEOUT, **POSTGRES_CONFIG)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1;")
+    finally:
+        conn.close()
+
+def _probe_redis():
+    client = lazy_import("redis").Redis(socket_connect_timeout=BACKEND_PROBE_TIMEOUT,
+                                          socket_timeout=BACKEND_PROBE_TIMEOUT, **REDIS_CONFIG)
+    try:
+        client.ping()
+    finally:
+        client.close()
+
+def _probe_neo4j():
+    driver = lazy_import("neo4j").GraphDatabase.driver(NEO4J_CONFIG["uri"], auth=NEO4J_CONFIG["auth"],
+                                                          connection_timeout=BACKEND_PROBE_TIMEOUT)
+    try:
+        driver.verify_connectivity()
+    finally:
+        driver.close()
+
+def _probe_mongodb():
+    client = lazy_import("pymongo").MongoClient(MONGODB_CONFIG["uri"],
+                                                  serverSelectionTimeoutMS=BACKEND_PROBE_TIMEOUT * 1000)
+    try:
+        client.admin.command("ping")
+    finally:
+        client.close()
+
+def _probe_elasticsearch():
+    es = lazy_import("elasticsearch").Elasticsearch(ELASTICSEARCH_CONFIG["hosts"], timeout=BACKEND_PROBE_TIMEOUT)
+    try:
+        # Узел отвечает раньше, чем кластер готов принимать запись
+        status = es.cluster.health()["status"]
+        if status not in ("yellow", "green"):
+            raise ConnectionError(f"состояние кластера {status}")
+    finally:
+        es.close()
+
+PROBES = {
+    "postgres": _probe_postgres,
+    "redis": _probe_redis,
+    "neo4j": _probe_neo4j,
+    "mongodb": _probe_mongodb,
+    "elasticsearch": _probe_elasticsearch,
+}
+
+def probe_backend(name, deadline=None, initial_delay=BACKEND_RETRY_INITIAL, max_delay=BACKEND_RETRY_MAX):
+    """
+    Повторяет проверку базы до успеха или до deadline (по time.perf_counter()),
+    удваивая задержку между попытками до max_delay.
+    """
+    started_at = time.time()
+    started = time.perf_counter()
+    attempts = 0
+    delay = initial_delay
+    while True:
+        attempts += 1
+        try:
+            PROBES[name]()
+            last_error = None
+            break
+        except Exception as e:
+            last_error = str(e).strip() or type(e).__name__
+        if deadline is not None and time.perf_counter() + delay > deadline:
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, max_delay)
+    return {
+        "ready": last_error is None,
+        "latency_s": round(time.perf_counter() - started, 3),
+        "attempts": attempts,
+        "error": last_error,
+        "started_at": started_at,
+        "finished_at": time.time(),
+    }
+
+def wait_for_backends(names=None, timeout=BACKEND_WAIT_TIMEOUT):
+    """
+    Проверяет базы names (по умолчанию все из PROBES) одновременно.
+    Возвращает словарь: имя -> результат probe_backend.
+    """
+    names = list(names or PROBES)
+    unknown = [name for name in names if name not in PROBES]
+    if unknown:
+        raise ValueError(f"Неизвестные базы: {', '.join(unknown)}. Доступны: {', '.join(PROBES)}")
+    deadline = time.perf_counter() + timeout if timeout else None
+    with ThreadPoolExecutor(max_workers=len(names), thread_name_prefix="probe") as pool:
+        futures = {name: pool.submit(probe_backend, name, deadline) for name in names}
+        return {name: future.result() for name, future in futures.items()}
+
+def describe_readiness(name, result):
+    """Строка отчёта о готовности базы."""
+    if result["ready"]:
+        return f"{name}: готов за {result['latency_s']:.2f} с (попыток: {result['attempts']})"
+    return (f"{name}: НЕ ГОТОВ за {result['latency_s']:.2f} с (попыток: {result['attempts']}): "
+            f"{result['error']}")
+
+##########################################################################
+# Переиспользуемые клиенты
+##########################################################################
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def _client(name, factory):
+    with _clients_lock:
+        if name not in _clients:
+            _clients[name] = factory()
+        return _clients[name]
+
+def postgres_pool():
+    """Пул соединений PostgreSQL (ThreadedConnectionPool на POSTGRES_POOL_SIZE соединений)."""
+    return _client("postgres", lambda: lazy_import("psycopg2.pool").ThreadedConnectionPool(
+        1, POSTGRES_POOL_SIZE, **POSTGRES_CONFIG))
+
+def acquire_postgres_connection(autocommit=False):
+    """Соединение из пула для долгого использования; вернуть – release_postgres_connection()."""
+    conn = postgres_pool().getconn()
+    conn.autocommit = autocommit
+    return conn
+
+def release_postgres_connection(conn):
+    """Возвращает соединение в пул; незавершённая транзакция откатывается пулом."""
+    postgres_pool().putconn(conn)
+
+@contextmanager
+def postgres_connection(autocommit=False):
+    """Соединение из пула; возвращается в пул при выходе из блока."""
+    conn = acquire_postgres_connection(autocommit)
+    try:
+        yield conn
+    finally:
+        release_postgres_connection(conn)
+
+def redis_client():
+    def create():
+        redis = lazy_import("redis")
+        return redis.Redis(connection_pool=redis.ConnectionPool(decode_responses=True, **REDIS_CONFIG))
+    return _client("redis", create)
+
+def neo4j_driver():
+    return _client("neo4j", lambda: lazy_import("neo4j").GraphDatabase.driver(
+        NEO4J_CONFIG["uri"], auth=NEO4J_CONFIG["auth"]))
+
+def mongodb_client():
+    return _client("mongodb", lambda: lazy_import("pymongo").MongoClient(MONGODB_CONFIG["uri"]))
+
+def mongodb_database():
+    return mongodb_client()[MONGODB_CONFIG["database"]]
+
+def elasticsearch_client():
+    return _client("elasticsearch", lambda: lazy_import("elasticsearch").Elasticsearch(
+        ELASTICSEARCH_CONFIG["hosts"]))
+
+def close_clients():
+    """Закрывает созданные клиенты и пулы."""
+    with _clients_lock:
+        clients = dict(_clients)
+        _clients.clear()
+    for name, client in clients.items():
+        try:
+            if name == "postgres":
+                client.closeall()
+            else:
+                client.close()
+        except Exception as e:
+            print(f"Ошибка при закрытии клиента {name}: {e}", file=sys.stderr)
+
+##########################################################################
+# Ожидание баз при старте контейнера
+##########################################################################
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ожидание готовности баз стенда")
+    parser.add_argument("backends", nargs="*", help=f"базы: {', '.join(PROBES)} (по умолчанию все)")
+    parser.add_argument("--timeout", type=float, default=BACKEND_WAIT_TIMEOUT,
+                        help="сколько ждать, секунды (0 – без ограничения)")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    unknown = [name for name in args.backends if name not in PROBES]
+    if unknown:
+        sys.exit(f"Неизвестные базы: {', '.join(unknown)}. Доступны: {', '.join(PROBES)}")
+    print("Проверка готовности баз данных...")
+    started = time.perf_counter()
+    results = wait_for_backends(args.backends, args.timeout)
+    for name, result in results.items():
+        print(f"  {describe_readiness(name, result)}")
+    print(f"Ожидание заняло {time.perf_counter() - started:.2f} с")
+    sys.exit(0 if all(result["ready"] for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
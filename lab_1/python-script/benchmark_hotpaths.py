@@ -0,0 +1,150 @@
+"""
+Микробенчмарки горячих функций generate_data.py (без обращения к базам данных).
+
+Каждый бенчмарк выполняется несколькими сериями через timeit; в отчёт попадают
+медиана, минимум и медианное абсолютное отклонение времени одного вызова.
+Медиана серий устойчива к единичным выбросам планировщика и GC.
+
+Примеры:
+    python benchmark_hotpaths.py --save-baseline hotpaths_baseline.json
+    python benchmark_hotpaths.py --baseline hotpaths_baseline.json --max-regression 2.0
+
+При --baseline скрипт завершается с кодом 1, если медиана какого-либо бенчмарка
+выросла больше чем в --max-regression раз. Бенчмарк cur.mogrify требует
+подключения к PostgreSQL (--dsn), без него он пропускается.
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import timeit
+
+import generate_data as gd
+
+BATCH_ROWS = 1000
+
+
+def _prepare_inputs(seed):
+    gd.seed_generators(seed)
+    names = [gd.fake.name() for _ in range(1000)]
+    schedule_time = datetime.datetime(2023, 10, 11, 14, 0, 0)
+    week_start = gd.week_start_of(schedule_time)
+    rows = [gd.make_attendance_row(schedule_time, week_start, f"S{i:06d}", i) for i in range(BATCH_ROWS)]
+    lectures = [(f"{random.choice(gd.LECTURE_TOPICS)} ({course})", course)
+                for course in gd.COURSES for _ in range(5)]
+    return names, schedule_time, week_start, rows, lectures
+
+
+def build_benchmarks(seed, dsn=None):
+    """Возвращает словарь: имя -> (функция без аргументов, число операций за вызов)."""
+    names, schedule_time, week_start, rows, lectures = _prepare_inputs(seed)
+    state = {"i": 0}
+
+    def next_name():
+        state["i"] = (state["i"] + 1) % len(names)
+        return names[state["i"]]
+
+    benchmarks = {
+        "student_name": (gd.fake.name, 1),
+        "student_email": (lambda: gd.make_student_email(next_name(), 2021), 1),
+        "transliterate": (lambda: gd.transliterate(next_name()), 1),
+        "week_start_of": (lambda: gd.week_start_of(schedule_time), 1),
+        "attendance_row": (lambda: gd.make_attendance_row(schedule_time, week_start, "S1500012", 1), 1),
+        "lecture_description": (lambda: [gd.lecture_description(n, c) for n, c in lectures], len(lectures)),
+        "encode_copy_text": (lambda: "".join(gd.format_copy_row(r) for r in rows), len(rows)),
+    }
+
+    if dsn:
+        import psycopg2
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        placeholders = "(" + ", ".join(["%s"] * len(gd.ATTENDANCE_COLUMNS)) + ")"
+        benchmarks["encode_mogrify"] = (
+            lambda: ",".join(cur.mogrify(placeholders, r).decode("utf-8") for r in rows), len(rows))
+        benchmarks["encode_mogrify_bytes"] = (
+            lambda: b",".join(cur.mogrify(placeholders, r) for r in rows), len(rows))
+    return benchmarks
+
+
+def measure(func, ops_per_call, repeat, min_time):
+    timer = timeit.Timer(func)
+    # Подбираем число вызовов так, чтобы одна серия длилась не меньше min_time
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    timer.timeit(number)  # прогрев
+    samples = [t / (number * ops_per_call) for t in timer.repeat(repeat=repeat, number=number)]
+    median = statistics.median(samples)
+    return {
+        "median_ns": median * 1e9,
+        "min_ns": min(samples) * 1e9,
+        "mad_ns": statistics.median(abs(x - median) for x in samples) * 1e9,
+        "repeat": repeat,
+        "number": number,
+    }
+
+
+def compare(results, baseline, max_regression):
+    failures = []
+    for name, res in results.items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        ratio = res["median_ns"] / base["median_ns"]
+        res["ratio_to_baseline"] = round(ratio, 3)
+        if ratio > max_regression:
+            failures.append((name, ratio))
+    return failures
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Микробенчмарки горячих функций генератора")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-time", type=float, default=0.2, help="минимальная длительность серии, с")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--only", default="", help="список бенчмарков через запятую")
+    parser.add_argument("--dsn", default=None, help="DSN PostgreSQL для бенчмарков cur.mogrify")
+    parser.add_argument("--output", default=None, help="сохранить результаты в JSON")
+    parser.add_argument("--save-baseline", default=None, help="сохранить результаты как базовые")
+    parser.add_argument("--baseline", default=None, help="сравнить с базовыми результатами")
+    parser.add_argument("--max-regression", type=float, default=2.0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    benchmarks = build_benchmarks(args.seed, args.dsn)
+    selected = [n for n in args.only.split(",") if n] or list(benchmarks)
+
+    results = {}
+    for name in selected:
+        if name not in benchmarks:
+            sys.exit(f"Неизвестный бенчмарк: {name}. Доступны: {', '.join(benchmarks)}")
+        func, ops = benchmarks[name]
+        results[name] = measure(func, ops, args.repeat, args.min_time)
+        res = results[name]
+        print(f"{name:<22} {res['median_ns']:>12.1f} нс/оп  (min {res['min_ns']:.1f}, MAD {res['mad_ns']:.1f})")
+
+    report = {"python": platform.python_version(), "seed": args.seed, "results": results}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = compare(results, baseline, args.max_regression)
+        for name, ratio in failures:
+            print(f"РЕГРЕССИЯ: {name} медленнее базового в {ratio:.2f} раза (порог {args.max_regression})")
+        exit_code = 1 if failures else 0
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
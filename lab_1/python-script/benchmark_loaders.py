@@ -0,0 +1,289 @@
+"""
+Сравнение способов загрузки PostgreSQL на одном и том же наборе данных.
+
+Каждая комбинация (стратегия, масштаб, повтор) запускается в отдельном процессе
+против одноразовой базы на локальном PostgreSQL: создаётся схема, выполняются
+populate_postgres и build_postgres_indexes. Для каждого запуска фиксируются
+число строк, время, строки в секунду и пиковый RSS процесса, а также размеры
+attendance (данные, все индексы, idx_attendance_student) и время отчётного запроса.
+Профили attendance (--layouts) позволяют сравнить время отчётного запроса до и после
+покрывающего индекса, BRIN и сортировки партиций. Результаты сохраняются в JSON.
+
+Пример:
+    python benchmark_loaders.py --port 5432 --scales s,m --repeat 3 --output bench.json
+    python benchmark_loaders.py --strategies staged_copy --student-keys text,int --scales m
+    python benchmark_loaders.py --strategies staged_copy --layouts default,report --scales m
+
+Не запускайте против рабочей базы: скрипт пересоздаёт базу --bench-db.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import psycopg2
+from psycopg2 import sql
+
+# Стратегии загрузки: (способ записи строк, режим загрузки посещаемости)
+STRATEGIES = {
+    "values": ("values", "direct"),
+    "execute_values": ("execute_values", "direct"),
+    "copy": ("copy", "direct"),
+    "staged_values": ("values", "staged"),
+    "staged_copy": ("copy", "staged"),
+}
+
+# Масштабы: переопределения generate_data.GENERATION_PARAMS
+SCALES = {
+    "xs": {"num_universities": 1, "groups_per_department": 1, "students_per_group": 10},
+    "s": {},
+    "m": {"groups_per_department": 10, "students_per_group": 40},
+    "l": {"num_universities": 5, "groups_per_department": 15, "students_per_group": 40},
+}
+
+COUNTED_TABLES = [
+    "university", "institute", "department", "groups",
+    "student", "course", "lecture", "schedule", "attendance"
+]
+
+BENCH_SLOT = "loader_bench_slot"
+
+# Профили физической организации attendance (generate_data.ATTENDANCE_LAYOUT)
+LAYOUTS = ("default", "report")
+
+# Отчётный запрос backend (ReportService): посещения выбранных студентов за период.
+# При целочисленном ключе номер студента берётся соединением со student.
+REPORT_QUERIES = {
+    "text": """
+        SELECT a.id_student, COUNT(*) FILTER (WHERE a.status)
+        FROM attendance a
+        JOIN schedule s ON s.id = a.id_schedule
+        WHERE s.timestamp BETWEEN %s AND %s AND a.id_student = ANY(%s)
+        GROUP BY a.id_student;
+    """,
+    "int": """
+        SELECT st.student_number, COUNT(*) FILTER (WHERE a.status)
+        FROM attendance a
+        JOIN schedule s ON s.id = a.id_schedule
+        JOIN student st ON st.id = a.id_student
+        WHERE s.timestamp BETWEEN %s AND %s AND st.student_number = ANY(%s)
+        GROUP BY st.student_number;
+    """,
+}
+REPORT_STUDENTS = 200
+REPORT_RUNS = 20
+
+
+def _admin_connect(args):
+    conn = psycopg2.connect(host=args.host, port=args.port, user=args.user,
+                            password=args.password, dbname=args.admin_db)
+    conn.autocommit = True
+    return conn
+
+
+def recreate_database(args):
+    conn = _admin_connect(args)
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots WHERE slot_name = %s;",
+                    (BENCH_SLOT,))
+        cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(args.bench_db)))
+        cur.execute(sql.SQL("CREATE DATABASE {};").format(sql.Identifier(args.bench_db)))
+    conn.close()
+
+
+def drop_database(args):
+    conn = _admin_connect(args)
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots WHERE slot_name = %s;",
+                    (BENCH_SLOT,))
+        cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(args.bench_db)))
+    conn.close()
+
+
+def attendance_sizes(cur):
+    """Размеры партиций attendance в байтах: данные, все индексы и idx_attendance_student."""
+    cur.execute("""
+        SELECT COALESCE(SUM(pg_table_size(inhrelid)), 0), COALESCE(SUM(pg_indexes_size(inhrelid)), 0)
+        FROM pg_inherits
+        WHERE inhparent = 'attendance'::regclass;
+    """)
+    heap_bytes, index_bytes = cur.fetchone()
+    cur.execute("""
+        SELECT COALESCE(SUM(pg_relation_size(inhrelid)), 0)
+        FROM pg_inherits
+        WHERE inhparent = 'idx_attendance_student'::regclass;
+    """)
+    return {
+        "attendance_heap_bytes": int(heap_bytes),
+        "attendance_index_bytes": int(index_bytes),
+        "idx_attendance_student_bytes": int(cur.fetchone()[0]),
+    }
+
+
+def time_report_query(cur, student_key):
+    """Медиана времени отчётного запроса по REPORT_STUDENTS студентам, миллисекунды."""
+    cur.execute("SELECT student_number FROM student ORDER BY student_number LIMIT %s;", (REPORT_STUDENTS,))
+    students = [row[0] for row in cur.fetchall()]
+    cur.execute("SELECT MIN(timestamp), MAX(timestamp) FROM schedule;")
+    period_start, period_end = cur.fetchone()
+    query_args = (period_start, period_end, students)
+
+    cur.execute(REPORT_QUERIES[student_key], query_args)  # прогрев кэша
+    samples = []
+    for _ in range(REPORT_RUNS):
+        started = time.perf_counter()
+        cur.execute(REPORT_QUERIES[student_key], query_args)
+        cur.fetchall()
+        samples.append(time.perf_counter() - started)
+    return round(statistics.median(samples) * 1000, 3)
+
+
+def run_single(conn_params, strategy, scale, seed, student_key="text", layout="default"):
+    """Выполняется в дочернем процессе, чтобы пиковый RSS относился только к этому запуску."""
+    sys.stdout = open(os.devnull, "w")
+
+    import generate_data as gd
+
+    row_writer, ingest_mode = STRATEGIES[strategy]
+    gd.PG_CONN_PARAMS.update(conn_params)  # общий словарь с пулом backends
+    gd.REPLICATION_SLOT = BENCH_SLOT
+    gd.ROW_WRITER = row_writer
+    gd.ATTENDANCE_INGEST_MODE = ingest_mode
+    gd.STUDENT_KEY_MODE = student_key
+    gd.ATTENDANCE_LAYOUT = layout
+    params = dict(gd.GENERATION_PARAMS, **SCALES[scale])
+    gd.seed_generators(seed)
+
+    conn = psycopg2.connect(**conn_params)
+    started = time.perf_counter()
+    gd.create_postgres_schema(conn)
+    schema_done = time.perf_counter()
+    gd.populate_postgres(conn, params)
+    populate_done = time.perf_counter()
+    gd.build_postgres_indexes(conn)
+    finished = time.perf_counter()
+
+    counts = {}
+    with conn.cursor() as cur:
+        for table in COUNTED_TABLES:
+            cur.execute(sql.SQL("SELECT COUNT(*) FROM {};").format(sql.Identifier(table)))
+            counts[table] = cur.fetchone()[0]
+        sizes = attendance_sizes(cur)
+        report_ms = time_report_query(cur, student_key)
+    conn.close()
+
+    rows = sum(counts.values())
+    populate_s = populate_done - schema_done
+    return {
+        "strategy": strategy,
+        "row_writer": row_writer,
+        "ingest_mode": ingest_mode,
+        "student_key": student_key,
+        "layout": layout,
+        "scale": scale,
+        "params": params,
+        "seed": seed,
+        "rows": rows,
+        "table_rows": counts,
+        "schema_s": round(schema_done - started, 4),
+        "populate_s": round(populate_s, 4),
+        "post_load_s": round(finished - populate_done, 4),
+        "wall_s": round(finished - started, 4),
+        "rows_per_s": round(rows / populate_s, 1) if populate_s > 0 else None,
+        # ru_maxrss в Linux измеряется в килобайтах
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "report_query_ms": report_ms,
+        **sizes,
+    }
+
+
+def server_version(args):
+    conn = _admin_connect(args)
+    with conn.cursor() as cur:
+        cur.execute("SHOW server_version;")
+        version = cur.fetchone()[0]
+    conn.close()
+    return version
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарк стратегий загрузки PostgreSQL")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--admin-db", default="postgres", help="база для CREATE/DROP DATABASE")
+    parser.add_argument("--bench-db", default="loader_bench", help="одноразовая база для запусков")
+    parser.add_argument("--strategies", default=",".join(STRATEGIES))
+    parser.add_argument("--scales", default="xs,s")
+    parser.add_argument("--student-keys", default="text", help="варианты ключа студента: text,int")
+    parser.add_argument("--layouts", default="default", help="профили attendance: default,report")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="loader_benchmark.json")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    strategies = [s for s in args.strategies.split(",") if s]
+    scales = [s for s in args.scales.split(",") if s]
+    student_keys = [k for k in args.student_keys.split(",") if k]
+    layouts = [l for l in args.layouts.split(",") if l]
+    for name in strategies:
+        if name not in STRATEGIES:
+            sys.exit(f"Неизвестная стратегия: {name}. Доступны: {', '.join(STRATEGIES)}")
+    for name in scales:
+        if name not in SCALES:
+            sys.exit(f"Неизвестный масштаб: {name}. Доступны: {', '.join(SCALES)}")
+    for name in student_keys:
+        if name not in REPORT_QUERIES:
+            sys.exit(f"Неизвестный вариант ключа студента: {name}. Доступны: {', '.join(REPORT_QUERIES)}")
+    for name in layouts:
+        if name not in LAYOUTS:
+            sys.exit(f"Неизвестный профиль attendance: {name}. Доступны: {', '.join(LAYOUTS)}")
+
+    conn_params = {"host": args.host, "port": args.port, "user": args.user,
+                   "password": args.password, "dbname": args.bench_db}
+    results = []
+    try:
+        for scale in scales:
+            for strategy in strategies:
+                for student_key in student_keys:
+                    for layout in layouts:
+                        for attempt in range(args.repeat):
+                            recreate_database(args)
+                            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                                result = pool.submit(run_single, conn_params, strategy, scale, args.seed,
+                                                     student_key, layout).result()
+                            result["attempt"] = attempt
+                            results.append(result)
+                            print(f"{scale:>3} {strategy:<15} {student_key:<4} {layout:<7} #{attempt}: "
+                                  f"{result['rows']:>9} строк, "
+                                  f"{result['populate_s']:>8.2f} с, {result['rows_per_s']:>10} строк/с, "
+                                  f"RSS {result['peak_rss_kb'] // 1024} МБ, "
+                                  f"attendance {result['attendance_heap_bytes'] // 1024} КБ + "
+                                  f"индексы {result['attendance_index_bytes'] // 1024} КБ, "
+                                  f"отчёт {result['report_query_ms']} мс")
+    finally:
+        drop_database(args)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "postgres": server_version(args),
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    main()
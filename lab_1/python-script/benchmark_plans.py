@@ -0,0 +1,259 @@
+"""
+Регрессии планов отчётного запроса на сгенерированных наборах данных.
+
+Для каждого масштаба одноразовая база (как в benchmark_loaders.py) заполняется
+populate_postgres и build_postgres_indexes, после чего запрос посещаемости в форме
+ReportService (attendance ⨝ schedule с фильтром по лекциям, периоду и номерам
+студентов) выполняется через EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON). Сохраняются
+нормализованный план (типы узлов, таблицы, индексы – без стоимостей и времени),
+просканированные партиции attendance, медиана времени выполнения и буферы.
+
+Примеры:
+    python benchmark_plans.py --scales s,m --save-baseline plans_baseline.json
+    python benchmark_plans.py --scales s,m --baseline plans_baseline.json --max-regression 1.5
+    ATTENDANCE_LAYOUT=report python benchmark_plans.py --baseline plans_baseline.json
+
+При --baseline отмечаются изменение плана, потеря отсечения партиций (просканировано
+больше партиций attendance, чем в базовом запуске) и рост медианы времени больше чем
+в --max-regression раз; при любой отметке скрипт завершается с кодом 1.
+
+Не запускайте против рабочей базы: скрипт пересоздаёт базу --bench-db.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import psycopg2
+from psycopg2 import sql
+
+from benchmark_loaders import SCALES, BENCH_SLOT, recreate_database, drop_database, server_version
+
+# Формы отчётного запроса:
+#   "report"        – как в ReportService: период задан только по schedule.timestamp;
+#   "report_pruned" – с тем же периодом по attendance.week_start, что позволяет
+#                     планировщику отсечь партиции attendance.
+QUERY_SHAPES = {
+    "report": """
+        SELECT a.id_student, COUNT(*) FILTER (WHERE a.status)
+        FROM attendance a
+        JOIN schedule s ON s.id = a.id_schedule
+        WHERE s.id_lecture = ANY(%(lectures)s)
+          AND s.timestamp BETWEEN %(start)s AND %(end)s
+          AND a.id_student = ANY(%(students)s)
+        GROUP BY a.id_student
+    """,
+    "report_pruned": """
+        SELECT a.id_student, COUNT(*) FILTER (WHERE a.status)
+        FROM attendance a
+        JOIN schedule s ON s.id = a.id_schedule
+        WHERE s.id_lecture = ANY(%(lectures)s)
+          AND s.timestamp BETWEEN %(start)s AND %(end)s
+          AND a.week_start BETWEEN DATE_TRUNC('week', %(start)s::TIMESTAMP)::DATE AND %(end)s::DATE
+          AND a.id_student = ANY(%(students)s)
+        GROUP BY a.id_student
+    """,
+}
+
+# Период отчёта: один месяц семестра
+REPORT_PERIOD = ("2023-10-01 00:00:00", "2023-10-31 23:59:59")
+
+# Атрибуты узла плана, которые входят в нормализованный план
+PLAN_ATTRIBUTES = ("Relation Name", "Index Name", "Join Type", "Strategy", "Parent Relationship",
+                   "Scan Direction")
+
+
+def report_parameters(cur, key_column):
+    """
+    Параметры запроса: лекции первого курса, месяц семестра и студенты групп с этими
+    лекциями (key_column – колонка student, на которую ссылается attendance.id_student).
+    """
+    cur.execute("SELECT id FROM lecture WHERE id_course = (SELECT MIN(id) FROM course) ORDER BY id;")
+    lectures = [row[0] for row in cur.fetchall()]
+    cur.execute(sql.SQL("""
+        SELECT DISTINCT st.{key}
+        FROM student st
+        JOIN schedule s ON s.id_group = st.id_group
+        WHERE s.id_lecture = ANY(%s)
+        ORDER BY st.{key};
+    """).format(key=sql.Identifier(key_column)), (lectures,))
+    students = [row[0] for row in cur.fetchall()]
+    return {"lectures": lectures, "start": REPORT_PERIOD[0], "end": REPORT_PERIOD[1], "students": students}
+
+
+def normalize_plan(node, depth=0, lines=None):
+    """Дерево плана в виде строк 'узел (атрибуты)' с отступами, без стоимостей, строк и времени."""
+    lines = [] if lines is None else lines
+    attributes = ", ".join(f"{name}={node[name]}" for name in PLAN_ATTRIBUTES if name in node)
+    lines.append("  " * depth + node["Node Type"] + (f" ({attributes})" if attributes else ""))
+    for child in node.get("Plans", []):
+        normalize_plan(child, depth + 1, lines)
+    return lines
+
+
+def scanned_partitions(node):
+    """Партиции attendance, которые план читает (с учётом отсечённых при выполнении)."""
+    partitions = set()
+    name = node.get("Relation Name", "")
+    if name.startswith("attendance_") and node.get("Actual Loops") != 0:
+        partitions.add(name)
+    for child in node.get("Plans", []):
+        partitions |= scanned_partitions(child)
+    return partitions
+
+
+def explain_query(cur, shape, params, runs):
+    query = QUERY_SHAPES[shape]
+    cur.execute(query, params)  # прогрев кэша
+    cur.fetchall()
+    samples, planning = [], []
+    plan = None
+    for _ in range(runs):
+        cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + query, params)
+        plan = cur.fetchone()[0][0]
+        samples.append(plan["Execution Time"])
+        planning.append(plan["Planning Time"])
+    root = plan["Plan"]
+    return {
+        "plan": normalize_plan(root),
+        "partitions": sorted(scanned_partitions(root)),
+        "execution_ms": round(statistics.median(samples), 3),
+        "planning_ms": round(statistics.median(planning), 3),
+        "shared_hit_blocks": root.get("Shared Hit Blocks", 0),
+        "shared_read_blocks": root.get("Shared Read Blocks", 0),
+        "rows": root.get("Actual Rows", 0),
+    }
+
+
+def run_scale(conn_params, scale, seed, runs):
+    """Выполняется в дочернем процессе: генерация набора данных и планы всех форм запроса."""
+    sys.stdout = open(os.devnull, "w")
+
+    import generate_data as gd
+
+    gd.PG_CONN_PARAMS.update(conn_params)  # общий словарь с пулом backends
+    gd.REPLICATION_SLOT = BENCH_SLOT
+    params = dict(gd.GENERATION_PARAMS, **SCALES[scale])
+    gd.seed_generators(seed)
+
+    conn = psycopg2.connect(**conn_params)
+    gd.create_postgres_schema(conn)
+    gd.populate_postgres(conn, params)
+    gd.build_postgres_indexes(conn)
+
+    with conn.cursor() as cur:
+        query_params = report_parameters(cur, gd.student_key_column())
+        shapes = {shape: explain_query(cur, shape, query_params, runs) for shape in QUERY_SHAPES}
+    conn.close()
+    return {
+        "scale": scale,
+        "params": params,
+        "layout": gd.ATTENDANCE_LAYOUT,
+        "student_key": gd.STUDENT_KEY_MODE,
+        "lectures": len(query_params["lectures"]),
+        "students": len(query_params["students"]),
+        "shapes": shapes,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Отметки относительно базового запуска: (масштаб, форма запроса, описание)."""
+    flags = []
+    base_results = {r["scale"]: r for r in baseline.get("results", [])}
+    for result in results:
+        base = base_results.get(result["scale"])
+        if not base:
+            continue
+        for shape, current in result["shapes"].items():
+            previous = base["shapes"].get(shape)
+            if not previous:
+                continue
+            if current["plan"] != previous["plan"]:
+                flags.append((result["scale"], shape, "план изменился"))
+            if len(current["partitions"]) > len(previous["partitions"]):
+                flags.append((result["scale"], shape,
+                              f"потеряно отсечение партиций: {len(previous['partitions'])} -> "
+                              f"{len(current['partitions'])}"))
+            ratio = current["execution_ms"] / previous["execution_ms"] if previous["execution_ms"] else 1.0
+            current["ratio_to_baseline"] = round(ratio, 3)
+            if ratio > max_regression:
+                flags.append((result["scale"], shape,
+                              f"медленнее базового в {ratio:.2f} раза (порог {max_regression})"))
+    return flags
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Регрессии планов отчётного запроса")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=5432)
+    parser.add_argument("--user", default="admin")
+    parser.add_argument("--password", default="secret")
+    parser.add_argument("--admin-db", default="postgres", help="база для CREATE/DROP DATABASE")
+    parser.add_argument("--bench-db", default="plan_bench", help="одноразовая база для запусков")
+    parser.add_argument("--scales", default="xs,s")
+    parser.add_argument("--runs", type=int, default=5, help="повторов EXPLAIN ANALYZE на форму запроса")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="plan_benchmark.json")
+    parser.add_argument("--save-baseline", default=None, help="сохранить результаты как базовые")
+    parser.add_argument("--baseline", default=None, help="сравнить с базовыми результатами")
+    parser.add_argument("--max-regression", type=float, default=1.5)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    scales = [s for s in args.scales.split(",") if s]
+    for name in scales:
+        if name not in SCALES:
+            sys.exit(f"Неизвестный масштаб: {name}. Доступны: {', '.join(SCALES)}")
+
+    conn_params = {"host": args.host, "port": args.port, "user": args.user,
+                   "password": args.password, "dbname": args.bench_db}
+    results = []
+    try:
+        for scale in scales:
+            recreate_database(args)
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(run_scale, conn_params, scale, args.seed, args.runs).result()
+            results.append(result)
+            for shape, res in result["shapes"].items():
+                print(f"{scale:>3} {shape:<14} {res['execution_ms']:>10.3f} мс, "
+                      f"планирование {res['planning_ms']:.3f} мс, партиций {len(res['partitions'])}, "
+                      f"буферы {res['shared_hit_blocks']}+{res['shared_read_blocks']}")
+    finally:
+        drop_database(args)
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "postgres": server_version(args),
+        "seed": args.seed,
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        flags = compare(results, baseline, args.max_regression)
+        for scale, shape, message in flags:
+            print(f"РЕГРЕССИЯ: {scale} {shape}: {message}")
+        report["flags"] = [{"scale": s, "shape": q, "message": m} for s, q, m in flags]
+        exit_code = 1 if flags else 0
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
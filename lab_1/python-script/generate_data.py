@@ -1,39 +1,197 @@
+import os
+import io
+import argparse
+import json
+import hashlib
+import bisect
+import shutil
 import random
 import datetime
 import time
 import sys
-from tqdm import tqdm
+import resource
+import tracemalloc
+import threading
+import functools
+import cProfile
+import pstats
+from array import array
+from collections import Counter
+from itertools import islice
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
+# Общие параметры подключения, проверка готовности, клиенты баз стенда и отложенный импорт
+# (драйверы Neo4j и Elasticsearch, bcrypt и Faker загружаются только этапами, которые их используют)
+import backends
+from backends import lazy_import, IMPORT_TIMES
+
+_started = time.time()
 import psycopg2
 from psycopg2 import sql
-from faker import Faker
-
-from pymongo import MongoClient
-from neo4j import GraphDatabase
-import redis
-from elasticsearch import Elasticsearch
+from psycopg2.extras import execute_values
+IMPORT_TIMES.append(("psycopg2", _started, time.time()))
 
 # Импортируем наш визуализатор вместо стандартного логгера
-from terminal_visualizer import start_operation, update_progress, complete_operation, info, show_summary
+from terminal_visualizer import (start_operation, update_progress, complete_operation, info, error,
+                                 record_operation, add_operation_hooks, remove_operation_hooks, show_summary)
+
+def report_import_times():
+    """Выводит время импорта модулей и добавляет его в итоговую сводку."""
+    for name, started, finished in IMPORT_TIMES:
+        info(f"Импорт {name}: {(finished - started) * 1000:.0f} мс")
+        record_operation(f"Импорт {name}", started, finished)
+    IMPORT_TIMES.clear()
+
+class _LazyFaker:
+    """
+    Faker("ru_RU") создаётся при первом обращении к fake; после этого глобальное имя fake
+    указывает на сам экземпляр, и обращения к нему не проходят через заместитель.
+    """
 
-# Инициализация Faker (русская локализация)
-fake = Faker("ru_RU")
+    def __getattr__(self, attribute):
+        global fake
+        faker = lazy_import("faker")
+        if _faker_seed is not None:
+            faker.Faker.seed(_faker_seed)
+        fake = faker.Faker("ru_RU")
+        return getattr(fake, attribute)
+
+# Инициализация Faker (русская локализация) откладывается до первой генерации
+fake = _LazyFaker()
+# Зерно, которое применяется к Faker при его создании
+_faker_seed = None
 
 # Параметры подключения (согласно docker-compose)
-PG_CONN_PARAMS = {
-    "host": "postgres",
-    "port": 5432,  # проброшенный порт для PostgreSQL
-    "user": "admin",
-    "password": "secret",
-    "dbname": "mydb",
+# Параметры подключения общие с connector_test.py (см. backends.py); это тот же словарь,
+# поэтому переопределять его нужно через update(), чтобы изменения видел и пул соединений
+PG_CONN_PARAMS = backends.POSTGRES_CONFIG
+
+# Роль процесса при генерации несколькими контейнерами в одну базу:
+#   "single"      – вся генерация в одном процессе;
+#   "coordinator" – схема, университеты и институты, ожидание шардов и общий хвост
+#                   (спец-лекции, представления, публикация, слот, индексы, проверка);
+#   "shard"       – генерация кафедр шарда SHARD_INDEX из SHARD_COUNT.
+GENERATION_ROLE = os.environ.get("GENERATION_ROLE", "single")
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", "1"))
+SHARD_INDEX = int(os.environ.get("SHARD_INDEX", "0"))
+# Интервал опроса состояния шардов и предельное время ожидания, секунды
+SHARD_POLL_INTERVAL = float(os.environ.get("SHARD_POLL_INTERVAL", "5"))
+SHARD_WAIT_TIMEOUT = int(os.environ.get("SHARD_WAIT_TIMEOUT", "86400"))
+# Шард отмечает ход генерации внутри кафедры (не реже чем раз в десятую часть этого времени);
+# шард без отметки дольше этого времени (процесс завершён OOM или SIGKILL и не успел
+# записать 'failed') считается упавшим, секунды
+SHARD_HEARTBEAT_TIMEOUT = int(os.environ.get("SHARD_HEARTBEAT_TIMEOUT", "900"))
+# Начало процесса. Шард принимает только запуск, открытый координатором позже: таблицы
+# запуска в томе базы могут остаться от прошлого запуска, пока координатор не пересоздал схему
+PROCESS_STARTED_AT = datetime.datetime.now(datetime.timezone.utc)
+
+# Служебная база для CREATE/DROP DATABASE (операции со снимками наборов данных)
+PG_ADMIN_DB = os.environ.get("PG_ADMIN_DB", "postgres")
+
+# Снимки готовых наборов данных в шаблонных базах PostgreSQL:
+#   "off"   – не использовать;
+#   "save"  – после генерации сохранить базу как шаблон;
+#   "reuse" – восстановить базу из шаблона с тем же ключом (зерно + масштаб),
+#             а если его нет – сгенерировать и сохранить.
+# Как и кэш на диске, снимки используются только при заданном GENERATION_SEED.
+DATASET_TEMPLATE = os.environ.get("DATASET_TEMPLATE", "off")
+
+# Кэш сгенерированных наборов данных на локальном диске (только при заданном GENERATION_SEED)
+DATASET_CACHE = os.environ.get("DATASET_CACHE", "1") == "1"
+DATASET_CACHE_DIR = os.environ.get("DATASET_CACHE_DIR", ".dataset_cache")
+# Предельный объём кэша; при превышении удаляются давно не использованные записи
+DATASET_CACHE_MAX_MB = int(os.environ.get("DATASET_CACHE_MAX_MB", "2048"))
+# Версия логики генерации: увеличить при изменении populate_postgres, чтобы не брать старые записи
+DATASET_CACHE_VERSION = 1
+
+# Логический слот репликации, который читает Debezium (connectors/postgres.json)
+REPLICATION_SLOT = os.environ.get("REPLICATION_SLOT", "test_slot")
+
+# Отставание слота (МБ WAL), при котором запись приостанавливается, и уровень,
+# до которого оно должно снизиться для продолжения (0 – без ограничения)
+CDC_MAX_LAG_MB = int(os.environ.get("CDC_MAX_LAG_MB", "512"))
+CDC_RESUME_LAG_MB = int(os.environ.get("CDC_RESUME_LAG_MB", str(CDC_MAX_LAG_MB // 2)))
+# Интервал опроса pg_replication_slots, секунды
+CDC_POLL_INTERVAL = float(os.environ.get("CDC_POLL_INTERVAL", "2"))
+# Сколько ждать выгрузки слота в конце генерации, секунды (0 – не ждать)
+CDC_DRAIN_TIMEOUT = int(os.environ.get("CDC_DRAIN_TIMEOUT", "300"))
+# После скольких опросов подряд без подключённого к слоту клиента ожидание прекращается
+CDC_DRAIN_INACTIVE_POLLS = int(os.environ.get("CDC_DRAIN_INACTIVE_POLLS", "3"))
+# Остаточное отставание (КБ), при котором слот считается выгруженным
+CDC_DRAIN_TOLERANCE_KB = int(os.environ.get("CDC_DRAIN_TOLERANCE_KB", "64"))
+
+# Манифест загрузки: точные количества строк и контрольные суммы по таблицам
+LOAD_MANIFEST = os.environ.get("LOAD_MANIFEST", "1") == "1"
+MANIFEST_PATH = os.environ.get("MANIFEST_PATH", "load_manifest.json")
+# Полная проверка (COUNT(*) и контрольные суммы в SQL) вместо сравнения с оценками каталога
+VERIFY_FULL_SCAN = os.environ.get("VERIFY_FULL_SCAN", "0") == "1"
+# Допустимое относительное расхождение манифеста и оценки pg_class.reltuples
+VERIFY_ESTIMATE_TOLERANCE = float(os.environ.get("VERIFY_ESTIMATE_TOLERANCE", "0.1"))
+
+# Учётные записи users для нагрузочных тестов аутентификации (0 – не создавать)
+USERS_COUNT = int(os.environ.get("USERS_COUNT", "0"))
+# Стоимость bcrypt (логарифм числа раундов); хэши совместимы с BCryptPasswordEncoder
+USERS_BCRYPT_ROUNDS = int(os.environ.get("USERS_BCRYPT_ROUNDS", "10"))
+# Процессы для вычисления хэшей (bcrypt намеренно нагружает процессор)
+USERS_HASH_WORKERS = int(os.environ.get("USERS_HASH_WORKERS", str(os.cpu_count() or 1)))
+# Хэши при заданном GENERATION_SEED кэшируются между запусками (без паролей)
+USERS_CACHE_DIR = os.environ.get("USERS_CACHE_DIR", os.path.join(DATASET_CACHE_DIR, "users"))
+# Файл с логинами и паролями в открытом виде для нагрузочных тестов (пусто – не сохранять)
+USERS_CREDENTIALS_PATH = os.environ.get("USERS_CREDENTIALS_PATH", "")
+
+# Предварительная оценка запуска: объёмы, WAL, длительность и проверка ресурсов
+PREFLIGHT = os.environ.get("PREFLIGHT", "1") == "1"
+# Запускать генерацию, даже если оценка показала нехватку места или памяти
+PREFLIGHT_FORCE = os.environ.get("PREFLIGHT_FORCE", "0") == "1"
+# Замеры прошлых запусков, по которым строится оценка
+PREFLIGHT_HISTORY_PATH = os.environ.get("PREFLIGHT_HISTORY_PATH", "preflight_history.json")
+# Свободное место на томе PostgreSQL, МБ (если не задано – проверка места пропускается)
+PREFLIGHT_DB_FREE_MB = os.environ.get("PREFLIGHT_DB_FREE_MB")
+# Запас к оценкам места и памяти
+PREFLIGHT_MARGIN = float(os.environ.get("PREFLIGHT_MARGIN", "1.2"))
+
+# Сбор метрик PostgreSQL (WAL, pg_stat_statements, буферы, размеры) для каждого этапа
+STAGE_DB_METRICS = os.environ.get("STAGE_DB_METRICS", "1") == "1"
+# Сколько самых затратных запросов этапа показывать в сводке
+STAGE_TOP_STATEMENTS = int(os.environ.get("STAGE_TOP_STATEMENTS", "3"))
+# Пиковый RSS процесса генератора для каждого этапа
+STAGE_MEMORY_METRICS = os.environ.get("STAGE_MEMORY_METRICS", "1") == "1"
+# Места выделения памяти Python по этапам (tracemalloc заметно замедляет генерацию)
+STAGE_TRACEMALLOC = os.environ.get("STAGE_TRACEMALLOC", "0") == "1"
+# Сколько мест выделения памяти этапа показывать в сводке
+STAGE_TRACEMALLOC_TOP = int(os.environ.get("STAGE_TRACEMALLOC_TOP", "3"))
+# Отчёт о памяти по этапам в JSON (пустая строка – не сохранять)
+MEMORY_REPORT_PATH = os.environ.get("MEMORY_REPORT_PATH", "memory_report.json")
+
+# Профилирование этапов (--profile или PROFILE=1): pstats и collapsed-стеки по этапам
+PROFILE = os.environ.get("PROFILE", "0") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+# Интервал выборки стеков для collapsed-вывода, секунды
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", "0.005"))
+# Функции этапов, которые оборачиваются профилировщиком
+PROFILED_STAGES = ("create_postgres_schema", "populate_postgres", "populate_neo4j",
+                   "populate_elasticsearch", "update_postgres_ids")
+
+# Отношений Neo4j в одной транзакции записи (UNWIND $rows)
+NEO4J_RELATIONSHIP_BATCH = int(os.environ.get("NEO4J_RELATIONSHIP_BATCH", "5000"))
+# Индексы Neo4j, по которым отношения находят свои узлы
+NEO4J_INDEXES = (("Department", "id"), ("Lecture", "id"), ("Group", "id"), ("Student", "student_number"))
+
+
+# Параметры объёма генерируемых данных
+GENERATION_PARAMS = {
+    "num_universities": 3,
+    "institutes_per_univ": 4,
+    "departments_per_inst": 5,
+    "groups_per_department": 5,
+    "students_per_group": 30,
+    "courses_per_department": 5,
+    "lectures_per_course": 2,
 }
 
-MONGO_CONN_STRING = "mongodb://mongo:27017/"
-NEO4J_URI = "bolt://neo4j:7687"
-NEO4J_AUTH = None  # если NEO4J_AUTH=none
-REDIS_HOST = "redis"
-REDIS_PORT = 6379
-ES_HOSTS = ["http://elasticsearch:9200"]
+# Зерно генераторов случайных чисел; при одинаковом зерне набор данных воспроизводим
+GENERATION_SEED = os.environ.get("GENERATION_SEED")
 
 
 # Реальные названия университетов и институтов для более осмысленных данных
@@ -115,15 +273,203 @@ LECTURE_TOPICS = [
     "Аналитика и визуализация данных"
 ]
 
+# Первое занятие семестра
+SEMESTER_START = datetime.datetime(2023, 9, 4, 9, 0, 0)
+# Смещения недель (от начала семестра), по которым ставятся занятия каждой лекции у группы
+SCHEDULE_WEEK_OFFSETS = range(0, 15, 2)
+# Группа, которой добавляются спец-лекции с чужих кафедр, и число таких лекций
+SPECIAL_GROUP_ID = 15
+SPECIAL_LECTURES = 2
+
+# Помесячные партиции таблицы attendance: (имя, начало диапазона, конец диапазона)
+ATTENDANCE_PARTITIONS = [
+    ("attendance_2023_09", datetime.date(2023, 9, 1), datetime.date(2023, 10, 1)),
+    ("attendance_2023_10", datetime.date(2023, 10, 1), datetime.date(2023, 11, 1)),
+    ("attendance_2023_11", datetime.date(2023, 11, 1), datetime.date(2023, 12, 1)),
+    ("attendance_2023_12", datetime.date(2023, 12, 1), datetime.date(2024, 1, 1)),
+    ("attendance_2024_01", datetime.date(2024, 1, 1), datetime.date(2024, 2, 1)),
+]
+
+STUDENT_COLUMNS = ("student_number", "fullname", "email", "id_group", "redis_key")
+ATTENDANCE_COLUMNS = ("timestamp", "week_start", "id_student", "id_schedule", "status")
+# Посещаемость в битовых масках: одна строка на занятие, биты – в порядке списка группы
+GROUP_ROSTER_COLUMNS = ("id_group", "student_keys")
+ATTENDANCE_BITMAP_COLUMNS = ("id_schedule", "recorded", "present")
+# Сколько строк attendance_bitmap накапливается перед записью
+ATTENDANCE_BITMAP_BATCH = int(os.environ.get("ATTENDANCE_BITMAP_BATCH", "1000"))
+
+# Сводка посещаемости attendance_rollup: (студент, лекция, период) -> присутствий и занятий.
+# Период – неделя ("week", week_start) или месяц, в который попадает week_start ("month").
+# Занятия лекции у группы идут раз в две недели, поэтому недельная сводка не меньше attendance.
+ATTENDANCE_ROLLUP = os.environ.get("ATTENDANCE_ROLLUP", "1") == "1"
+ATTENDANCE_ROLLUP_GRAIN = os.environ.get("ATTENDANCE_ROLLUP_GRAIN", "month")
+# Сколько ключей сводки накапливается в памяти перед записью
+ATTENDANCE_ROLLUP_BATCH = int(os.environ.get("ATTENDANCE_ROLLUP_BATCH", "20000"))
+
+# Колонки, по которым считается контрольная сумма таблицы в манифесте
+# (суррогатные id и служебные колонки со значениями по умолчанию не входят)
+MANIFEST_COLUMNS = {
+    "university": ("name",),
+    "institute": ("name", "id_university"),
+    "department": ("name", "id_institute"),
+    "groups": ("name", "id_department", "formation_year"),
+    "student": STUDENT_COLUMNS,
+    "course": ("name", "id_department"),
+    "lecture": ("name", "duration_hours", "tech_equipment", "id_course"),
+    "schedule": ("id_lecture", "id_group", "timestamp", "location"),
+    "attendance": ATTENDANCE_COLUMNS,
+    "group_roster": GROUP_ROSTER_COLUMNS,
+    "attendance_bitmap": ATTENDANCE_BITMAP_COLUMNS,
+}
+
+# Способ загрузки посещаемости:
+#   "staged" – каждый месяц грузится в отдельную UNLOGGED-таблицу без индексов,
+#              затем строятся индексы, таблица переводится в LOGGED и подключается
+#              к attendance через ATTACH PARTITION;
+#   "direct" – вставка через партиционированную таблицу attendance.
+ATTENDANCE_INGEST_MODE = os.environ.get("ATTENDANCE_INGEST_MODE", "staged")
+
+# Ключ студента в таблице attendance:
+#   "text" – attendance.id_student ссылается на student.student_number (VARCHAR, как ждёт backend);
+#   "int"  – у student появляется суррогатный id SERIAL, attendance.id_student хранит INT,
+#            а представление attendance_by_student_number отдаёт номер студента для совместимости.
+STUDENT_KEY_MODE = os.environ.get("STUDENT_KEY_MODE", "text")
+
+# Способ записи пакета строк: "values" (многострочный INSERT через mogrify),
+# "execute_values" (psycopg2.extras.execute_values) или "copy" (COPY ... FROM STDIN)
+ROW_WRITER = os.environ.get("ROW_WRITER", "values")
+
+# Адаптивный подбор размера пакетов (0 – использовать начальные размеры без изменений)
+ADAPTIVE_BATCHING = os.environ.get("ADAPTIVE_BATCHING", "1") == "1"
+# Ограничение памяти на один пакет в мегабайтах
+BATCH_MEMORY_LIMIT_MB = int(os.environ.get("BATCH_MEMORY_LIMIT_MB", "64"))
+
+# Вторичные индексы, которые строятся после загрузки данных: (имя, таблица, колонки).
+# Для партиционированной attendance индексы строятся по каждой партиции и затем
+# подключаются к индексу родительской таблицы.
+POST_LOAD_INDEXES = [
+    ("idx_schedule_timestamp", "schedule", ("timestamp",)),
+    ("idx_attendance_student", "attendance", ("id_student",)),
+    ("idx_attendance_schedule", "attendance", ("id_schedule",)),
+]
+
+# Профиль физической организации attendance:
+#   "default" – только индексы POST_LOAD_INDEXES;
+#   "report"  – для отчётного запроса (посещения студентов по занятиям) дополнительно
+#               покрывающий индекс (id_student, id_schedule) INCLUDE (status) и BRIN по
+#               timestamp; при поэтапной загрузке партиции перед подключением переписываются
+#               в порядке ATTENDANCE_SORT_KEY, после загрузки attendance обрабатывается VACUUM,
+#               чтобы карта видимости позволяла index-only scan.
+ATTENDANCE_LAYOUT = os.environ.get("ATTENDANCE_LAYOUT", "default")
+# Индексы профиля "report": (имя, таблица, колонки, метод, INCLUDE-колонки)
+REPORT_LAYOUT_INDEXES = [
+    ("idx_attendance_report", "attendance", ("id_student", "id_schedule"), "btree", ("status",)),
+    ("idx_attendance_timestamp_brin", "attendance", ("timestamp",), "brin", ()),
+]
+# Порядок строк в партициях attendance при профиле "report"
+ATTENDANCE_SORT_KEY = ("timestamp", "id_schedule", "id_student")
+
+# Таблицы, для которых после загрузки собирается статистика
+ANALYZE_TABLES = [
+    "university", "institute", "department", "groups", "student",
+    "course", "lecture", "schedule", "attendance", "group_roster", "attendance_bitmap",
+    "attendance_rollup", "lecture_department", "student_view_table"
+]
+
+# Количество параллельных соединений для построения индексов и ANALYZE
+INDEX_BUILD_WORKERS = int(os.environ.get("INDEX_BUILD_WORKERS", "4"))
+# Пул соединений backends: потоки построения индексов, метрики этапов (StageDbMetrics),
+# контроль отставания слота (ReplicationBackpressure) и отметки шарда (ShardHeartbeat) одновременно
+backends.POSTGRES_POOL_SIZE = max(backends.POSTGRES_POOL_SIZE, INDEX_BUILD_WORKERS + 2)
+
+# Транслитерация для генерации email студентов
+TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
+    'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
+    'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
+    'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
+}
+
+# Тематические описания лекций по ключевым словам в названии лекции или курса
+LECTURE_DESCRIPTIONS = {
+    "Docker": "Docker - успешная технология контейнеризации, которая позволяет упаковывать приложения и их зависимости в изолированные контейнеры. Это делает их переносимыми и согласованными в любой среде. Контейнеры запускаются в изолированном пространстве, совместно используя ядро операционной системы.",
+    "Kubernetes": "Kubernetes - это платформа для управления контейнерными приложениями в масштабе. Она автоматизирует управление и развертывание, обеспечивает высокую доступность, масштабируемость и управление ресурсами.",
+    "CI/CD": "Continuous Integration и Continuous Delivery - это методологии разработки, которые обеспечивают автоматическую сборку, тестирование и доставку кода в рабочую среду, что позволяет команде разработчиков работать быстрее и качественнее.",
+    "Python": "Python - один из самых популярных языков программирования, известный своей простотой, читаемостью и обширной экосистемой библиотек. Широко используется в анализе данных, машинном обучении, веб-разработке и автоматизации.",
+    "DevOps": "DevOps - это набор практик, которые объединяют разработку программного обеспечения и IT-операции с целью сокращения жизненного цикла системы и обеспечения непрерывной поставки высококачественного программного обеспечения.",
+    "Database": "Базы данных - это организованные коллекции структурированных данных. Они обеспечивают эффективное хранение, поиск, обновление и управление информацией в приложениях и информационных системах.",
+    "Security": "Безопасность и защита данных - важнейший аспект современных информационных систем. Включает аутентификацию, авторизацию, шифрование, защиту от атак и уязвимостей, соответствие нормативным требованиям.",
+    "API": "API (интерфейс программирования приложений) определяет взаимодействие между программными компонентами. RESTful API строится на принципах REST и использует HTTP методы для CRUD операций над ресурсами.",
+    "Architecture": "Архитектура программного обеспечения - это высокоуровневая структура системы, определяющая ее компоненты, их взаимодействие и ограничения. Включает принципы проектирования, паттерны и стили архитектуры.",
+    "Algorithm": "Алгоритмы - это последовательности шагов для решения вычислительных задач. Правильный выбор алгоритма существенно влияет на эффективность программы, особенно при работе с большими объемами данных."
+}
+
+##########################################################################
+# Генерация отдельных значений (горячие функции, см. benchmark_hotpaths.py)
+##########################################################################
+
+def transliterate(text):
+    return ''.join(TRANSLIT.get(c, c) for c in text.lower())
+
+def make_student_email(fullname, formation_year):
+    """Формирует email вида <фамилия><первая буква имени><год рождения>@edu.mirea.ru."""
+    name_parts = fullname.split()
+    if len(name_parts) >= 2:
+        email_name_t = transliterate(name_parts[0])
+        email_surname_t = transliterate(name_parts[1])
+        birth_year = formation_year - random.randint(17, 22)
+        return f"{email_surname_t}{email_name_t[0]}{birth_year}@edu.mirea.ru"
+    return fake.email()
+
+def week_start_of(moment):
+    """Понедельник недели, в которую попадает moment (как DATE_TRUNC('week', ...))."""
+    return (moment - datetime.timedelta(days=moment.weekday())).date()
+
+def make_attendance_row(schedule_time, week_start, student_key, schedule_id):
+    attendance_probability = random.uniform(0.7, 0.9)
+    attendance_status = random.random() < attendance_probability
+    return (schedule_time, week_start, student_key, schedule_id, attendance_status)
+
+def student_key_column():
+    """Колонка student, на которую ссылается attendance.id_student (см. STUDENT_KEY_MODE)."""
+    return "id" if STUDENT_KEY_MODE == "int" else "student_number"
+
+def lecture_description(name, course_name):
+    """Подбирает описание лекции по ключевым словам, иначе формирует общее описание."""
+    description = ""
+    for keyword, template in LECTURE_DESCRIPTIONS.items():
+        if keyword in name or keyword in course_name:
+            description = template
+            break
+
+    # Если подходящего шаблона не найдено, используем общее описание с элементами из названия
+    if not description:
+        description = f"Лекция посвящена теме '{name}' в рамках курса '{course_name}'. "
+        description += "Рассматриваются основные концепции, методологии и практические аспекты применения. "
+        description += "Студенты получат теоретические знания и практические навыки в данной области."
+
+    # Если описание слишком длинное, обрезаем его
+    if len(description) > 200:
+        description = description[:197] + "..."
+    return description
+
 ##########################################################################
 # PostgreSQL: Создание схемы с партиционированием таблицы attendance
 ##########################################################################
 
-def create_postgres_schema(conn):
+def create_postgres_schema(conn, ingest_mode=None):
     operation = start_operation("Создание схемы PostgreSQL", 100)
+    ingest_mode = ingest_mode or ATTENDANCE_INGEST_MODE
     
     cur = conn.cursor()
     tables = [
+        "load_manifest",
+        "generation_shards",
+        "generation_run",
+        "attendance_rollup",
+        "attendance_bitmap",
+        "group_roster",
         "attendance",
         "schedule",
         "lecture",
@@ -184,6 +530,7 @@ def create_postgres_schema(conn):
     CREATE INDEX idx_groups_department ON groups(id_department);
 
     CREATE TABLE student (
+        {student_id_sql}
         student_number VARCHAR(100) PRIMARY KEY,
         fullname VARCHAR(200) NOT NULL,
         email VARCHAR(255),
@@ -221,20 +568,17 @@ def create_postgres_schema(conn):
         location VARCHAR(100),
         created_at TIMESTAMP DEFAULT NOW()
     );
-    CREATE INDEX idx_schedule_timestamp ON schedule(timestamp);
     CREATE INDEX idx_schedule_lecture_group ON schedule(id_lecture, id_group);
 
     CREATE TABLE attendance (
         id SERIAL,
         timestamp TIMESTAMP NOT NULL,
         week_start DATE NOT NULL,
-        id_student VARCHAR(100) NOT NULL REFERENCES student(student_number),
+        {attendance_student_sql},
         id_schedule INT NOT NULL REFERENCES schedule(id),
         status BOOLEAN NOT NULL DEFAULT TRUE,
         PRIMARY KEY (id, week_start)
     ) PARTITION BY RANGE (week_start);
-    CREATE INDEX idx_attendance_student ON attendance(id_student);
-    CREATE INDEX idx_attendance_schedule ON attendance(id_schedule);
 
     CREATE OR REPLACE FUNCTION set_week_start()
     RETURNS TRIGGER AS $$
@@ -248,24 +592,91 @@ def create_postgres_schema(conn):
     FOR EACH ROW
     EXECUTE FUNCTION set_week_start();
 
-    CREATE TABLE attendance_2023_09 PARTITION OF attendance
-        FOR VALUES FROM ('2023-09-01') TO ('2023-10-01');
-    CREATE TABLE attendance_2023_10 PARTITION OF attendance
-        FOR VALUES FROM ('2023-10-01') TO ('2023-11-01');
-    CREATE TABLE attendance_2023_11 PARTITION OF attendance
-        FOR VALUES FROM ('2023-11-01') TO ('2023-12-01');
-    CREATE TABLE attendance_2023_12 PARTITION OF attendance
-        FOR VALUES FROM ('2023-12-01') TO ('2024-01-01');
-    CREATE TABLE attendance_2024_01 PARTITION OF attendance
-        FOR VALUES FROM ('2024-01-01') TO ('2024-02-01');
-        
+    {partitions_sql}
+
+    {attendance_view_sql}
+
+    -- Та же посещаемость в компактном виде: одна строка на занятие вместо строки на студента.
+    -- i-й бит recorded – есть ли запись у i-го студента из group_roster, present – присутствовал ли он.
+    CREATE TABLE group_roster (
+        id_group INT PRIMARY KEY REFERENCES groups(id),
+        student_keys {roster_key_type}[] NOT NULL
+    );
+
+    CREATE TABLE attendance_bitmap (
+        id_schedule INT PRIMARY KEY REFERENCES schedule(id),
+        recorded BIT VARYING NOT NULL,
+        present BIT VARYING NOT NULL
+    );
+
+    -- Представление в форме строк attendance (без суррогатного id)
+    CREATE VIEW attendance_from_bitmap AS
+    SELECT s.timestamp,
+           DATE_TRUNC('week', s.timestamp)::DATE AS week_start,
+           r.student_key AS id_student,
+           b.id_schedule,
+           get_bit(b.present, (r.pos - 1)::INT) = 1 AS status
+    FROM attendance_bitmap b
+    JOIN schedule s ON s.id = b.id_schedule
+    JOIN group_roster g ON g.id_group = s.id_group
+    CROSS JOIN LATERAL unnest(g.student_keys) WITH ORDINALITY AS r(student_key, pos)
+    WHERE get_bit(b.recorded, (r.pos - 1)::INT) = 1;
+
+    -- Сводка для отчётов: присутствия и число занятий студента по лекции за период
+    -- (ведётся генератором, см. AttendanceRollup)
+    CREATE TABLE attendance_rollup (
+        id_student {roster_key_type} NOT NULL,
+        id_lecture INT NOT NULL REFERENCES lecture(id),
+        period_start DATE NOT NULL,
+        present INT NOT NULL,
+        total INT NOT NULL,
+        PRIMARY KEY (id_student, id_lecture, period_start)
+    );
+    CREATE INDEX idx_attendance_rollup_lecture ON attendance_rollup(id_lecture, period_start);
+
     CREATE TABLE users (
         id SERIAL PRIMARY KEY,
         username VARCHAR(100) NOT NULL,
         hash_password VARCHAR(255) NOT NULL
     );
     """
-    
+
+    # При поэтапной загрузке партиции создаются позже, уже заполненными
+    partitions_sql = ""
+    if ingest_mode == "direct":
+        partitions_sql = "\n".join(
+            f"CREATE TABLE {name} PARTITION OF attendance FOR VALUES FROM ('{start}') TO ('{end}');"
+            for name, start, end in ATTENDANCE_PARTITIONS
+        )
+    schema_sql = schema_sql.replace("{partitions_sql}", partitions_sql)
+
+    # Вариант с целочисленным ключом студента в attendance
+    if STUDENT_KEY_MODE == "int":
+        student_id_sql = "id SERIAL UNIQUE,"
+        attendance_student_sql = "id_student INT NOT NULL REFERENCES student(id)"
+        roster_key_type = "INT"
+        attendance_view_sql = """
+    CREATE VIEW attendance_by_student_number AS
+    SELECT a.id, a.timestamp, a.week_start, s.student_number AS id_student, a.id_schedule, a.status
+    FROM attendance a
+    JOIN student s ON s.id = a.id_student;"""
+    elif STUDENT_KEY_MODE == "text":
+        student_id_sql = ""
+        attendance_student_sql = "id_student VARCHAR(100) NOT NULL REFERENCES student(student_number)"
+        attendance_view_sql = ""
+        roster_key_type = "VARCHAR(100)"
+    else:
+        raise ValueError(f"Неизвестный режим ключа студента: {STUDENT_KEY_MODE}")
+    # Профиль attendance: индексы строит build_postgres_indexes, порядок строк – загрузчик
+    if ATTENDANCE_LAYOUT not in ("default", "report"):
+        raise ValueError(f"Неизвестный профиль attendance: {ATTENDANCE_LAYOUT}")
+    if ATTENDANCE_LAYOUT == "report" and ingest_mode == "direct":
+        info("Профиль attendance report: при прямой загрузке строки остаются в порядке генерации")
+    schema_sql = (schema_sql.replace("{student_id_sql}", student_id_sql)
+                  .replace("{attendance_student_sql}", attendance_student_sql)
+                  .replace("{attendance_view_sql}", attendance_view_sql)
+                  .replace("{roster_key_type}", roster_key_type))
+
     update_progress(operation, 50)
     cur.execute(schema_sql)
     conn.commit()
@@ -274,199 +685,1548 @@ def create_postgres_schema(conn):
     update_progress(operation, 100)
     complete_operation(operation)
 
-def populate_postgres(conn):
-    op_main = start_operation("Заполнение PostgreSQL", 100)
-    
-    cur = conn.cursor()
+##########################################################################
+# PostgreSQL: Пакетная загрузка строк и посещаемости
+##########################################################################
 
-    # 0. Создание представления student_view для Redis
-    info("Создание представления student_view для Redis...")
-    try:
-        view_sql = """
-        CREATE OR REPLACE VIEW public.student_view AS
-        SELECT 
-            s.student_number,
-            s.fullname,
-            s.email,
-            s.id_group,
-            g.name as group_name,
-            s.redis_key 
-        FROM 
-            public.student s
-        JOIN 
-            public.groups g ON s.id_group = g.id;
-        """
-        cur.execute(view_sql)
-        conn.commit()
-        info("Представление student_view успешно создано.")
-        
-        # Создаем таблицу для хранения результатов представления для CDC и Redis
-        student_view_table_sql = """
-        CREATE TABLE IF NOT EXISTS public.student_view_table (
-            student_number VARCHAR(100) PRIMARY KEY,
-            fullname VARCHAR(200) NOT NULL,
-            email VARCHAR(255),
-            id_group INT NOT NULL,
-            group_name VARCHAR(200) NOT NULL,
-            redis_key VARCHAR(100)
-        );
-        
-        -- Первоначальное заполнение таблицы данными из представления
-        TRUNCATE TABLE public.student_view_table;
-        INSERT INTO public.student_view_table
-        SELECT * FROM public.student_view;
-        
-        -- Функция для обновления student_view_table при изменениях
-        CREATE OR REPLACE FUNCTION update_student_view_table() RETURNS TRIGGER AS $$
-        BEGIN
-            -- При изменениях в таблицах обновляем таблицу представления
-            TRUNCATE TABLE public.student_view_table;
-            INSERT INTO public.student_view_table
-            SELECT * FROM public.student_view;
-            RETURN NULL;
-        END;
-        $$ LANGUAGE plpgsql;
-        
-        -- Триггеры для автоматического обновления таблицы представления
-        DROP TRIGGER IF EXISTS update_student_view_table_student ON public.student;
-        CREATE TRIGGER update_student_view_table_student
-        AFTER INSERT OR UPDATE OR DELETE ON public.student
-        FOR EACH STATEMENT EXECUTE PROCEDURE update_student_view_table();
-        
-        DROP TRIGGER IF EXISTS update_student_view_table_groups ON public.groups;
-        CREATE TRIGGER update_student_view_table_groups
-        AFTER INSERT OR UPDATE OR DELETE ON public.groups
-        FOR EACH STATEMENT EXECUTE PROCEDURE update_student_view_table();
-        """
-        cur.execute(student_view_table_sql)
-        conn.commit()
-        info("Таблица student_view_table успешно создана и заполнена.")
-    except Exception as e:
-        conn.rollback()
-        info(f"Ошибка при создании представления: {e}")
+def seed_generators(seed):
+    """Фиксирует зерно random и Faker, чтобы повторный запуск давал тот же набор данных."""
+    global _faker_seed
+    random.seed(seed)
+    _faker_seed = seed
+    # Если Faker ещё не создан, зерно применится при создании
+    if not isinstance(fake, _LazyFaker):
+        lazy_import("faker").Faker.seed(seed)
 
-    # 0.1 Создание материализованного представления и триггеры для автоматического обновления
-    info("Создание материализованного представления student_view_materialized...")
-    try:
-        materialized_view_sql = """
-        CREATE MATERIALIZED VIEW IF NOT EXISTS public.student_view_materialized AS
-        SELECT 
-            s.student_number,
-            s.fullname,
-            s.email,
-            s.id_group,
-            g.name as group_name,
-            s.redis_key 
-        FROM 
-            public.student s
-        JOIN 
-            public.groups g ON s.id_group = g.id;
-        
-        CREATE UNIQUE INDEX IF NOT EXISTS idx_student_view_materialized_student_number 
-        ON public.student_view_materialized(student_number);
-        """
-        cur.execute(materialized_view_sql)
-        conn.commit()
-        
-        # Создание функции и триггеров для обновления материализованного представления
-        trigger_func_sql = """
-        CREATE OR REPLACE FUNCTION refresh_student_view_materialized() RETURNS TRIGGER AS $$
-        BEGIN
-            REFRESH MATERIALIZED VIEW CONCURRENTLY public.student_view_materialized;
-            RETURN NULL;
-        END;
-        $$ LANGUAGE plpgsql;
-        
-        DROP TRIGGER IF EXISTS refresh_student_view_materialized_student ON public.student;
-        CREATE TRIGGER refresh_student_view_materialized_student
-        AFTER INSERT OR UPDATE OR DELETE ON public.student
-        FOR EACH STATEMENT EXECUTE PROCEDURE refresh_student_view_materialized();
-        
-        DROP TRIGGER IF EXISTS refresh_student_view_materialized_groups ON public.groups;
-        CREATE TRIGGER refresh_student_view_materialized_groups
-        AFTER INSERT OR UPDATE OR DELETE ON public.groups
-        FOR EACH STATEMENT EXECUTE PROCEDURE refresh_student_view_materialized();
-        """
-        cur.execute(trigger_func_sql)
-        conn.commit()
-        info("Материализованное представление и триггеры успешно созданы.")
-    except Exception as e:
-        conn.rollback()
-        info(f"Ошибка при создании материализованного представления: {e}")
-    
-    # 0.2 Табличка лекция-кафедра
-    try:
-        view_sql = """
-        CREATE TABLE lecture_department (
-            lecture_id INTEGER PRIMARY KEY,
-            lecture_name VARCHAR(200) NOT NULL,
-            id_course INTEGER NOT NULL,
-            id_department INTEGER NOT NULL,
-            department_name VARCHAR(200) NOT NULL
-        );
+def _insert_rows_values(cur, table, columns, rows):
+    """Вставляет пакет строк одним многострочным INSERT ... VALUES."""
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    values = ','.join(cur.mogrify(placeholders, row).decode('utf-8') for row in rows)
+    cur.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES {values}")
 
-        CREATE OR REPLACE FUNCTION upsert_lecture_department()
-        RETURNS TRIGGER AS $$
-        BEGIN
-            IF TG_TABLE_NAME = 'lecture' THEN
-                INSERT INTO lecture_department (lecture_id, lecture_name, id_course, id_department, department_name)
-                SELECT NEW.id, NEW.name, c.id, c.id_department, d.name
-                FROM course c
-                JOIN department d ON d.id = c.id_department
-                WHERE c.id = NEW.id_course
-                ON CONFLICT (lecture_id) DO UPDATE
-                SET lecture_name = EXCLUDED.lecture_name,
-                    id_course = EXCLUDED.id_course,
-                    id_department = EXCLUDED.id_department,
-                    department_name = EXCLUDED.department_name;
-                IF TG_OP = 'DELETE' THEN
-                    DELETE FROM lecture_department WHERE lecture_id = OLD.id;
-                END IF;
+def _insert_rows_execute_values(cur, table, columns, rows):
+    execute_values(cur, f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s", rows, page_size=len(rows))
 
-                RETURN NEW;
-            END IF;
+_COPY_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
 
-            IF TG_TABLE_NAME = 'course' THEN
-                UPDATE lecture_department ld
-                SET id_department = NEW.id_department,
-                    department_name = (SELECT name FROM department WHERE id = NEW.id_department)
-                WHERE ld.id_course = NEW.id;
+def _array_element_text(value):
+    """Элемент массива в выводе PostgreSQL: NULL, t/f, строки с особыми символами – в кавычках."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    text = _manifest_value(value)
+    if isinstance(value, list):
+        return text
+    if (text == "" or text.upper() == "NULL"
+            or any(ch in '{},"\\' or ch.isspace() for ch in text)):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"') + '"'
+    return text
 
-                IF TG_OP = 'DELETE' THEN
-                    DELETE FROM lecture_department WHERE id_course = OLD.id;
-                END IF;
+def format_array_literal(values):
+    """Литерал массива PostgreSQL – так же массив выводится приведением ::text."""
+    return "{" + ",".join(_array_element_text(v) for v in values) + "}"
 
-                RETURN NEW;
-            END IF;
+def format_copy_value(value):
+    """Представляет значение в текстовом формате COPY."""
+    if value is None:
+        return "\\N"
+    if value is True:
+        return "t"
+    if value is False:
+        return "f"
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, list):
+        # Литерал массива с кавычками элементов, поверх него – экранирование COPY
+        return format_array_literal(value).translate(_COPY_ESCAPES)
+    return str(value).translate(_COPY_ESCAPES)
 
-            RETURN NULL;
-        END;
-        $$ LANGUAGE plpgsql;
+def format_copy_row(row):
+    return "\t".join(format_copy_value(v) for v in row) + "\n"
 
-        CREATE TRIGGER trg_lecture_upsert
-        AFTER INSERT OR UPDATE OR DELETE ON lecture
-        FOR EACH ROW EXECUTE FUNCTION upsert_lecture_department();
+def _insert_rows_copy(cur, table, columns, rows):
+    buffer = io.StringIO("".join(format_copy_row(row) for row in rows))
+    cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
 
-        CREATE TRIGGER trg_course_update
-        AFTER INSERT OR UPDATE OR DELETE ON course
-        FOR EACH ROW EXECUTE FUNCTION upsert_lecture_department();
-        """
-        cur.execute(view_sql)
-        conn.commit()
-        info("Таблица лекция-кафедра и триггеры созданы.")
-    except Exception as e:
-        conn.rollback()
-        info(f"Ошибка при создании этого говна: {e}")
+ROW_WRITERS = {
+    "values": _insert_rows_values,
+    "execute_values": _insert_rows_execute_values,
+    "copy": _insert_rows_copy,
+}
 
-    # 1. Создание публикации (если ещё не существует)
-    info("Создание публикации pub...")
-    try:
-        cur.execute("DROP PUBLICATION IF EXISTS pub;")
-        conn.commit()
-        # Добавляем в публикацию таблицу student_view_table для CDC
-        cur.execute("CREATE PUBLICATION pub FOR TABLE public.student, public.groups, public.student_view_table;")
-        conn.commit()
-        info("Публикация pub успешно создана для таблиц student, groups и student_view_table.")
+def insert_rows(cur, table, columns, rows, manifest_table=None):
+    """
+    Записывает пакет строк способом, выбранным в ROW_WRITER, и учитывает их в манифесте
+    (manifest_table – логическая таблица, если строки пишутся в промежуточную).
+    """
+    writer = ROW_WRITERS.get(ROW_WRITER)
+    if writer is None:
+        raise ValueError(f"Неизвестный способ записи строк: {ROW_WRITER}")
+    writer(cur, table, columns, rows)
+    load_manifest.record(manifest_table or table, rows, columns=columns)
+
+##########################################################################
+# PostgreSQL: Манифест загрузки (количества строк и контрольные суммы)
+##########################################################################
+
+def _manifest_value(value):
+    """Текстовое представление значения, совпадающее с приведением ::text в PostgreSQL."""
+    if value is None:
+        return ""
+    if value is True:
+        return "true"
+    if value is False:
+        return "false"
+    if isinstance(value, datetime.datetime):
+        text = value.isoformat(sep=" ")
+        # PostgreSQL отбрасывает нули в конце дробной части секунд: 14:00:00.5, а не 14:00:00.500000
+        return text.rstrip("0") if value.microsecond and value.tzinfo is None else text
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, list):
+        return format_array_literal(value)
+    return str(value)
+
+def row_checksum(row):
+    """Первые 64 бита md5 от строки 'v1|v2|...' как знаковое целое (как ::bit(64)::bigint)."""
+    digest = hashlib.md5("|".join(_manifest_value(v) for v in row).encode("utf-8")).hexdigest()
+    value = int(digest[:16], 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def manifest_checksum_sql(table, columns=None):
+    """
+    SQL, считающий по таблице то же, что и манифест: количество строк и сумму row_checksum.
+    Сумма не зависит от порядка строк, поэтому её можно сравнивать с любой копией данных.
+    """
+    columns = sql.SQL(", ").join(
+        sql.SQL("COALESCE({}::text, '')").format(sql.Identifier(c)) for c in columns or MANIFEST_COLUMNS[table])
+    return sql.SQL(
+        "SELECT COUNT(*), COALESCE(SUM(('x' || substr(md5(concat_ws('|', {})), 1, 16))::bit(64)::bigint), 0) FROM {}"
+    ).format(columns, sql.Identifier(table))
+
+class LoadManifest:
+    """
+    Накапливает точное количество строк и контрольную сумму по каждой таблице прямо во
+    время записи. Удалённые строки вычитаются, поэтому сумма остаётся верной.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = {table: 0 for table in MANIFEST_COLUMNS}
+        self.checksums = {table: 0 for table in MANIFEST_COLUMNS}
+
+    def record(self, table, rows, sign=1, columns=None):
+        """columns – порядок колонок в rows, если он отличается от MANIFEST_COLUMNS (например, с явным id)."""
+        if not LOAD_MANIFEST or table not in MANIFEST_COLUMNS:
+            return
+        if columns is not None and tuple(columns) != MANIFEST_COLUMNS[table]:
+            positions = [columns.index(c) for c in MANIFEST_COLUMNS[table]]
+            rows = [tuple(row[i] for i in positions) for row in rows]
+        self.counts[table] += sign * len(rows)
+        self.checksums[table] += sign * sum(row_checksum(row) for row in rows)
+
+    def remove(self, table, rows):
+        self.record(table, rows, sign=-1)
+
+    def save(self, conn, path=MANIFEST_PATH, params=None):
+        """Сохраняет манифест в таблицу load_manifest и в JSON-файл."""
+        if not LOAD_MANIFEST:
+            return
+        cur = conn.cursor()
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS load_manifest (
+                table_name VARCHAR(100) PRIMARY KEY,
+                row_count BIGINT NOT NULL,
+                checksum NUMERIC NOT NULL,
+                checksum_columns TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT NOW()
+            );
+            DELETE FROM load_manifest;
+        """)
+        for table in MANIFEST_COLUMNS:
+            cur.execute(
+                "INSERT INTO load_manifest(table_name, row_count, checksum, checksum_columns) VALUES (%s, %s, %s, %s);",
+                (table, self.counts[table], self.checksums[table], ",".join(MANIFEST_COLUMNS[table])))
+        conn.commit()
+
+        document = {
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "seed": GENERATION_SEED,
+            "params": params,
+            "tables": {
+                table: {
+                    "row_count": self.counts[table],
+                    "checksum": str(self.checksums[table]),
+                    "columns": list(MANIFEST_COLUMNS[table]),
+                    "checksum_sql": manifest_checksum_sql(table).as_string(conn),
+                }
+                for table in MANIFEST_COLUMNS
+            },
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f, ensure_ascii=False, indent=2)
+        cur.close()
+        info(f"Манифест загрузки сохранён в load_manifest и {path}")
+
+# Манифест текущей загрузки
+load_manifest = LoadManifest()
+
+def read_load_manifest(cur):
+    cur.execute("SELECT table_name, row_count, checksum FROM load_manifest;")
+    return {table: (count, int(checksum)) for table, count, checksum in cur.fetchall()}
+
+def catalog_row_estimates(cur, tables):
+    """
+    Оценки числа строк из pg_class; для партиционированных таблиц – сумма по партициям.
+    Для таблицы без оценки (ни разу не анализировалась, reltuples = -1) или с такой
+    партицией возвращается None.
+    """
+    cur.execute("""
+        SELECT p.relname,
+               CASE WHEN p.relkind = 'p' THEN (
+                        SELECT CASE WHEN bool_and(c.reltuples >= 0) THEN SUM(c.reltuples) END
+                        FROM pg_inherits i
+                        JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = p.oid)
+                    WHEN p.reltuples >= 0 THEN p.reltuples
+               END
+        FROM pg_class p
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = 'public' AND p.relname = ANY(%s);
+    """, (list(tables),))
+    return {name: (int(estimate) if estimate is not None else None) for name, estimate in cur.fetchall()}
+
+def verify_load(conn, full_scan=None):
+    """
+    Сверяет загруженные данные с манифестом. По умолчанию сравнивается только количество
+    строк с оценками каталога (без сканирования таблиц), контрольные суммы не проверяются;
+    для таблицы без оценки выполняется COUNT(*). При full_scan выполняются COUNT(*)
+    и подсчёт контрольных сумм. Возвращает (всего строк по манифесту, успех).
+    """
+    full_scan = VERIFY_FULL_SCAN if full_scan is None else full_scan
+    cur = conn.cursor()
+    manifest = read_load_manifest(cur)
+    tables = [t for t in MANIFEST_COLUMNS if t in manifest]
+    op_check = start_operation("Проверка загрузки по манифесту", len(tables))
+
+    estimates = {} if full_scan else catalog_row_estimates(cur, tables)
+    total_records = 0
+    ok = True
+    for i, table in enumerate(tables):
+        expected_count, expected_checksum = manifest[table]
+        total_records += expected_count
+        if full_scan:
+            cur.execute(manifest_checksum_sql(table))
+            count, checksum = cur.fetchone()
+            matched = count == expected_count and int(checksum) == expected_checksum
+            info(f"Таблица {table}: {count} записей (манифест {expected_count}), "
+                 f"контрольная сумма {'совпадает' if int(checksum) == expected_checksum else 'НЕ совпадает'}")
+        else:
+            estimate = estimates.get(table)
+            if estimate is None:
+                # Таблица не анализировалась: оценка ничего не говорит, считаем строки
+                cur.execute(sql.SQL("SELECT COUNT(*) FROM {};").format(sql.Identifier(table)))
+                count = cur.fetchone()[0]
+                matched = count == expected_count
+                info(f"Таблица {table}: {count} записей (манифест {expected_count}), оценки каталога нет")
+            else:
+                matched = abs(estimate - expected_count) <= VERIFY_ESTIMATE_TOLERANCE * max(expected_count, 1)
+                info(f"Таблица {table}: {expected_count} записей по манифесту, оценка каталога {estimate}")
+        if not matched:
+            ok = False
+            error(f"Таблица {table}: данные не совпадают с манифестом")
+        update_progress(op_check, i+1)
+
+    # Битовые маски, развёрнутые в строки, должны дать ту же посещаемость
+    if full_scan and "attendance" in manifest:
+        cur.execute(manifest_checksum_sql("attendance_from_bitmap", ATTENDANCE_COLUMNS))
+        count, checksum = cur.fetchone()
+        if (count, int(checksum)) == manifest["attendance"]:
+            info(f"Представление attendance_from_bitmap: {count} записей, совпадает с attendance")
+        else:
+            ok = False
+            error(f"Представление attendance_from_bitmap ({count} записей) не совпадает с attendance")
+
+    if ATTENDANCE_ROLLUP and "attendance" in manifest:
+        ok = verify_attendance_rollup(cur, full_scan, manifest["attendance"][0]) and ok
+    if not full_scan:
+        info("Проверены только количества строк, контрольные суммы не сравнивались (VERIFY_FULL_SCAN=1)")
+    conn.commit()
+    cur.close()
+    complete_operation(op_check, success=ok)
+    return total_records, ok
+
+def _estimate_item_bytes(item):
+    """Приблизительный размер элемента пакета в памяти Python."""
+    size = sys.getsizeof(item)
+    values = item.values() if isinstance(item, dict) else item if isinstance(item, (tuple, list)) else ()
+    return size + sum(sys.getsizeof(v) for v in values)
+
+class AdaptiveBatcher:
+    """
+    Подбирает размер пакета для одного приёмника (PostgreSQL, Neo4j, Elasticsearch).
+
+    После каждого полного пакета измеряется пропускная способность (элементов в секунду).
+    Размер меняется в одном направлении, пока пропускная способность растёт, и
+    разворачивается, когда она падает; при каждом развороте шаг уменьшается, так что
+    размер сходится к лучшей точке. Пакет, выполнявшийся дольше max_latency секунд,
+    всегда уменьшается. Верхняя граница дополнительно ограничена BATCH_MEMORY_LIMIT_MB
+    с учётом оценки размера одного элемента.
+    """
+
+    def __init__(self, name, initial, min_size, max_size, max_latency=5.0, step=1.5):
+        self.name = name
+        self.size = initial
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_latency = max_latency
+        self.step = step
+        self.direction = 1
+        self.item_bytes = None
+        self.last_throughput = None
+        self.best_throughput = 0.0
+        self.best_size = initial
+        self.batches = 0
+        self.items = 0
+        self.seconds = 0.0
+
+    def size_limit(self):
+        limit = self.max_size
+        if self.item_bytes:
+            limit = min(limit, BATCH_MEMORY_LIMIT_MB * 1024 * 1024 // self.item_bytes)
+        return max(self.min_size, limit)
+
+    @contextmanager
+    def measure(self, items, sample=None):
+        started = time.perf_counter()
+        yield
+        self.record(items, time.perf_counter() - started, sample)
+
+    def record(self, items, seconds, sample=None):
+        if sample is not None and self.item_bytes is None:
+            self.item_bytes = _estimate_item_bytes(sample)
+        self.batches += 1
+        self.items += items
+        self.seconds += seconds
+
+        # Неполный пакет (хвост) не показателен для выбранного размера
+        if not ADAPTIVE_BATCHING or items < self.size or seconds <= 0:
+            return
+
+        throughput = items / seconds
+        if throughput > self.best_throughput:
+            self.best_throughput = throughput
+            self.best_size = self.size
+
+        if seconds > self.max_latency:
+            self.direction = -1
+        elif self.last_throughput is not None and throughput < self.last_throughput * 0.95:
+            self.direction = -self.direction
+            self.step = max(1.1, self.step * 0.8)
+        self.last_throughput = throughput
+
+        factor = self.step if self.direction > 0 else 1 / self.step
+        self.size = max(self.min_size, min(self.size_limit(), int(self.size * factor)))
+
+    def summary(self):
+        avg = self.items / self.seconds if self.seconds > 0 else 0
+        return (f"{self.name}: {self.batches} пакетов, {avg:.0f} эл/с в среднем, "
+                f"лучший размер {self.best_size} ({self.best_throughput:.0f} эл/с), итоговый размер {self.size}")
+
+##########################################################################
+# PostgreSQL: Контроль отставания слота логической репликации (CDC)
+##########################################################################
+
+class ReplicationBackpressure:
+    """
+    Следит за отставанием слота REPLICATION_SLOT от текущей позиции WAL.
+
+    maybe_wait() вызывается после фиксации очередного пакета: не чаще чем раз в
+    CDC_POLL_INTERVAL секунд проверяет отставание и, если оно больше CDC_MAX_LAG_MB,
+    приостанавливает запись, пока оно не снизится до CDC_RESUME_LAG_MB. Если к слоту
+    никто не подключён (Debezium ещё не зарегистрирован), ожидание не имеет смысла –
+    выводится предупреждение. Для опроса используется отдельное соединение из пула,
+    чтобы не вмешиваться в транзакции загрузчика.
+    """
+
+    def __init__(self):
+        self.conn = backends.acquire_postgres_connection(autocommit=True)
+        self.last_check = 0.0
+        self.throttled_seconds = 0.0
+        self.warned_inactive = False
+
+    def slot_state(self):
+        """Возвращает (active, отставание в байтах) или None, если слота нет."""
+        with self.conn.cursor() as cur:
+            cur.execute("""
+                SELECT active, pg_wal_lsn_diff(pg_current_wal_lsn(), confirmed_flush_lsn)
+                FROM pg_replication_slots
+                WHERE slot_name = %s;
+            """, (REPLICATION_SLOT,))
+            row = cur.fetchone()
+        if row is None or row[1] is None:
+            return None
+        return row[0], int(row[1])
+
+    def maybe_wait(self):
+        if CDC_MAX_LAG_MB <= 0 or time.time() - self.last_check < CDC_POLL_INTERVAL:
+            return
+        self.last_check = time.time()
+
+        state = self.slot_state()
+        if state is None or state[1] < CDC_MAX_LAG_MB * 1024 * 1024:
+            return
+        active, lag = state
+        if not active:
+            if not self.warned_inactive:
+                info(f"Слот {REPLICATION_SLOT} отстаёт на {lag // (1024 * 1024)} МБ, но к нему никто не подключён")
+                self.warned_inactive = True
+            return
+
+        info(f"Слот {REPLICATION_SLOT} отстаёт на {lag // (1024 * 1024)} МБ, запись приостановлена...")
+        started = time.time()
+        while active and lag > CDC_RESUME_LAG_MB * 1024 * 1024:
+            time.sleep(CDC_POLL_INTERVAL)
+            state = self.slot_state()
+            if state is None:
+                break
+            active, lag = state
+        self.throttled_seconds += time.time() - started
+        self.last_check = time.time()
+
+    def close(self):
+        if self.throttled_seconds:
+            info(f"Запись ожидала выгрузки слота {self.throttled_seconds:.1f} с")
+        backends.release_postgres_connection(self.conn)
+
+def wait_for_cdc_drain(generation_started):
+    """
+    Барьер в конце генерации: ждёт, пока Debezium подтвердит чтение всего WAL,
+    записанного генератором (confirmed_flush_lsn слота), и сообщает время от начала
+    генерации до этого подтверждения. Доставку в приёмники (Elasticsearch, Neo4j,
+    MongoDB) барьер не проверяет. Если к слоту CDC_DRAIN_INACTIVE_POLLS опросов подряд
+    никто не подключён (коннектор не зарегистрирован), ожидание прекращается.
+    Возвращает True, если слот выгружен за CDC_DRAIN_TIMEOUT секунд.
+    """
+    if CDC_DRAIN_TIMEOUT <= 0:
+        return False
+
+    monitor = ReplicationBackpressure()
+    state = monitor.slot_state()
+    if state is None:
+        info(f"Слот {REPLICATION_SLOT} не найден, ожидание CDC пропущено")
+        monitor.close()
+        return False
+
+    op_drain = start_operation("Ожидание выгрузки CDC", max(1, state[1]))
+    initial_lag = max(1, state[1])
+    started = time.time()
+    drained = False
+    inactive_polls = 0
+    while time.time() - started < CDC_DRAIN_TIMEOUT:
+        state = monitor.slot_state()
+        if state is None:
+            break
+        active, lag = state
+        update_progress(op_drain, max(0, initial_lag - lag))
+        if active and lag <= CDC_DRAIN_TOLERANCE_KB * 1024:
+            drained = True
+            break
+        inactive_polls = 0 if active else inactive_polls + 1
+        if inactive_polls >= CDC_DRAIN_INACTIVE_POLLS:
+            break
+        time.sleep(CDC_POLL_INTERVAL)
+    monitor.close()
+    complete_operation(op_drain, success=drained)
+
+    if drained:
+        info(f"Слот {REPLICATION_SLOT} выгружен: Debezium подтвердил WAL генерации через "
+             f"{time.time() - generation_started:.1f} с от её начала")
+    elif inactive_polls >= CDC_DRAIN_INACTIVE_POLLS:
+        info(f"К слоту {REPLICATION_SLOT} никто не подключён (коннектор Debezium не зарегистрирован), "
+             f"ожидание CDC пропущено")
+    else:
+        error(f"Слот {REPLICATION_SLOT} не выгружен за {CDC_DRAIN_TIMEOUT} с")
+    return drained
+
+##########################################################################
+# PostgreSQL: Метрики базы данных по этапам генерации
+##########################################################################
+
+def _lsn_to_int(lsn):
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+def format_bytes(value):
+    sign = "-" if value < 0 else ""
+    value = abs(value)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{sign}{value:.0f}{unit}" if unit == "B" else f"{sign}{value:.1f}{unit}"
+        value /= 1024
+
+class StageDbMetrics:
+    """
+    Снимает метрики PostgreSQL в начале и в конце каждой операции визуализатора
+    и показывает их разницу в итоговой сводке:
+      - объём сгенерированного WAL (pg_current_wal_lsn);
+      - попадания в буферный кэш и чтения блоков (pg_stat_database);
+      - прирост размеров таблиц и индексов схемы public;
+      - самые затратные запросы этапа по total_exec_time (pg_stat_statements).
+    По этим данным видно, во что упирается этап: в клиента, в WAL или в индексы.
+    """
+
+    def __init__(self):
+        self.conn = backends.acquire_postgres_connection(autocommit=True)
+        self.snapshots = {}
+        self.has_statements = self._enable_pg_stat_statements()
+
+    def _enable_pg_stat_statements(self):
+        try:
+            with self.conn.cursor() as cur:
+                cur.execute("CREATE EXTENSION IF NOT EXISTS pg_stat_statements;")
+                cur.execute("SELECT 1 FROM pg_stat_statements LIMIT 1;")
+            return True
+        except psycopg2.Error as e:
+            info(f"pg_stat_statements недоступен, статистика запросов не собирается: {e}".strip())
+            return False
+
+    def snapshot(self):
+        with self.conn.cursor() as cur:
+            cur.execute("SELECT pg_stat_clear_snapshot();")
+            cur.execute("""
+                SELECT pg_current_wal_lsn()::text, blks_hit, blks_read
+                FROM pg_stat_database
+                WHERE datname = current_database();
+            """)
+            lsn, blks_hit, blks_read = cur.fetchone()
+            cur.execute("""
+                SELECT c.relname, pg_table_size(c.oid), pg_indexes_size(c.oid)
+                FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = 'public' AND c.relkind IN ('r', 'm');
+            """)
+            sizes = {name: (table_size, index_size) for name, table_size, index_size in cur.fetchall()}
+            statements = {}
+            if self.has_statements:
+                cur.execute("""
+                    SELECT queryid, query, total_exec_time, calls
+                    FROM pg_stat_statements
+                    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+                      AND query NOT LIKE '%pg_stat%';
+                """)
+                statements = {row[0]: row[1:] for row in cur.fetchall()}
+        return {"wal": _lsn_to_int(lsn), "blks_hit": blks_hit, "blks_read": blks_read,
+                "sizes": sizes, "statements": statements}
+
+    def on_start(self, operation):
+        self.snapshots[operation] = self.snapshot()
+
+    def on_complete(self, operation):
+        before = self.snapshots.pop(operation, None)
+        if before is None:
+            return None
+        after = self.snapshot()
+
+        blks_hit = after["blks_hit"] - before["blks_hit"]
+        blks_read = after["blks_read"] - before["blks_read"]
+        table_growth = sum(after["sizes"].get(t, (0, 0))[0] - before["sizes"].get(t, (0, 0))[0]
+                           for t in set(after["sizes"]) | set(before["sizes"]))
+        index_growth = sum(after["sizes"].get(t, (0, 0))[1] - before["sizes"].get(t, (0, 0))[1]
+                           for t in set(after["sizes"]) | set(before["sizes"]))
+        hit_ratio = blks_hit / (blks_hit + blks_read) * 100 if blks_hit + blks_read else 100.0
+
+        details = []
+        deltas = []
+        for queryid, (query, total_time, calls) in after["statements"].items():
+            prev_time, prev_calls = before["statements"].get(queryid, (None, 0.0, 0))[1:]
+            if total_time - prev_time > 0:
+                deltas.append((total_time - prev_time, calls - prev_calls, query))
+        for spent, calls, query in sorted(deltas, reverse=True)[:STAGE_TOP_STATEMENTS]:
+            details.append(f"{spent / 1000:8.2f}s {calls:>8} calls  {' '.join(query.split())[:120]}")
+
+        return {
+            "columns": {
+                "WAL": format_bytes(after["wal"] - before["wal"]),
+                "Buf hit %": f"{hit_ratio:.1f}",
+                "Blk read": f"{blks_read:,}",
+                "Table +": format_bytes(table_growth),
+                "Index +": format_bytes(index_growth),
+            },
+            "details": details,
+        }
+
+    def close(self):
+        # Операции после close() (например, сохранение шаблона) идут уже без метрик
+        remove_operation_hooks(self.on_start, self.on_complete)
+        backends.release_postgres_connection(self.conn)
+
+def enable_stage_db_metrics():
+    """Подключает сбор метрик PostgreSQL к операциям визуализатора."""
+    if not STAGE_DB_METRICS:
+        return None
+    try:
+        metrics = StageDbMetrics()
+    except psycopg2.Error as e:
+        info(f"Метрики PostgreSQL по этапам отключены: {e}".strip())
+        return None
+    add_operation_hooks(metrics.on_start, metrics.on_complete)
+    return metrics
+
+##########################################################################
+# Память процесса генератора по этапам
+##########################################################################
+
+def read_process_memory():
+    """
+    Текущий и пиковый RSS процесса в байтах. Без /proc (не Linux) текущий RSS
+    неизвестен, а пиком считается ru_maxrss – пик с начала процесса.
+    """
+    values = {}
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("VmRSS:", "VmHWM:")):
+                    name, value = line.split(":", 1)
+                    values[name] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    peak = values.get("VmHWM") or resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return values.get("VmRSS"), peak
+
+def reset_peak_rss():
+    """Сбрасывает пиковый RSS процесса до текущего (Linux 4.0+). Возвращает успех."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+class StageMemoryMetrics:
+    """
+    Пиковый RSS процесса для каждой операции визуализатора, а при STAGE_TRACEMALLOC –
+    пик памяти Python и места, где этап выделил больше всего памяти.
+
+    Пик процесса (VmHWM) сбрасывается в начале каждой операции, а каждое считанное
+    значение засчитывается всем открытым операциям: пик внешнего этапа остаётся
+    максимумом по вложенным, а вложенный этап не получает пик внешнего, случившийся
+    до его начала. Если сброс недоступен, пик считается с начала процесса
+    (peak_scope = "process" в отчёте). Память процессов ProcessPoolExecutor
+    (хэширование паролей) сюда не входит.
+    """
+
+    def __init__(self):
+        self.open = {}
+        self.results = {}
+        self.per_operation = reset_peak_rss()
+        if STAGE_TRACEMALLOC and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _fold_peaks(self):
+        """Засчитывает пики с последнего сброса всем открытым операциям, возвращает текущий RSS."""
+        rss, peak_rss = read_process_memory()
+        py_peak = tracemalloc.get_traced_memory()[1] if STAGE_TRACEMALLOC else 0
+        for state in self.open.values():
+            state["peak_rss"] = max(state["peak_rss"], peak_rss)
+            state["py_peak"] = max(state["py_peak"], py_peak)
+        return rss
+
+    def on_start(self, operation):
+        self._fold_peaks()
+        if self.per_operation:
+            reset_peak_rss()
+        rss, peak_rss = read_process_memory()
+        state = {"rss_start": rss, "peak_rss": peak_rss, "py_peak": 0, "snapshot": None}
+        if STAGE_TRACEMALLOC:
+            tracemalloc.reset_peak()
+            state["py_peak"] = tracemalloc.get_traced_memory()[0]
+            state["snapshot"] = tracemalloc.take_snapshot()
+        self.open[operation] = state
+
+    def on_complete(self, operation):
+        if operation not in self.open:
+            return None
+        rss = self._fold_peaks()
+        state = self.open.pop(operation)
+
+        result = {"peak_rss_bytes": state["peak_rss"], "rss_start_bytes": state["rss_start"],
+                  "rss_end_bytes": rss}
+        columns = {"Peak RSS": format_bytes(state["peak_rss"])}
+        if rss is not None and state["rss_start"] is not None:
+            columns["RSS Δ"] = format_bytes(rss - state["rss_start"])
+        details = []
+        if STAGE_TRACEMALLOC:
+            stats = tracemalloc.take_snapshot().compare_to(state["snapshot"], "lineno")
+            top = [stat for stat in stats if stat.size_diff > 0][:STAGE_TRACEMALLOC_TOP]
+            result["python_peak_bytes"] = state["py_peak"]
+            result["top_allocations"] = [
+                {"site": str(stat.traceback), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                for stat in top
+            ]
+            columns["Py peak"] = format_bytes(state["py_peak"])
+            for stat in top:
+                details.append(f"{format_bytes(stat.size_diff):>9} {stat.count_diff:>8} blocks  {stat.traceback}")
+        self.results[operation] = result
+        return {"columns": columns, "details": details}
+
+    def save_report(self, path):
+        """Сохраняет пики памяти по этапам и пик процесса за весь запуск в JSON."""
+        report = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "peak_scope": "operation" if self.per_operation else "process",
+            "tracemalloc": STAGE_TRACEMALLOC,
+            "process_peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+            "operations": self.results,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        info(f"Отчёт о памяти по этапам сохранён в {path}")
+
+def enable_stage_memory_metrics():
+    """Подключает учёт памяти процесса к операциям визуализатора."""
+    if not STAGE_MEMORY_METRICS:
+        return None
+    metrics = StageMemoryMetrics()
+    add_operation_hooks(metrics.on_start, metrics.on_complete)
+    return metrics
+
+def report_stage_memory(metrics):
+    if metrics and MEMORY_REPORT_PATH:
+        try:
+            metrics.save_report(MEMORY_REPORT_PATH)
+        except OSError as e:
+            error(f"Не удалось сохранить отчёт о памяти: {e}")
+
+##########################################################################
+# Профилирование этапов (--profile)
+##########################################################################
+
+def profiler_call_cost(calls=200000):
+    """Накладные расходы cProfile на один вызов функции, секунды."""
+    def noop():
+        pass
+
+    def workload():
+        for _ in range(calls):
+            noop()
+
+    started = time.perf_counter()
+    workload()
+    plain = time.perf_counter() - started
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.runcall(workload)
+    profiled = time.perf_counter() - started
+    return max(profiled - plain, 0.0) / calls
+
+class StackSampler(threading.Thread):
+    """
+    Раз в interval снимает стеки всех потоков процесса и считает одинаковые стеки.
+    cProfile видит только вызывающий поток, а выборка захватывает и потоки
+    ThreadPoolExecutor (построение индексов, загрузчики). Результат сохраняется в
+    формате collapsed ("поток;кадр;кадр N"), который принимают flamegraph.pl,
+    speedscope и inferno.
+    """
+
+    def __init__(self, interval):
+        super().__init__(name="stack-sampler", daemon=True)
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.spent = 0.0
+        self._stopped = threading.Event()
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            started = time.perf_counter()
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+            self.spent += time.perf_counter() - started
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+class StageProfiler:
+    """
+    Оборачивает функции этапов: каждый вызов выполняется под cProfile и выборкой
+    стеков, в PROFILE_DIR сохраняются <этап>.pstats и <этап>.collapsed. Накладные
+    расходы оцениваются как число вызовов функций, умноженное на калиброванную
+    стоимость вызова под cProfile, плюс время, потраченное выборкой стеков.
+    Вложенные вызовы профилируемых функций выполняются внутри профиля внешнего этапа.
+    """
+
+    def __init__(self, directory, interval):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.interval = interval
+        self.call_cost = profiler_call_cost()
+        self.results = {}
+        self.active = False
+
+    def wrap(self, name, func):
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            if self.active:
+                return func(*args, **kwargs)
+            return self._run(name, func, args, kwargs)
+        return profiled
+
+    def _run(self, name, func, args, kwargs):
+        self.active = True
+        profiler = cProfile.Profile()
+        sampler = StackSampler(self.interval)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            return profiler.runcall(func, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            sampler.stop()
+            self.active = False
+            self._save(name, profiler, sampler, elapsed)
+
+    def _save(self, name, profiler, sampler, elapsed):
+        label = name
+        repeat = 1
+        while label in self.results:
+            repeat += 1
+            label = f"{name}.{repeat}"
+        base = os.path.join(self.directory, label)
+
+        stats = pstats.Stats(profiler)
+        stats.dump_stats(base + ".pstats")
+        sampler.write_collapsed(base + ".collapsed")
+
+        profiler_overhead = stats.total_calls * self.call_cost
+        overhead = profiler_overhead + sampler.spent
+        overhead_pct = min(overhead / elapsed * 100, 100.0) if elapsed else 0.0
+        top = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)[:3]
+        self.results[label] = {
+            "wall_s": round(elapsed, 3),
+            "function_calls": stats.total_calls,
+            "samples": sampler.samples,
+            "profiler_overhead_s": round(profiler_overhead, 3),
+            "sampler_overhead_s": round(sampler.spent, 3),
+            "overhead_pct": round(overhead_pct, 1),
+            "top_tottime": [{"function": pstats.func_std_string(func), "tottime_s": round(values[2], 3)}
+                            for func, values in top],
+        }
+        info(f"Профиль {label}: {elapsed:.2f} с, {stats.total_calls:,} вызовов, "
+             f"{sampler.samples} выборок стеков, накладные расходы ≈ {overhead:.2f} с ({overhead_pct:.1f}% времени этапа)")
+        for func, values in top:
+            info(f"  {values[2]:8.2f} с  {pstats.func_std_string(func)}")
+
+    def save_summary(self):
+        path = os.path.join(self.directory, "profile_summary.json")
+        summary = {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "call_cost_ns": round(self.call_cost * 1e9, 1),
+            "sample_interval_s": self.interval,
+            "stages": self.results,
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        info(f"Профили этапов сохранены в {self.directory} (сводка: {path})")
+
+def enable_stage_profiling():
+    """Заменяет функции PROFILED_STAGES обёртками StageProfiler."""
+    profiler = StageProfiler(PROFILE_DIR, PROFILE_SAMPLE_INTERVAL)
+    module = globals()
+    for name in PROFILED_STAGES:
+        module[name] = profiler.wrap(name, module[name])
+    info(f"Профилирование этапов включено: {', '.join(PROFILED_STAGES)}; "
+         f"cProfile ≈ {profiler.call_cost * 1e9:.0f} нс на вызов")
+    return profiler
+
+##########################################################################
+# Предварительная оценка запуска: строки, байты, WAL, длительность
+##########################################################################
+
+# Байт на строку (данные и индексы), пока нет замеров прошлых запусков
+DEFAULT_ROW_BYTES = {
+    "university": 120, "institute": 130, "department": 130, "groups": 130,
+    "student": 330, "course": 130, "lecture": 200, "schedule": 130,
+    "attendance": 150, "group_roster": 600, "attendance_bitmap": 100,
+}
+# Скорость загрузки (строк в секунду) и байт WAL на байт данных по умолчанию
+DEFAULT_ROWS_PER_SECOND = 20000
+DEFAULT_WAL_RATIO = 1.3
+
+def planned_sessions(params):
+    """Число занятий в основном расписании и число занятий спец-лекций."""
+    universities = min(len(UNIVERSITIES), params["num_universities"])
+    departments = universities * params["institutes_per_univ"] * params["departments_per_inst"]
+    groups = departments * params["groups_per_department"]
+    lectures_per_department = (min(params["courses_per_department"], len(COURSES))
+                               * min(params["lectures_per_course"], len(LECTURE_TOPICS)))
+    main = departments * lectures_per_department * params["groups_per_department"] * len(SCHEDULE_WEEK_OFFSETS)
+    # Спец-лекции берутся с других кафедр; у группы есть занятия только по лекциям своей кафедры
+    special = 0
+    if SPECIAL_GROUP_ID <= groups:
+        special = min(SPECIAL_LECTURES, (departments - 1) * lectures_per_department)
+    return main, special
+
+def plan_row_counts(params=None):
+    """
+    Число строк каждой таблицы манифеста для параметров генерации: (минимум, максимум).
+    Разброс есть только у посещаемости спец-лекций: каждый студент группы получает
+    случайное число занятий от 1 до числа спец-лекций.
+    """
+    params = params or GENERATION_PARAMS
+    universities = min(len(UNIVERSITIES), params["num_universities"])
+    institutes = universities * params["institutes_per_univ"]
+    departments = institutes * params["departments_per_inst"]
+    groups = departments * params["groups_per_department"]
+    courses = departments * min(params["courses_per_department"], len(COURSES))
+    lectures = courses * min(params["lectures_per_course"], len(LECTURE_TOPICS))
+    main_schedules, special = planned_sessions(params)
+    students_per_group = params["students_per_group"]
+
+    exact = {
+        "university": universities,
+        "institute": institutes,
+        "department": departments,
+        "groups": groups,
+        "student": groups * students_per_group,
+        "course": courses,
+        "lecture": lectures,
+        "schedule": main_schedules + special,
+        "group_roster": groups,
+        "attendance_bitmap": main_schedules + special,
+    }
+    counts = {table: (count, count) for table, count in exact.items()}
+    main_attendance = main_schedules * students_per_group
+    counts["attendance"] = (main_attendance + (students_per_group if special else 0),
+                            main_attendance + students_per_group * special)
+    return {table: counts[table] for table in MANIFEST_COLUMNS}
+
+def _load_preflight_history():
+    if not os.path.exists(PREFLIGHT_HISTORY_PATH):
+        return []
+    with open(PREFLIGHT_HISTORY_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+def _matching_run(history):
+    """Последний замер с теми же режимами записи; иначе просто последний."""
+    for run in reversed(history):
+        if (run.get("row_writer"), run.get("ingest_mode"), run.get("student_key"),
+                run.get("layout", "default")) == (ROW_WRITER, ATTENDANCE_INGEST_MODE, STUDENT_KEY_MODE,
+                                                  ATTENDANCE_LAYOUT):
+            return run
+    return history[-1] if history else None
+
+def database_disk_free():
+    """
+    Свободное место на томе каталога данных PostgreSQL, байты, из PREFLIGHT_DB_FREE_MB.
+    Сервер в отдельном контейнере, и генератор не выполняет на нём программ, поэтому
+    без этой настройки возвращается None и проверка места пропускается.
+    """
+    if PREFLIGHT_DB_FREE_MB:
+        return int(PREFLIGHT_DB_FREE_MB) * 1024 * 1024
+    info("PREFLIGHT_DB_FREE_MB не задан, проверка места на сервере PostgreSQL пропущена")
+    return None
+
+def available_memory():
+    """Доступная процессу память: MemAvailable с учётом ограничения cgroup, байты."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                limit = f.read().strip()
+        except OSError:
+            continue
+        if limit.isdigit():
+            available = min(available or int(limit), int(limit))
+        break
+    return available
+
+def estimate_generator_memory(counts):
+    """
+    Пиковая память генератора: список расписания и списки групп в памяти,
+    пакеты посещаемости (в сумме по всем партициям не больше BATCH_MEMORY_LIMIT_MB)
+    и базовый расход.
+    """
+    return (counts["schedule"][1] * 200 + counts["student"][1] * 120
+            + BATCH_MEMORY_LIMIT_MB * 1024 * 1024 + 150 * 1024 * 1024)
+
+def preflight_check(params=None):
+    """
+    Оценивает запуск до генерации: строки по таблицам, объём на диске, WAL и длительность
+    (по замерам прошлых запусков из PREFLIGHT_HISTORY_PATH или значениям по умолчанию),
+    и сверяет их со свободным местом на сервере PostgreSQL (PREFLIGHT_DB_FREE_MB) и доступной памятью.
+    Возвращает (оценка, хватает ли ресурсов).
+    """
+    params = params or GENERATION_PARAMS
+    op_plan = start_operation("Предварительная оценка запуска", 100)
+    counts = plan_row_counts(params)
+    run = _matching_run(_load_preflight_history())
+    row_bytes = dict(DEFAULT_ROW_BYTES, **(run["row_bytes"] if run else {}))
+    rows_per_second = run["rows_per_second"] if run else DEFAULT_ROWS_PER_SECOND
+    wal_ratio = run["wal_ratio"] if run else DEFAULT_WAL_RATIO
+
+    total_rows = sum(high for _, high in counts.values())
+    table_bytes = {table: int(high * row_bytes.get(table, 200)) for table, (_, high) in counts.items()}
+    data_bytes = sum(table_bytes.values())
+    wal_bytes = int(data_bytes * wal_ratio)
+    for table, (low, high) in counts.items():
+        rows = f"{low}" if low == high else f"{low}-{high}"
+        info(f"  {table:<20} {rows:>17} строк  ~{format_bytes(table_bytes[table])}")
+    update_progress(op_plan, 40)
+
+    # WAL удерживается слотом до чтения Debezium; при ограничении отставания – не больше CDC_MAX_LAG_MB
+    retained_wal = min(wal_bytes, CDC_MAX_LAG_MB * 1024 * 1024) if CDC_MAX_LAG_MB > 0 else wal_bytes
+    disk_needed = int((data_bytes + retained_wal) * PREFLIGHT_MARGIN)
+    memory_needed = int(estimate_generator_memory(counts) * PREFLIGHT_MARGIN)
+    plan = {
+        "rows": total_rows,
+        "data_bytes": data_bytes,
+        "wal_bytes": wal_bytes,
+        "duration_s": round(total_rows / rows_per_second, 1),
+        "disk_needed": disk_needed,
+        "memory_needed": memory_needed,
+        "based_on": run["created_at"] if run else "значения по умолчанию",
+    }
+    info(f"Оценка: {total_rows} строк, {format_bytes(data_bytes)} данных, {format_bytes(wal_bytes)} WAL, "
+         f"~{plan['duration_s']:.0f} с (по замерам: {plan['based_on']})")
+
+    disk_free = database_disk_free()
+    memory_free = available_memory()
+    update_progress(op_plan, 80)
+
+    fits = True
+    if disk_free is not None:
+        info(f"Место на сервере PostgreSQL: нужно {format_bytes(disk_needed)}, свободно {format_bytes(disk_free)}")
+        if disk_free < disk_needed:
+            fits = False
+            error("Недостаточно места на сервере PostgreSQL для этого объёма данных")
+    if memory_free is not None:
+        info(f"Память генератора: нужно {format_bytes(memory_needed)}, доступно {format_bytes(memory_free)}")
+        if memory_free < memory_needed:
+            fits = False
+            error("Недостаточно памяти для генерации с этими параметрами")
+    plan["disk_free"] = disk_free
+    plan["memory_free"] = memory_free
+
+    update_progress(op_plan, 100)
+    complete_operation(op_plan, success=fits)
+    return plan, fits
+
+def current_wal_lsn(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_current_wal_lsn()::text;")
+        lsn = cur.fetchone()[0]
+    conn.commit()
+    return lsn
+
+def record_preflight_measurements(conn, start_lsn, duration_s, keep=20):
+    """Сохраняет фактические размеры, WAL и скорость запуска для следующих оценок."""
+    cur = conn.cursor()
+    row_bytes = {}
+    total_rows = 0
+    data_bytes = 0
+    manifest = read_load_manifest(cur)
+    for table in MANIFEST_COLUMNS:
+        cur.execute("SELECT COALESCE(SUM(pg_total_relation_size(relid)), 0) FROM pg_partition_tree(%s::regclass);",
+                    (table,))
+        size = int(cur.fetchone()[0])
+        rows = manifest.get(table, (0, 0))[0]
+        data_bytes += size
+        total_rows += rows
+        if rows:
+            row_bytes[table] = round(size / rows, 1)
+    cur.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s::pg_lsn);", (start_lsn,))
+    wal_bytes = int(cur.fetchone()[0])
+    conn.commit()
+    cur.close()
+
+    history = _load_preflight_history()
+    history.append({
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "row_writer": ROW_WRITER,
+        "ingest_mode": ATTENDANCE_INGEST_MODE,
+        "student_key": STUDENT_KEY_MODE,
+        "layout": ATTENDANCE_LAYOUT,
+        "rows": total_rows,
+        "duration_s": round(duration_s, 1),
+        "rows_per_second": round(total_rows / duration_s, 1) if duration_s > 0 else DEFAULT_ROWS_PER_SECOND,
+        "wal_ratio": round(wal_bytes / data_bytes, 3) if data_bytes else DEFAULT_WAL_RATIO,
+        "row_bytes": row_bytes,
+    })
+    with open(PREFLIGHT_HISTORY_PATH, "w", encoding="utf-8") as f:
+        json.dump(history[-keep:], f, ensure_ascii=False, indent=2)
+    info(f"Замеры запуска сохранены в {PREFLIGHT_HISTORY_PATH}: {total_rows} строк, "
+         f"{format_bytes(data_bytes)}, WAL {format_bytes(wal_bytes)}, {duration_s:.1f} с")
+
+##########################################################################
+# PostgreSQL: Сводка посещаемости (студент, лекция, период)
+##########################################################################
+
+# Начало периода сводки по строке attendance a (то же, что rollup_period)
+ROLLUP_PERIOD_SQL = {
+    "week": "a.week_start",
+    "month": "DATE_TRUNC('month', a.week_start)::DATE",
+}
+
+def rollup_period(week_start):
+    """Начало периода сводки, в который попадает неделя week_start."""
+    if ATTENDANCE_ROLLUP_GRAIN == "week":
+        return week_start
+    if ATTENDANCE_ROLLUP_GRAIN == "month":
+        return week_start.replace(day=1)
+    raise ValueError(f"Неизвестная гранулярность сводки посещаемости: {ATTENDANCE_ROLLUP_GRAIN}")
+
+def rollup_from_attendance_sql(where=""):
+    """Агрегат сырой посещаемости в форме attendance_rollup."""
+    return f"""
+        SELECT a.id_student, s.id_lecture, {ROLLUP_PERIOD_SQL[ATTENDANCE_ROLLUP_GRAIN]} AS period_start,
+               COUNT(*) FILTER (WHERE a.status) AS present, COUNT(*) AS total
+        FROM attendance a
+        JOIN schedule s ON s.id = a.id_schedule
+        {where}
+        GROUP BY 1, 2, 3
+    """
+
+class AttendanceRollup:
+    """
+    Ведёт attendance_rollup по мере генерации посещаемости. Приращения накапливаются
+    в памяти по ключу (студент, лекция, период) и дописываются через
+    INSERT ... ON CONFLICT DO UPDATE, прибавляя их к уже записанным значениям. Поэтому
+    сводку можно пополнять из нескольких процессов (шарды) и при догрузке данных
+    без пересчёта по attendance.
+    """
+
+    def __init__(self, conn, batch_size=ATTENDANCE_ROLLUP_BATCH):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.batch_size = batch_size
+        self.deltas = {}
+
+    def add(self, student_key, lecture_id, period_start, status):
+        if not ATTENDANCE_ROLLUP:
+            return
+        key = (student_key, lecture_id, period_start)
+        counts = self.deltas.get(key)
+        if counts is None:
+            counts = self.deltas[key] = [0, 0]
+        counts[0] += status
+        counts[1] += 1
+        if len(self.deltas) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные приращения; транзакцию фиксирует вызывающий код."""
+        if not self.deltas:
+            return
+        execute_values(self.cur, """
+            INSERT INTO attendance_rollup AS r (id_student, id_lecture, period_start, present, total)
+            VALUES %s
+            ON CONFLICT (id_student, id_lecture, period_start) DO UPDATE
+            SET present = r.present + EXCLUDED.present, total = r.total + EXCLUDED.total
+        """, [key + tuple(counts) for key, counts in self.deltas.items()], page_size=1000)
+        self.deltas = {}
+
+    def finish(self):
+        self.flush()
+        self.conn.commit()
+        self.cur.close()
+
+def refresh_attendance_rollup(cur, lecture_ids=None):
+    """
+    Пересчитывает сводку по сырой посещаемости: для лекций lecture_ids или целиком
+    (после загрузки из кэша, где сводки нет).
+    """
+    if lecture_ids is None:
+        cur.execute("TRUNCATE attendance_rollup;")
+        cur.execute(f"INSERT INTO attendance_rollup {rollup_from_attendance_sql()};")
+    else:
+        cur.execute("DELETE FROM attendance_rollup WHERE id_lecture = ANY(%s);", (list(lecture_ids),))
+        cur.execute(f"INSERT INTO attendance_rollup {rollup_from_attendance_sql('WHERE s.id_lecture = ANY(%s)')};",
+                    (list(lecture_ids),))
+
+def verify_attendance_rollup(cur, full_scan, expected_attendance):
+    """
+    Сверяет сводку с сырой посещаемостью. Без full_scan сумма total сравнивается с числом
+    строк attendance по манифесту (читается только сводка); при full_scan каждая строка
+    сводки сравнивается с агрегатом attendance. Возвращает True при совпадении.
+    """
+    cur.execute("SELECT COUNT(*), COALESCE(SUM(total), 0) FROM attendance_rollup;")
+    rollup_rows, rollup_total = cur.fetchone()
+    ok = rollup_total == expected_attendance
+    if full_scan:
+        cur.execute(f"""
+            SELECT COUNT(*)
+            FROM ({rollup_from_attendance_sql()}) raw
+            FULL JOIN attendance_rollup r USING (id_student, id_lecture, period_start)
+            WHERE raw.present IS DISTINCT FROM r.present OR raw.total IS DISTINCT FROM r.total;
+        """)
+        mismatched = cur.fetchone()[0]
+        ok = ok and mismatched == 0
+        if mismatched:
+            error(f"Сводка attendance_rollup: {mismatched} строк расходятся с attendance")
+    if ok:
+        info(f"Сводка attendance_rollup: {rollup_rows} строк на {rollup_total} записей посещаемости, "
+             f"совпадает с attendance")
+    else:
+        error(f"Сводка attendance_rollup ({rollup_total} записей) не совпадает с attendance "
+              f"({expected_attendance} по манифесту)")
+    return ok
+
+##########################################################################
+# PostgreSQL: Пакетная загрузка посещаемости
+##########################################################################
+
+class AttendanceLoader:
+    """Пакетная вставка посещаемости напрямую в партиционированную таблицу attendance."""
+
+    def __init__(self, conn, batcher, backpressure=None):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.batcher = batcher
+        self.backpressure = backpressure
+        self.batch = []
+
+    def _committed(self):
+        if self.backpressure:
+            self.backpressure.maybe_wait()
+
+    def start(self):
+        pass
+
+    def add(self, row):
+        self.batch.append(row)
+        if len(self.batch) >= self.batcher.size:
+            self.flush()
+
+    def flush(self):
+        if self.batch:
+            with self.batcher.measure(len(self.batch), self.batch[0]):
+                insert_rows(self.cur, "attendance", ATTENDANCE_COLUMNS, self.batch)
+                self.conn.commit()
+            self.batch = []
+            self._committed()
+
+    def finish(self):
+        self.flush()
+        self.cur.close()
+
+class StagedAttendanceLoader(AttendanceLoader):
+    """
+    Загрузка посещаемости через промежуточные таблицы:
+      1. Для каждого месяца создаётся UNLOGGED-таблица без индексов и триггеров
+         (имя совпадает с будущей партицией).
+      2. Строки раскладываются по месяцам и вставляются в эти таблицы.
+      3. После загрузки строится первичный ключ, таблица переводится в LOGGED
+         и подключается к attendance через ATTACH PARTITION.
+    CHECK-ограничение с границами партиции позволяет ATTACH обойтись без
+    проверочного сканирования. Вторичные индексы строит этап build_postgres_indexes.
+    Размер пакета batcher ограничивает сумму строк во всех буферах партиций: при его
+    достижении записывается самый большой буфер.
+    """
+
+    def __init__(self, conn, batcher, backpressure=None):
+        super().__init__(conn, batcher, backpressure)
+        self.partition_starts = [start for _, start, _ in ATTENDANCE_PARTITIONS]
+        self.batches = {name: [] for name, _, _ in ATTENDANCE_PARTITIONS}
+        self.buffered = 0
+
+    def start(self):
+        for name, _, _ in ATTENDANCE_PARTITIONS:
+            self.cur.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE;").format(sql.Identifier(name)))
+            self.cur.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE attendance INCLUDING DEFAULTS);")
+                             .format(sql.Identifier(name)))
+        self.conn.commit()
+
+    def _partition_for(self, week_start):
+        idx = bisect.bisect_right(self.partition_starts, week_start) - 1
+        if idx >= 0:
+            name, start, end = ATTENDANCE_PARTITIONS[idx]
+            if week_start < end:
+                return name
+        raise ValueError(f"Нет партиции attendance для week_start={week_start}")
+
+    def add(self, row):
+        self.batches[self._partition_for(row[1])].append(row)
+        self.buffered += 1
+        if self.buffered >= self.batcher.size:
+            self._flush_partition(max(self.batches, key=lambda name: len(self.batches[name])))
+
+    def _flush_partition(self, name):
+        batch = self.batches[name]
+        if batch:
+            with self.batcher.measure(len(batch), batch[0]):
+                insert_rows(self.cur, name, ATTENDANCE_COLUMNS, batch, manifest_table="attendance")
+                self.conn.commit()
+            self.batches[name] = []
+            self.buffered -= len(batch)
+            self._committed()
+
+    def flush(self):
+        for name in self.batches:
+            self._flush_partition(name)
+
+    def _sort_partition(self, name):
+        """Переписывает промежуточную таблицу в порядке ATTENDANCE_SORT_KEY."""
+        table = sql.Identifier(name)
+        sorted_table = sql.Identifier(f"{name}_sorted")
+        self.cur.execute(sql.SQL("CREATE UNLOGGED TABLE {} (LIKE attendance INCLUDING DEFAULTS);")
+                         .format(sorted_table))
+        self.cur.execute(sql.SQL("INSERT INTO {} SELECT * FROM {} ORDER BY {};").format(
+            sorted_table, table, sql.SQL(", ").join(sql.Identifier(c) for c in ATTENDANCE_SORT_KEY)))
+        self.cur.execute(sql.SQL("DROP TABLE {};").format(table))
+        self.cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {};").format(sorted_table, table))
+
+    def finish(self):
+        self.flush()
+        for name, start, end in ATTENDANCE_PARTITIONS:
+            if ATTENDANCE_LAYOUT == "report":
+                info(f"Сортировка партиции {name}...")
+                self._sort_partition(name)
+            info(f"Подключение партиции {name}...")
+            table = sql.Identifier(name)
+            bounds = sql.Identifier(f"{name}_bounds")
+            self.cur.execute(
+                sql.SQL("ALTER TABLE {} ADD CONSTRAINT {} CHECK (week_start >= %s AND week_start < %s);")
+                .format(table, bounds), (start, end))
+            self.cur.execute(sql.SQL("ALTER TABLE {} ADD PRIMARY KEY (id, week_start);").format(table))
+            self.cur.execute(sql.SQL("ALTER TABLE {} SET LOGGED;").format(table))
+            self.cur.execute(
+                sql.SQL("ALTER TABLE attendance ATTACH PARTITION {} FOR VALUES FROM (%s) TO (%s);")
+                .format(table), (start, end))
+            self.cur.execute(sql.SQL("ALTER TABLE {} DROP CONSTRAINT {};").format(table, bounds))
+            self.conn.commit()
+            # SET LOGGED записывает всю таблицу в WAL
+            self._committed()
+        self.cur.close()
+
+def create_attendance_loader(conn, batcher, backpressure=None):
+    if ATTENDANCE_INGEST_MODE == "staged":
+        return StagedAttendanceLoader(conn, batcher, backpressure)
+    if ATTENDANCE_INGEST_MODE == "direct":
+        return AttendanceLoader(conn, batcher, backpressure)
+    raise ValueError(f"Неизвестный режим загрузки посещаемости: {ATTENDANCE_INGEST_MODE}")
+
+def create_postgres_objects(conn):
+    """Создаёт представления, вспомогательные таблицы с триггерами, публикацию и слот репликации."""
+    cur = conn.cursor()
+
+    # 0. Создание представления student_view для Redis
+    info("Создание представления student_view для Redis...")
+    try:
+        view_sql = """
+        CREATE OR REPLACE VIEW public.student_view AS
+        SELECT 
+            s.student_number,
+            s.fullname,
+            s.email,
+            s.id_group,
+            g.name as group_name,
+            s.redis_key 
+        FROM 
+            public.student s
+        JOIN 
+            public.groups g ON s.id_group = g.id;
+        """
+        cur.execute(view_sql)
+        conn.commit()
+        info("Представление student_view успешно создано.")
+        
+        # Создаем таблицу для хранения результатов представления для CDC и Redis
+        student_view_table_sql = """
+        CREATE TABLE IF NOT EXISTS public.student_view_table (
+            student_number VARCHAR(100) PRIMARY KEY,
+            fullname VARCHAR(200) NOT NULL,
+            email VARCHAR(255),
+            id_group INT NOT NULL,
+            group_name VARCHAR(200) NOT NULL,
+            redis_key VARCHAR(100)
+        );
+        
+        -- Первоначальное заполнение таблицы данными из представления
+        TRUNCATE TABLE public.student_view_table;
+        INSERT INTO public.student_view_table
+        SELECT * FROM public.student_view;
+        
+        -- Функция для обновления student_view_table при изменениях
+        CREATE OR REPLACE FUNCTION update_student_view_table() RETURNS TRIGGER AS $$
+        BEGIN
+            -- При изменениях в таблицах обновляем таблицу представления
+            TRUNCATE TABLE public.student_view_table;
+            INSERT INTO public.student_view_table
+            SELECT * FROM public.student_view;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        -- Триггеры для автоматического обновления таблицы представления
+        DROP TRIGGER IF EXISTS update_student_view_table_student ON public.student;
+        CREATE TRIGGER update_student_view_table_student
+        AFTER INSERT OR UPDATE OR DELETE ON public.student
+        FOR EACH STATEMENT EXECUTE PROCEDURE update_student_view_table();
+        
+        DROP TRIGGER IF EXISTS update_student_view_table_groups ON public.groups;
+        CREATE TRIGGER update_student_view_table_groups
+        AFTER INSERT OR UPDATE OR DELETE ON public.groups
+        FOR EACH STATEMENT EXECUTE PROCEDURE update_student_view_table();
+        """
+        cur.execute(student_view_table_sql)
+        conn.commit()
+        info("Таблица student_view_table успешно создана и заполнена.")
+    except Exception as e:
+        conn.rollback()
+        info(f"Ошибка при создании представления: {e}")
+
+    # 0.1 Создание материализованного представления и триггеры для автоматического обновления
+    info("Создание материализованного представления student_view_materialized...")
+    try:
+        materialized_view_sql = """
+        CREATE MATERIALIZED VIEW IF NOT EXISTS public.student_view_materialized AS
+        SELECT 
+            s.student_number,
+            s.fullname,
+            s.email,
+            s.id_group,
+            g.name as group_name,
+            s.redis_key 
+        FROM 
+            public.student s
+        JOIN 
+            public.groups g ON s.id_group = g.id;
+        
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_student_view_materialized_student_number 
+        ON public.student_view_materialized(student_number);
+        """
+        cur.execute(materialized_view_sql)
+        conn.commit()
+        
+        # Создание функции и триггеров для обновления материализованного представления
+        trigger_func_sql = """
+        CREATE OR REPLACE FUNCTION refresh_student_view_materialized() RETURNS TRIGGER AS $$
+        BEGIN
+            REFRESH MATERIALIZED VIEW CONCURRENTLY public.student_view_materialized;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        DROP TRIGGER IF EXISTS refresh_student_view_materialized_student ON public.student;
+        CREATE TRIGGER refresh_student_view_materialized_student
+        AFTER INSERT OR UPDATE OR DELETE ON public.student
+        FOR EACH STATEMENT EXECUTE PROCEDURE refresh_student_view_materialized();
+        
+        DROP TRIGGER IF EXISTS refresh_student_view_materialized_groups ON public.groups;
+        CREATE TRIGGER refresh_student_view_materialized_groups
+        AFTER INSERT OR UPDATE OR DELETE ON public.groups
+        FOR EACH STATEMENT EXECUTE PROCEDURE refresh_student_view_materialized();
+        """
+        cur.execute(trigger_func_sql)
+        conn.commit()
+        info("Материализованное представление и триггеры успешно созданы.")
+    except Exception as e:
+        conn.rollback()
+        info(f"Ошибка при создании материализованного представления: {e}")
+    
+    # 0.2 Табличка лекция-кафедра
+    try:
+        view_sql = """
+        CREATE TABLE lecture_department (
+            lecture_id INTEGER PRIMARY KEY,
+            lecture_name VARCHAR(200) NOT NULL,
+            id_course INTEGER NOT NULL,
+            id_department INTEGER NOT NULL,
+            department_name VARCHAR(200) NOT NULL
+        );
+
+        CREATE OR REPLACE FUNCTION upsert_lecture_department()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            IF TG_TABLE_NAME = 'lecture' THEN
+                INSERT INTO lecture_department (lecture_id, lecture_name, id_course, id_department, department_name)
+                SELECT NEW.id, NEW.name, c.id, c.id_department, d.name
+                FROM course c
+                JOIN department d ON d.id = c.id_department
+                WHERE c.id = NEW.id_course
+                ON CONFLICT (lecture_id) DO UPDATE
+                SET lecture_name = EXCLUDED.lecture_name,
+                    id_course = EXCLUDED.id_course,
+                    id_department = EXCLUDED.id_department,
+                    department_name = EXCLUDED.department_name;
+                IF TG_OP = 'DELETE' THEN
+                    DELETE FROM lecture_department WHERE lecture_id = OLD.id;
+                END IF;
+
+                RETURN NEW;
+            END IF;
+
+            IF TG_TABLE_NAME = 'course' THEN
+                UPDATE lecture_department ld
+                SET id_department = NEW.id_department,
+                    department_name = (SELECT name FROM department WHERE id = NEW.id_department)
+                WHERE ld.id_course = NEW.id;
+
+                IF TG_OP = 'DELETE' THEN
+                    DELETE FROM lecture_department WHERE id_course = OLD.id;
+                END IF;
+
+                RETURN NEW;
+            END IF;
+
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER trg_lecture_upsert
+        AFTER INSERT OR UPDATE OR DELETE ON lecture
+        FOR EACH ROW EXECUTE FUNCTION upsert_lecture_department();
+
+        CREATE TRIGGER trg_course_update
+        AFTER INSERT OR UPDATE OR DELETE ON course
+        FOR EACH ROW EXECUTE FUNCTION upsert_lecture_department();
+        """
+        cur.execute(view_sql)
+        conn.commit()
+        info("Таблица лекция-кафедра и триггеры созданы.")
+    except Exception as e:
+        conn.rollback()
+        info(f"Ошибка при создании этого говна: {e}")
+
+    # 1. Создание публикации (если ещё не существует)
+    info("Создание публикации pub...")
+    try:
+        cur.execute("DROP PUBLICATION IF EXISTS pub;")
+        conn.commit()
+        # Добавляем в публикацию таблицу student_view_table для CDC
+        cur.execute("CREATE PUBLICATION pub FOR TABLE public.student, public.groups, public.student_view_table;")
+        conn.commit()
+        info("Публикация pub успешно создана для таблиц student, groups и student_view_table.")
     except Exception as e:
         conn.rollback()
         info(f"Ошибка при создании публикации: {e}")
@@ -475,31 +2235,167 @@ def populate_postgres(conn):
     info("Создание логического слота репликации...")
     try:
         # Сначала проверяем, существует ли слот
-        cur.execute("SELECT slot_name FROM pg_replication_slots WHERE slot_name = 'test_slot';")
+        cur.execute("SELECT slot_name FROM pg_replication_slots WHERE slot_name = %s;", (REPLICATION_SLOT,))
         if cur.fetchone():
             info("Слот уже существует, удаляем и создаем заново.")
-            cur.execute("SELECT pg_drop_replication_slot('test_slot');")
+            cur.execute("SELECT pg_drop_replication_slot(%s);", (REPLICATION_SLOT,))
             conn.commit()
         
-        cur.execute("SELECT * FROM pg_create_logical_replication_slot('test_slot', 'wal2json');")
+        cur.execute("SELECT * FROM pg_create_logical_replication_slot(%s, 'wal2json');", (REPLICATION_SLOT,))
         conn.commit()
         info("Слот репликации успешно создан.")
     except Exception as e:
         conn.rollback()
         info(f"Ошибка при создании слота репликации: {e}")
+    cur.close()
+
+def add_special_lectures(conn):
+    """
+    Группе SPECIAL_GROUP_ID добавляются занятия по SPECIAL_LECTURES лекциям других кафедр;
+    каждый студент группы записывается на одно или несколько из них.
+    """
+    op_special = start_operation("Добавление специальных лекций", 100)
+    cur = conn.cursor()
+    base_datetime = SEMESTER_START
+    target_group_id = SPECIAL_GROUP_ID
+    
+    update_progress(op_special, 10)
+    
+    # получаем все лекции и их кафедры
+    cur.execute("""
+        SELECT l.id AS lec_id, c.id_department AS dept_id
+        FROM lecture l
+        JOIN course c ON l.id_course = c.id
+    """)
+    lecture_depts = cur.fetchall()
+    update_progress(op_special, 30)
+
+    # определяем dept_id для нашей группы
+    cur.execute("SELECT id_department FROM groups WHERE id = %s;", (target_group_id,))
+    row = cur.fetchone()
+    target_dept_id = row[0] if row else None
+    update_progress(op_special, 50)
+
+    if target_dept_id is None:
+        info(f"Группа {target_group_id} не найдена — спец-лекции не добавлены")
+    else:
+        # отбираем лекции из других кафедр
+        other_lects = [lec for lec, d in lecture_depts if d != target_dept_id]
+        special_sample = random.sample(other_lects, min(SPECIAL_LECTURES, len(other_lects)))
+        
+        update_progress(op_special, 60)
+
+        # удаляем старые schedule и attendance для этих лекций
+        cur.execute(
+            "DELETE FROM attendance WHERE id_schedule IN "
+            "(SELECT id FROM schedule WHERE id_group = %s AND id_lecture = ANY(%s)) "
+            "RETURNING timestamp, week_start, id_student, id_schedule, status",
+            (target_group_id, special_sample)
+        )
+        load_manifest.remove("attendance", cur.fetchall())
+        cur.execute(
+            "DELETE FROM attendance_bitmap WHERE id_schedule IN "
+            "(SELECT id FROM schedule WHERE id_group = %s AND id_lecture = ANY(%s)) "
+            "RETURNING id_schedule, recorded, present",
+            (target_group_id, special_sample)
+        )
+        load_manifest.remove("attendance_bitmap", cur.fetchall())
+        cur.execute(
+            "DELETE FROM schedule WHERE id_group = %s AND id_lecture = ANY(%s) "
+            "RETURNING id_lecture, id_group, timestamp, location, id",
+            (target_group_id, special_sample)
+        )
+        deleted = cur.fetchall()
+        load_manifest.remove("schedule", [row[:4] for row in deleted])
+        if deleted:
+            catalog.schedule.discard("id", [row[4] for row in deleted])
+        conn.commit()
+        update_progress(op_special, 70)
+
+        # создаём новые schedule и собираем их id
+        new_sched_ids = []
+        for lec_id in special_sample:
+            schedule_row = (lec_id, target_group_id, base_datetime, f"Спец-Ауд-{random.randint(1,5)}")
+            cur.execute(
+                "INSERT INTO schedule(id_lecture, id_group, timestamp, location) "
+                "VALUES (%s, %s, %s, %s) RETURNING id;",
+                schedule_row
+            )
+            new_sched_ids.append(cur.fetchone()[0])
+            load_manifest.record("schedule", [schedule_row])
+            catalog.add_schedule(new_sched_ids[-1], *schedule_row)
+        update_progress(op_special, 80)
+
+        # получаем всех студентов группы
+        cur.execute("SELECT student_keys FROM group_roster WHERE id_group = %s;", (target_group_id,))
+        row = cur.fetchone()
+        student_keys = row[0] if row else []
+        
+        update_progress(op_special, 90)
+
+        # для каждого студента вставляем 1 или 2 записи attendance
+        attendance_batch = []
+        special_marks = {sched_id: {} for sched_id in new_sched_ids}
+        for stu_key in student_keys:
+            # случайно выбираем, сколько сессий у этого студента: 1 или 2 (если спец-лекций 2)
+            count_for_student = random.randint(1, len(new_sched_ids))
+            chosen = random.sample(new_sched_ids, count_for_student)
+            for sched_id in chosen:
+                status = random.random() < 0.8
+                special_marks[sched_id][stu_key] = status
+                attendance_batch.append((base_datetime, 
+                                       (base_datetime - datetime.timedelta(days=base_datetime.weekday())).date(), 
+                                       stu_key, sched_id, status))
+
+        # Не все студенты записаны на каждую спец-лекцию: отсутствие записи отмечается в recorded
+        bitmap_batch = [
+            (sched_id,
+             "".join("1" if key in marks else "0" for key in student_keys),
+             "".join("1" if marks.get(key) else "0" for key in student_keys))
+            for sched_id, marks in special_marks.items()
+        ]
+
+        if attendance_batch:
+            insert_rows(cur, "attendance", ATTENDANCE_COLUMNS, attendance_batch)
+            insert_rows(cur, "attendance_bitmap", ATTENDANCE_BITMAP_COLUMNS, bitmap_batch)
+        # Занятия этих лекций у группы заменены: их строки сводки пересчитываются
+        if ATTENDANCE_ROLLUP:
+            refresh_attendance_rollup(cur, special_sample)
+        conn.commit()
+                
+        update_progress(op_special, 100)
+    
+    complete_operation(op_special)
+    cur.close()
+
+def populate_postgres(conn, params=None):
+    params = params or GENERATION_PARAMS
+    load_manifest.reset()
+    catalog.reset()
+    op_main = start_operation("Заполнение PostgreSQL", 100)
+    
+    cur = conn.cursor()
 
-    num_universities = min(len(UNIVERSITIES), 3)
-    institutes_per_univ = 4
-    departments_per_inst = 5
-    groups_per_department = 5
-    students_per_group = 30
-    courses_per_department = 5
-    lectures_per_course = 2
+    # Представления, триггеры, публикация и слот репликации
+    create_postgres_objects(conn)
+
+    # Отставание слота проверяется после каждого пакета студентов и посещаемости
+    backpressure = ReplicationBackpressure()
+
+    num_universities = min(len(UNIVERSITIES), params["num_universities"])
+    institutes_per_univ = params["institutes_per_univ"]
+    departments_per_inst = params["departments_per_inst"]
+    groups_per_department = params["groups_per_department"]
+    students_per_group = params["students_per_group"]
+    courses_per_department = params["courses_per_department"]
+    lectures_per_course = params["lectures_per_course"]
     
-    estimated_students = num_universities * institutes_per_univ * departments_per_inst * groups_per_department * students_per_group
-    info(f"Планируется создать примерно {estimated_students} студентов")
+    planned = plan_row_counts(params)
+    main_schedules, _ = planned_sessions(params)
+    estimated_students = planned["student"][0]
+    info(f"Планируется создать {estimated_students} студентов")
 
-    base_datetime = datetime.datetime(2023, 9, 4, 9, 0, 0)
+    base_datetime = SEMESTER_START
 
     universities = []
     institutes = {}
@@ -511,6 +2407,7 @@ def populate_postgres(conn):
     for i in range(num_universities):
         uni_name = UNIVERSITIES[i]
         cur.execute("INSERT INTO university(name) VALUES (%s) RETURNING id;", (uni_name,))
+        load_manifest.record("university", [(uni_name,)])
         uni_id = cur.fetchone()[0]
         universities.append((uni_id, uni_name))
         update_progress(op_universities, i+1)
@@ -525,7 +2422,7 @@ def populate_postgres(conn):
     total_students = 0
     
     student_batch = []
-    STUDENT_BATCH_SIZE = 1000  # Размер пакета для студентов
+    student_batcher = AdaptiveBatcher("PostgreSQL student", initial=1000, min_size=100, max_size=20000)
     
     # Институты
     op_institutes = start_operation("Создание институтов", num_universities * institutes_per_univ)
@@ -535,6 +2432,7 @@ def populate_postgres(conn):
         for j in range(institutes_per_univ):
             inst_name = INSTITUTES[j % len(INSTITUTES)]
             cur.execute("INSERT INTO institute(name, id_university) VALUES (%s, %s) RETURNING id;", (inst_name, uni_id))
+            load_manifest.record("institute", [(inst_name, uni_id)])
             inst_id = cur.fetchone()[0]
             institutes[uni_id].append((inst_id, inst_name))
             total_institutes += 1
@@ -552,8 +2450,10 @@ def populate_postgres(conn):
             for k in range(departments_per_inst):
                 dept_name = DEPARTMENTS[k % len(DEPARTMENTS)]
                 cur.execute("INSERT INTO department(name, id_institute) VALUES (%s, %s) RETURNING id;", (dept_name, inst_id))
+                load_manifest.record("department", [(dept_name, inst_id)])
                 dept_id = cur.fetchone()[0]
                 departments[inst_id].append((dept_id, dept_name))
+                catalog.departments.append(dept_id, dept_name)
                 total_departments += 1
                 update_progress(op_departments, total_departments)
     conn.commit()
@@ -573,8 +2473,10 @@ def populate_postgres(conn):
                 
                 cur.execute("INSERT INTO groups(name, id_department, formation_year) VALUES (%s, %s, %s) RETURNING id;",
                             (group_name, dept_id, formation_year))
+                load_manifest.record("groups", [(group_name, dept_id, formation_year)])
                 group_id = cur.fetchone()[0]
                 groups[dept_id].append((group_id, group_name))
+                catalog.groups.append(group_id, group_name, dept_id)
                 total_groups += 1
                 update_progress(op_groups, total_groups)
     conn.commit()
@@ -588,56 +2490,40 @@ def populate_postgres(conn):
             for s in range(students_per_group):
                 student_number = f"S{group_id}{s:04d}"
                 fullname = fake.name()
-                name_parts = fullname.split()
-                if len(name_parts) >= 2:
-                    email_name = name_parts[0].lower()
-                    email_surname = name_parts[1].lower()
-                    translit = {
-                        'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e',
-                        'ж': 'zh', 'з': 'z', 'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm',
-                        'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
-                        'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch', 'ъ': '',
-                        'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya'
-                    }
-                    email_name_t = ''.join(translit.get(c, c) for c in email_name.lower())
-                    email_surname_t = ''.join(translit.get(c, c) for c in email_surname.lower())
-                    birth_year = formation_year - random.randint(17, 22)
-                    email = f"{email_surname_t}{email_name_t[0]}{birth_year}@edu.mirea.ru"
-                else:
-                    email = fake.email()
+                email = make_student_email(fullname, formation_year)
                     
                 redis_key = f"student:{student_number}"
                 student_batch.append((student_number, fullname, email, group_id, redis_key))
+                catalog.students.append(student_number, fullname, group_id)
                 total_students += 1
                 update_progress(op_students, total_students)
                 
-                if len(student_batch) >= STUDENT_BATCH_SIZE:
-                    values = ','.join(cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8') for row in student_batch)
-                    sql_stmt = f"INSERT INTO student (student_number, fullname, email, id_group, redis_key) VALUES {values}"
-                    cur.execute(sql_stmt)
-                    conn.commit()
+                if len(student_batch) >= student_batcher.size:
+                    with student_batcher.measure(len(student_batch), student_batch[0]):
+                        insert_rows(cur, "student", STUDENT_COLUMNS, student_batch)
+                        conn.commit()
                     student_batch = []
+                    backpressure.maybe_wait()
     
     # Вставляем оставшихся студентов
     if student_batch:
-        values = ','.join(cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8') for row in student_batch)
-        sql_stmt = f"INSERT INTO student (student_number, fullname, email, id_group, redis_key) VALUES {values}"
-        cur.execute(sql_stmt)
-        conn.commit()
+        with student_batcher.measure(len(student_batch), student_batch[0]):
+            insert_rows(cur, "student", STUDENT_COLUMNS, student_batch)
+            conn.commit()
+    info(student_batcher.summary())
     
     complete_operation(op_students)
     update_progress(op_main, 60)
     
     # 3. Курсы, лекции, расписание и посещаемость
-    op_courses = start_operation("Создание курсов", total_departments * courses_per_department)
+    op_courses = start_operation("Создание курсов", planned["course"][0])
     
     total_courses = 0
     total_lectures = 0
     total_schedules = 0
     total_attendances = 0
     
-    attendance_batch = []
-    ATTENDANCE_BATCH_SIZE = 10000  # Размер пакета для посещаемости
+    attendance_batcher = AdaptiveBatcher("PostgreSQL attendance", initial=10000, min_size=1000, max_size=200000)
     
     institutes_names = {}
     cur.execute("SELECT id, name FROM institute;")
@@ -654,7 +2540,9 @@ def populate_postgres(conn):
             for c in range(min(courses_per_department, len(available_courses))):
                 course_name = available_courses[c]
                 cur.execute("INSERT INTO course(name, id_department) VALUES (%s, %s) RETURNING id;", (course_name, dept_id))
+                load_manifest.record("course", [(course_name, dept_id)])
                 course_id = cur.fetchone()[0]
+                catalog.courses.append(course_id, course_name, dept_id)
                 total_courses += 1
                 update_progress(op_courses, total_courses)
     
@@ -662,7 +2550,7 @@ def populate_postgres(conn):
     update_progress(op_main, 70)
     
     # Лекции
-    op_lectures = start_operation("Создание лекций", total_courses * lectures_per_course)
+    op_lectures = start_operation("Создание лекций", planned["lecture"][0])
     
     cur.execute("SELECT id, name, id_department FROM course;")
     all_courses = cur.fetchall()
@@ -676,7 +2564,9 @@ def populate_postgres(conn):
             tech_equipment = random.choice([True, False])
             cur.execute("INSERT INTO lecture(name, duration_hours, tech_equipment, id_course) VALUES (%s, %s, %s, %s) RETURNING id;",
                         (lecture_name, 2, tech_equipment, course_id))
+            load_manifest.record("lecture", [(lecture_name, 2, tech_equipment, course_id)])
             lecture_id = cur.fetchone()[0]
+            catalog.lectures.append(lecture_id, lecture_name, course_id, tech_equipment)
             total_lectures += 1
             update_progress(op_lectures, total_lectures)
     
@@ -684,7 +2574,7 @@ def populate_postgres(conn):
     update_progress(op_main, 75)
     
     # Расписание
-    op_schedule = start_operation("Создание расписаний", 1000)  # Примерное значение
+    op_schedule = start_operation("Создание расписаний", main_schedules)
     
     cur.execute("SELECT l.id, c.id_department FROM lecture l JOIN course c ON l.id_course = c.id;")
     lectures_depts = cur.fetchall()
@@ -698,163 +2588,1183 @@ def populate_postgres(conn):
         for group in dept_groups:
             group_id = group[0]
             
-            for week_offset in range(0, 15, 2):
+            for week_offset in SCHEDULE_WEEK_OFFSETS:
                 weekday = random.randint(1, 5)
                 hour = random.choice([9, 11, 14, 16])
                 schedule_time = base_datetime + datetime.timedelta(weeks=week_offset, days=weekday-1)
                 schedule_time = schedule_time.replace(hour=hour, minute=0, second=0)
-                week_start = (schedule_time - datetime.timedelta(days=schedule_time.weekday())).date()
-                
                 location = f"А-{random.randint(1, 5)}{random.randint(0, 9)}{random.randint(0, 9)}"
                 cur.execute("INSERT INTO schedule(id_lecture, id_group, timestamp, location) VALUES (%s, %s, %s, %s) RETURNING id;",
                             (lecture_id, group_id, schedule_time, location))
+                load_manifest.record("schedule", [(lecture_id, group_id, schedule_time, location)])
                 schedule_id = cur.fetchone()[0]
+                catalog.add_schedule(schedule_id, lecture_id, group_id, schedule_time, location)
                 total_schedules += 1
                 schedule_count += 1
                 
                 if schedule_count % 100 == 0:
-                    update_progress(op_schedule, min(schedule_count, 1000))
+                    update_progress(op_schedule, schedule_count)
     
     conn.commit()
     complete_operation(op_schedule)
     update_progress(op_main, 80)
     
     # Посещаемость
-    op_attendance = start_operation("Создание записей посещаемости", 1000000)  # Примерное значение
+    op_attendance = start_operation("Создание записей посещаемости", main_schedules * students_per_group)
     
     cur.execute("""
-        SELECT s.id, s.id_group, s.timestamp 
+        SELECT s.id, s.id_group, s.timestamp, s.id_lecture
         FROM schedule s
         ORDER BY s.id_group, s.timestamp;
     """)
     all_schedules = cur.fetchall()
     
-    attendance_count = 0
-    attendance_total = 0
+    # Списки студентов групп: их порядок задаёт порядок битов в attendance_bitmap
+    cur.execute(sql.SQL("SELECT id_group, {} FROM student ORDER BY id_group, student_number;").format(
+        sql.Identifier(student_key_column())))
+    rosters = {}
+    for group_id, student_key in cur.fetchall():
+        rosters.setdefault(group_id, []).append(student_key)
+    insert_rows(cur, "group_roster", GROUP_ROSTER_COLUMNS, list(rosters.items()))
+    conn.commit()
+
+    attendance_loader = create_attendance_loader(conn, attendance_batcher, backpressure)
+    attendance_loader.start()
+    rollup = AttendanceRollup(conn)
+    bitmap_batch = []
     
-    for schedule_id, group_id, schedule_time in all_schedules:
-        cur.execute("SELECT student_number FROM student WHERE id_group = %s;", (group_id,))
-        student_numbers = [row[0] for row in cur.fetchall()]
+    for schedule_id, group_id, schedule_time, lecture_id in all_schedules:
+        student_keys = rosters.get(group_id, [])
         
-        week_start = (schedule_time - datetime.timedelta(days=schedule_time.weekday())).date()
+        week_start = week_start_of(schedule_time)
+        period_start = rollup_period(week_start)
+        present = []
         
-        for stud_num in student_numbers:
-            attendance_probability = random.uniform(0.7, 0.9)
-            attendance_status = random.random() < attendance_probability
-            
-            attendance_batch.append((schedule_time, week_start, stud_num, schedule_id, attendance_status))
+        for stud_key in student_keys:
+            row = make_attendance_row(schedule_time, week_start, stud_key, schedule_id)
+            attendance_loader.add(row)
+            rollup.add(stud_key, lecture_id, period_start, row[4])
+            present.append("1" if row[4] else "0")
             total_attendances += 1
-            attendance_count += 1
             
-            if len(attendance_batch) >= ATTENDANCE_BATCH_SIZE:
-                values = ','.join(cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8') for row in attendance_batch)
-                sql_stmt = f"INSERT INTO attendance (timestamp, week_start, id_student, id_schedule, status) VALUES {values}"
-                cur.execute(sql_stmt)
-                conn.commit()
-                attendance_batch = []
-                attendance_total += attendance_count
-                update_progress(op_attendance, min(attendance_total, 1000000))
-                attendance_count = 0
+            if total_attendances % 10000 == 0:
+                update_progress(op_attendance, total_attendances)
+
+        bitmap_batch.append((schedule_id, "1" * len(student_keys), "".join(present)))
+        if len(bitmap_batch) >= ATTENDANCE_BITMAP_BATCH:
+            insert_rows(cur, "attendance_bitmap", ATTENDANCE_BITMAP_COLUMNS, bitmap_batch)
+            conn.commit()
+            bitmap_batch = []
     
-    # Вставляем оставшиеся записи посещаемости
-    if attendance_batch:
-        values = ','.join(cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8') for row in attendance_batch)
-        sql_stmt = f"INSERT INTO attendance (timestamp, week_start, id_student, id_schedule, status) VALUES {values}"
-        cur.execute(sql_stmt)
+    if bitmap_batch:
+        insert_rows(cur, "attendance_bitmap", ATTENDANCE_BITMAP_COLUMNS, bitmap_batch)
         conn.commit()
-        attendance_total += attendance_count
-        update_progress(op_attendance, min(attendance_total, 1000000))
+
+    # Дописываем оставшиеся записи посещаемости (и подключаем партиции) и сводку
+    attendance_loader.finish()
+    rollup.finish()
+    update_progress(op_attendance, total_attendances)
+    info(attendance_batcher.summary())
     
     complete_operation(op_attendance)
     update_progress(op_main, 90)
     
     # === (4) Специальные лекции ===
-    op_special = start_operation("Добавление специальных лекций", 100)
-    target_group_id = 15
-    
-    update_progress(op_special, 10)
-    
-    # получаем все лекции и их кафедры
+    add_special_lectures(conn)
+    backpressure.close()
+
+    catalog.complete = True
+    info(catalog.summary())
+
+    # Манифест фиксируется после всех вставок и удалений
+    load_manifest.save(conn, params=params)
+    update_progress(op_main, 100)
+    complete_operation(op_main)
+    cur.close()
+
+
+##########################################################################
+# PostgreSQL: Генерация несколькими шардами в одну базу
+##########################################################################
+
+class ShardIds:
+    """
+    Явные id строк по глобальным номерам сущностей. Каждой кафедре принадлежит свой
+    блок id групп, студентов, курсов, лекций и занятий, поэтому шарды, генерирующие
+    разные кафедры, пишут в одни таблицы без пересечений и без общих последовательностей.
+    """
+
+    def __init__(self, params):
+        self.groups = params["groups_per_department"]
+        self.students = params["students_per_group"]
+        self.courses = min(params["courses_per_department"], len(COURSES))
+        self.lectures = min(params["lectures_per_course"], len(LECTURE_TOPICS))
+        self.weeks = len(SCHEDULE_WEEK_OFFSETS)
+
+    def group(self, dept, g):
+        return dept * self.groups + g + 1
+
+    def student(self, dept, g, s):
+        return (dept * self.groups + g) * self.students + s + 1
+
+    def course(self, dept, c):
+        return dept * self.courses + c + 1
+
+    def lecture(self, dept, c, l):
+        return (dept * self.courses + c) * self.lectures + l + 1
+
+    def schedule(self, lecture_id, g, w):
+        return ((lecture_id - 1) * self.groups + g) * self.weeks + w + 1
+
+def total_departments(params):
+    return min(len(UNIVERSITIES), params["num_universities"]) * params["institutes_per_univ"] * params["departments_per_inst"]
+
+def shard_departments(shard_index, shard_count, params):
+    """Непрерывный диапазон глобальных номеров кафедр, который генерирует шард."""
+    total = total_departments(params)
+    return range(total * shard_index // shard_count, total * (shard_index + 1) // shard_count)
+
+def _insert_in_chunks(cur, table, columns, rows, chunk=10000):
+    for i in range(0, len(rows), chunk):
+        insert_rows(cur, table, columns, rows[i:i + chunk])
+
+def generate_department(cur, attendance_loader, rollup, dept, ids, params, heartbeat=None):
+    """
+    Генерирует кафедру dept со всем поддеревом: группы, студенты, курсы, лекции, расписание,
+    посещаемость. heartbeat вызывается по ходу генерации, чтобы отмечать живой шард.
+    """
+    heartbeat = heartbeat or (lambda: None)
+    dept_id = dept + 1
+    departments_per_inst = params["departments_per_inst"]
+    dept_name = DEPARTMENTS[(dept % departments_per_inst) % len(DEPARTMENTS)]
+    insert_rows(cur, "department", ("id", "name", "id_institute"),
+                [(dept_id, dept_name, dept // departments_per_inst + 1)])
+
+    groups = []
+    for g in range(ids.groups):
+        formation_year = random.randint(2015, 2023)
+        group_name = f"БСБО-{random.randint(1, 99):02d}-{str(formation_year)[-2:]}"
+        groups.append((ids.group(dept, g), group_name, dept_id, formation_year))
+    insert_rows(cur, "groups", ("id", "name", "id_department", "formation_year"), groups)
+
+    student_columns = STUDENT_COLUMNS + (("id",) if STUDENT_KEY_MODE == "int" else ())
+    students = []
+    rosters = []
+    for g, (group_id, _, _, formation_year) in enumerate(groups):
+        keys = []
+        for s in range(ids.students):
+            student_number = f"S{group_id}{s:04d}"
+            fullname = fake.name()
+            row = (student_number, fullname, make_student_email(fullname, formation_year),
+                   group_id, f"student:{student_number}")
+            if STUDENT_KEY_MODE == "int":
+                row += (ids.student(dept, g, s),)
+            students.append(row)
+            keys.append(row[-1] if STUDENT_KEY_MODE == "int" else student_number)
+        rosters.append((group_id, keys))
+        heartbeat()
+    _insert_in_chunks(cur, "student", student_columns, students)
+    insert_rows(cur, "group_roster", GROUP_ROSTER_COLUMNS, rosters)
+
+    available_courses = list(COURSES)
+    random.shuffle(available_courses)
+    courses = [(ids.course(dept, c), available_courses[c], dept_id) for c in range(ids.courses)]
+    insert_rows(cur, "course", ("id", "name", "id_department"), courses)
+
+    lectures = []
+    for c, (course_id, course_name, _) in enumerate(courses):
+        available_lectures = list(LECTURE_TOPICS)
+        random.shuffle(available_lectures)
+        for l in range(ids.lectures):
+            lectures.append((ids.lecture(dept, c, l), f"{available_lectures[l]} ({course_name})", 2,
+                             random.choice([True, False]), course_id))
+    insert_rows(cur, "lecture", ("id", "name", "duration_hours", "tech_equipment", "id_course"), lectures)
+
+    schedules = []
+    for lecture_id, *_ in lectures:
+        for g, (group_id, *_) in enumerate(groups):
+            for w, week_offset in enumerate(SCHEDULE_WEEK_OFFSETS):
+                weekday = random.randint(1, 5)
+                hour = random.choice([9, 11, 14, 16])
+                schedule_time = SEMESTER_START + datetime.timedelta(weeks=week_offset, days=weekday-1)
+                schedule_time = schedule_time.replace(hour=hour, minute=0, second=0)
+                location = f"А-{random.randint(1, 5)}{random.randint(0, 9)}{random.randint(0, 9)}"
+                schedules.append((ids.schedule(lecture_id, g, w), lecture_id, group_id, schedule_time, location))
+    _insert_in_chunks(cur, "schedule", ("id", "id_lecture", "id_group", "timestamp", "location"), schedules)
+
+    group_keys = dict(rosters)
+    bitmaps = []
+    for schedule_id, lecture_id, group_id, schedule_time, _ in schedules:
+        week_start = week_start_of(schedule_time)
+        period_start = rollup_period(week_start)
+        present = []
+        for key in group_keys[group_id]:
+            row = make_attendance_row(schedule_time, week_start, key, schedule_id)
+            attendance_loader.add(row)
+            rollup.add(key, lecture_id, period_start, row[4])
+            present.append("1" if row[4] else "0")
+        bitmaps.append((schedule_id, "1" * len(present), "".join(present)))
+        heartbeat()
+    _insert_in_chunks(cur, "attendance_bitmap", ATTENDANCE_BITMAP_COLUMNS, bitmaps)
+
+class ShardHeartbeat:
+    """
+    Отметка о ходе генерации шарда (generation_shards.heartbeat_at). Данные кафедры
+    фиксируются только в конце кафедры, поэтому отметка пишется в отдельном соединении
+    из пула в режиме autocommit, не чаще чем раз в десятую часть SHARD_HEARTBEAT_TIMEOUT.
+    """
+
+    def __init__(self, shard_index):
+        self.shard_index = shard_index
+        self.interval = max(1.0, SHARD_HEARTBEAT_TIMEOUT / 10)
+        self.conn = backends.acquire_postgres_connection(autocommit=True)
+        self.last_beat = 0.0
+
+    def __call__(self):
+        if time.time() - self.last_beat < self.interval:
+            return
+        self.last_beat = time.time()
+        with self.conn.cursor() as cur:
+            cur.execute("UPDATE generation_shards SET heartbeat_at = NOW() WHERE shard_index = %s;",
+                        (self.shard_index,))
+
+    def close(self):
+        backends.release_postgres_connection(self.conn)
+
+def populate_postgres_shard(conn, shard_index, shard_count, params, seed=None):
+    """
+    Генерирует кафедры шарда. При заданном зерне генераторы переинициализируются для
+    каждой кафедры, поэтому набор данных не зависит от числа шардов.
+    """
+    ids = ShardIds(params)
+    departments = shard_departments(shard_index, shard_count, params)
+    info(f"Шард {shard_index + 1}/{shard_count}: кафедры {departments.start + 1}-{departments.stop}")
+    load_manifest.reset()
+
+    op_shard = start_operation(f"Шард {shard_index + 1}/{shard_count}: генерация кафедр", len(departments))
+    cur = conn.cursor()
+    batcher = AdaptiveBatcher(f"PostgreSQL attendance (шард {shard_index + 1})",
+                              initial=10000, min_size=1000, max_size=200000)
+    # Партиции создал координатор, промежуточные таблицы у шардов были бы общими
+    attendance_loader = AttendanceLoader(conn, batcher)
+    # Студенты шардов не пересекаются, поэтому их приращения сводки не конфликтуют
+    rollup = AttendanceRollup(conn)
+    heartbeat = ShardHeartbeat(shard_index)
+    try:
+        for i, dept in enumerate(departments):
+            if seed is not None:
+                seed_generators(f"{seed}:{dept}")
+            generate_department(cur, attendance_loader, rollup, dept, ids, params, heartbeat)
+            conn.commit()
+            update_progress(op_shard, i + 1)
+    finally:
+        heartbeat.close()
+    attendance_loader.finish()
+    rollup.finish()
+    info(batcher.summary())
+    cur.close()
+    complete_operation(op_shard)
+
+def claim_shard(conn, shard_index, shard_count, started_at=PROCESS_STARTED_AT):
+    """
+    Ждёт, пока координатор откроет запуск, и занимает строку шарда в generation_shards.
+    Возвращает (зерно, параметры генерации) запуска. Запуск, открытый раньше started_at,
+    остался от прошлой генерации в том же томе базы – его таблицы координатор ещё
+    пересоздаст, поэтому шард ждёт дальше. Если в новом запуске число шардов не совпадает
+    с SHARD_COUNT или строка шарда уже занята, ждать бессмысленно – ошибка.
+    """
+    deadline = time.time() + SHARD_WAIT_TIMEOUT
+    cur = conn.cursor()
+    stale_reported = False
+    while True:
+        try:
+            cur.execute("SELECT shard_count, created_at >= %s FROM generation_run;", (started_at,))
+            run = cur.fetchone()
+            if run and not run[1]:
+                run = None
+                if not stale_reported:
+                    info("В базе таблицы прошлого запуска, ожидание нового запуска координатора...")
+                    stale_reported = True
+            if run and run[0] != shard_count:
+                conn.rollback()
+                raise RuntimeError(f"SHARD_COUNT={shard_count} не совпадает с числом шардов координатора ({run[0]})")
+            cur.execute("""
+                UPDATE generation_shards sh
+                SET status = 'running', started_at = NOW(), heartbeat_at = NOW()
+                FROM generation_run r
+                WHERE sh.shard_index = %s AND sh.status = 'pending' AND r.created_at >= %s
+                RETURNING r.seed, r.params;
+            """, (shard_index, started_at))
+            row = cur.fetchone()
+            conn.commit()
+            if row:
+                cur.close()
+                return row
+            if run:
+                raise RuntimeError(f"Шард {shard_index + 1}/{shard_count} уже занят другим процессом "
+                                   f"или отсутствует в запуске")
+        except psycopg2.Error:
+            # Координатор ещё не создал таблицы запуска
+            conn.rollback()
+        if time.time() > deadline:
+            raise TimeoutError(f"Координатор не подготовил запуск за {SHARD_WAIT_TIMEOUT} с")
+        time.sleep(SHARD_POLL_INTERVAL)
+
+def run_generation_shard(conn, shard_index=SHARD_INDEX, shard_count=SHARD_COUNT):
+    """Роль shard: генерирует свои кафедры и передаёт координатору свою часть манифеста."""
+    info(f"Ожидание координатора (шард {shard_index + 1}/{shard_count})...")
+    seed, params = claim_shard(conn, shard_index, shard_count)
+    cur = conn.cursor()
+    try:
+        populate_postgres_shard(conn, shard_index, shard_count, params, seed)
+    except Exception as e:
+        conn.rollback()
+        cur.execute("UPDATE generation_shards SET status = 'failed', error = %s, finished_at = NOW() "
+                    "WHERE shard_index = %s;", (str(e), shard_index))
+        conn.commit()
+        raise
+    manifest = {"counts": load_manifest.counts,
+                "checksums": {t: str(v) for t, v in load_manifest.checksums.items()}}
+    cur.execute("UPDATE generation_shards SET status = 'done', manifest = %s, finished_at = NOW() "
+                "WHERE shard_index = %s;", (json.dumps(manifest), shard_index))
+    conn.commit()
+    cur.close()
+
+def wait_for_shards(conn, shard_count):
+    """
+    Ждёт завершения всех шардов; возвращает их части манифеста. Работающий шард без
+    отметки о ходе генерации дольше SHARD_HEARTBEAT_TIMEOUT секунд отмечается как упавший.
+    """
+    op_wait = start_operation(f"Ожидание шардов ({shard_count})", shard_count)
+    deadline = time.time() + SHARD_WAIT_TIMEOUT
+    cur = conn.cursor()
+    while True:
+        cur.execute("""
+            UPDATE generation_shards
+            SET status = 'failed', finished_at = NOW(),
+                error = 'нет отметки о ходе генерации с ' || heartbeat_at::text || ' (процесс шарда завершился?)'
+            WHERE status = 'running' AND heartbeat_at < NOW() - make_interval(secs => %s);
+        """, (SHARD_HEARTBEAT_TIMEOUT,))
+        cur.execute("""
+            SELECT shard_index, status, manifest, error, started_at, finished_at
+            FROM generation_shards
+            ORDER BY shard_index;
+        """)
+        shards = cur.fetchall()
+        conn.commit()
+        failed = [(index, err) for index, status, _, err, _, _ in shards if status == "failed"]
+        if failed:
+            complete_operation(op_wait, success=False)
+            raise RuntimeError(f"Шард {failed[0][0] + 1} завершился с ошибкой: {failed[0][1]}")
+        done = [shard for shard in shards if shard[1] == "done"]
+        update_progress(op_wait, len(done))
+        if len(done) == shard_count:
+            break
+        if time.time() > deadline:
+            complete_operation(op_wait, success=False)
+            raise TimeoutError(f"Шарды не завершились за {SHARD_WAIT_TIMEOUT} с")
+        time.sleep(SHARD_POLL_INTERVAL)
+    cur.close()
+    complete_operation(op_wait)
+
+    for index, _, manifest, _, started_at, finished_at in done:
+        record_operation(f"Шард {index + 1}/{shard_count}", started_at.timestamp(), finished_at.timestamp(),
+                         manifest["counts"].get("attendance", 0))
+    return [manifest for _, _, manifest, _, _, _ in done]
+
+def populate_postgres_coordinated(conn, shard_count=SHARD_COUNT, params=None):
+    """
+    Роль coordinator. Схема уже создана (с партициями attendance). Координатор вставляет
+    университеты и институты, открывает запуск для шардов, ждёт их и выполняет общий хвост:
+    сдвигает последовательности, добавляет спец-лекции, создаёт представления и триггеры
+    (дозаполняя lecture_department), публикацию и слот, сохраняет общий манифест.
+    """
+    params = params or GENERATION_PARAMS
+    load_manifest.reset()
+    op_main = start_operation("Заполнение PostgreSQL шардами", 100)
+    cur = conn.cursor()
+
+    num_universities = min(len(UNIVERSITIES), params["num_universities"])
+    institutes_per_univ = params["institutes_per_univ"]
+    insert_rows(cur, "university", ("id", "name"),
+                [(u + 1, UNIVERSITIES[u]) for u in range(num_universities)])
+    insert_rows(cur, "institute", ("id", "name", "id_university"),
+                [(u * institutes_per_univ + i + 1, INSTITUTES[i % len(INSTITUTES)], u + 1)
+                 for u in range(num_universities) for i in range(institutes_per_univ)])
+
+    cur.execute("""
+        CREATE TABLE generation_run (
+            shard_count INT NOT NULL,
+            seed TEXT,
+            params JSONB NOT NULL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE TABLE generation_shards (
+            shard_index INT PRIMARY KEY,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            manifest JSONB,
+            error TEXT,
+            started_at TIMESTAMPTZ,
+            heartbeat_at TIMESTAMPTZ,
+            finished_at TIMESTAMPTZ
+        );
+    """)
+    cur.execute("INSERT INTO generation_run(shard_count, seed, params) VALUES (%s, %s, %s);",
+                (shard_count, GENERATION_SEED, json.dumps(params)))
+    execute_values(cur, "INSERT INTO generation_shards(shard_index) VALUES %s", [(k,) for k in range(shard_count)])
+    conn.commit()
+    info(f"Запуск открыт для {shard_count} шардов: {total_departments(params)} кафедр")
+    update_progress(op_main, 10)
+
+    for manifest in wait_for_shards(conn, shard_count):
+        for table, count in manifest["counts"].items():
+            load_manifest.counts[table] += count
+            load_manifest.checksums[table] += int(manifest["checksums"][table])
+    update_progress(op_main, 70)
+
+    # Шарды вставляли явные id: дальнейшие вставки должны продолжать последовательности
+    serial_tables = ["university", "institute", "department", "groups", "course", "lecture", "schedule", "attendance"]
+    reset_serial_sequences(cur, serial_tables + (["student"] if STUDENT_KEY_MODE == "int" else []))
+    conn.commit()
+
+    if GENERATION_SEED is not None:
+        seed_generators(f"{GENERATION_SEED}:special")
+    add_special_lectures(conn)
+    update_progress(op_main, 80)
+
+    create_postgres_objects(conn)
+    # Триггер lecture_department создан после вставки лекций
+    cur.execute("""
+        INSERT INTO lecture_department (lecture_id, lecture_name, id_course, id_department, department_name)
+        SELECT l.id, l.name, c.id, c.id_department, d.name
+        FROM lecture l
+        JOIN course c ON c.id = l.id_course
+        JOIN department d ON d.id = c.id_department
+        ON CONFLICT (lecture_id) DO NOTHING;
+    """)
+    conn.commit()
+    update_progress(op_main, 90)
+
+    load_manifest.save(conn, params=params)
+    cur.close()
+    update_progress(op_main, 100)
+    complete_operation(op_main)
+
+##########################################################################
+# PostgreSQL: Построение индексов и сбор статистики после загрузки
+##########################################################################
+
+def _run_timed_statement(statement):
+    """Выполняет одну команду в соединении из пула и возвращает время начала и конца."""
+    with backends.postgres_connection(autocommit=True) as conn:
+        started = time.time()
+        with conn.cursor() as cur:
+            cur.execute(statement)
+        return started, time.time()
+
+def _run_parallel(jobs, operation_prefix):
+    """
+    Выполняет задания (название, команда) параллельно в INDEX_BUILD_WORKERS соединениях.
+    Время каждого задания попадает в итоговую сводку.
+    """
+    with ThreadPoolExecutor(max_workers=INDEX_BUILD_WORKERS) as pool:
+        futures = {pool.submit(_run_timed_statement, statement): title for title, statement in jobs}
+        for future in as_completed(futures):
+            started, finished = future.result()
+            record_operation(f"{operation_prefix}: {futures[future]}", started, finished)
+
+def _attendance_partitions(cur):
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'attendance'::regclass
+        ORDER BY c.relname;
+    """)
+    return [row[0] for row in cur.fetchall()]
+
+def post_load_indexes():
+    """Индексы после загрузки с учётом профиля attendance: (имя, таблица, колонки, метод, INCLUDE)."""
+    indexes = [(name, table, columns, "btree", ()) for name, table, columns in POST_LOAD_INDEXES]
+    if ATTENDANCE_LAYOUT == "report":
+        indexes += REPORT_LAYOUT_INDEXES
+    return indexes
+
+def _partition_index_name(partition, columns, method):
+    suffix = "idx" if method == "btree" else f"{method}_idx"
+    return f"{partition}_{'_'.join(columns)}_{suffix}"
+
+def _index_statement(index_name, table, columns, method, include, only=False):
+    statement = sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {}{} USING {} ({})").format(
+        sql.Identifier(index_name), sql.SQL("ONLY ") if only else sql.SQL(""), sql.Identifier(table),
+        sql.SQL(method), sql.SQL(", ").join(sql.Identifier(c) for c in columns))
+    if include:
+        statement += sql.SQL(" INCLUDE ({})").format(sql.SQL(", ").join(sql.Identifier(c) for c in include))
+    return statement + sql.SQL(";")
+
+def build_postgres_indexes(conn):
+    """
+    Строит вторичные индексы после загрузки данных и обновляет статистику:
+      1. Индексы обычных таблиц и индексы каждой партиции attendance строятся
+         параллельно в нескольких соединениях.
+      2. Для attendance создаётся индекс ON ONLY родительской таблицы, к которому
+         подключаются индексы партиций (без повторного построения).
+      3. Для всех таблиц параллельно выполняется ANALYZE.
+    """
+    op_indexes = start_operation("Построение индексов и статистики", 100)
+
+    cur = conn.cursor()
+    partitions = _attendance_partitions(cur)
+
+    indexes = post_load_indexes()
+    jobs = []
+    for index_name, table, columns, method, include in indexes:
+        targets = [(_partition_index_name(p, columns, method), p) for p in partitions] if table == "attendance" \
+            else [(index_name, table)]
+        for target_index, target_table in targets:
+            jobs.append((target_index, _index_statement(target_index, target_table, columns, method, include)))
+
+    info(f"Параллельное построение {len(jobs)} индексов ({INDEX_BUILD_WORKERS} соединений)...")
+    _run_parallel(jobs, "Индекс")
+    update_progress(op_indexes, 60)
+
+    info("Подключение индексов партиций к индексам attendance...")
+    for index_name, table, columns, method, include in indexes:
+        if table != "attendance":
+            continue
+        cur.execute(_index_statement(index_name, table, columns, method, include, only=True))
+        for partition in partitions:
+            cur.execute(sql.SQL("ALTER INDEX {} ATTACH PARTITION {};").format(
+                sql.Identifier(index_name), sql.Identifier(_partition_index_name(partition, columns, method))))
+    conn.commit()
+    cur.close()
+    update_progress(op_indexes, 70)
+
+    info("Сбор статистики (ANALYZE)...")
+    # Для index-only scan по покрывающему индексу страницы attendance должны быть
+    # отмечены в карте видимости, а её заполняет только VACUUM
+    vacuumed = {"attendance"} if ATTENDANCE_LAYOUT == "report" else set()
+    _run_parallel([(table, sql.SQL("VACUUM (ANALYZE) {};" if table in vacuumed else "ANALYZE {};")
+                    .format(sql.Identifier(table))) for table in ANALYZE_TABLES],
+                  "ANALYZE")
+
+    update_progress(op_indexes, 100)
+    complete_operation(op_indexes)
+
+##########################################################################
+# PostgreSQL: Снимки наборов данных в шаблонных базах
+##########################################################################
+
+def dataset_key(seed, params):
+    """Ключ набора данных: одинаковые зерно и параметры генерации дают одинаковые данные."""
+    payload = json.dumps({"seed": seed, "params": params, "ingest": ATTENDANCE_INGEST_MODE,
+                          "student_key": STUDENT_KEY_MODE, "layout": ATTENDANCE_LAYOUT,
+                          "rollup": ATTENDANCE_ROLLUP, "rollup_grain": ATTENDANCE_ROLLUP_GRAIN}, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+def dataset_template_name(key):
+    return f"tpl_{PG_CONN_PARAMS['dbname']}_{key}"
+
+def _admin_connection():
+    conn = psycopg2.connect(**dict(PG_CONN_PARAMS, dbname=PG_ADMIN_DB))
+    conn.autocommit = True
+    return conn
+
+def _disconnect_database(cur, dbname):
+    """Завершает чужие сеансы базы и удаляет её слот: иначе копирование и удаление невозможны."""
+    cur.execute("""
+        SELECT pg_terminate_backend(pid)
+        FROM pg_stat_activity
+        WHERE datname = %s AND pid <> pg_backend_pid();
+    """, (dbname,))
+    cur.execute("""
+        SELECT pg_drop_replication_slot(slot_name)
+        FROM pg_replication_slots
+        WHERE slot_name = %s AND database = %s;
+    """, (REPLICATION_SLOT, dbname))
+
+def _create_replication_slot():
+    conn = psycopg2.connect(**PG_CONN_PARAMS)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("SELECT * FROM pg_create_logical_replication_slot(%s, 'wal2json');", (REPLICATION_SLOT,))
+    conn.close()
+
+def dataset_template_exists(key):
+    conn = _admin_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (dataset_template_name(key),))
+        exists = cur.fetchone() is not None
+    conn.close()
+    return exists
+
+def save_dataset_template(key, params=None):
+    """
+    Сохраняет текущую базу как шаблон tpl_<база>_<ключ> (CREATE DATABASE ... TEMPLATE –
+    копирование файлов, без повторной вставки строк). Слот репликации пересоздаётся.
+    """
+    op_save = start_operation("Сохранение снимка набора данных", 100)
+    dbname = PG_CONN_PARAMS["dbname"]
+    template = dataset_template_name(key)
+    conn = _admin_connection()
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1 FROM pg_database WHERE datname = %s;", (template,))
+        if cur.fetchone():
+            cur.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE false;").format(sql.Identifier(template)))
+            cur.execute(sql.SQL("DROP DATABASE {};").format(sql.Identifier(template)))
+        update_progress(op_save, 20)
+
+        _disconnect_database(cur, dbname)
+        cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {};").format(sql.Identifier(template), sql.Identifier(dbname)))
+        update_progress(op_save, 80)
+
+        description = json.dumps({"key": key, "seed": GENERATION_SEED, "params": params,
+                                   "created_at": datetime.datetime.now().isoformat(timespec="seconds")},
+                                  ensure_ascii=False)
+        cur.execute(sql.SQL("COMMENT ON DATABASE {} IS %s;").format(sql.Identifier(template)), (description,))
+        # Шаблон нельзя случайно изменить: подключения к нему запрещены
+        cur.execute(sql.SQL("ALTER DATABASE {} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false;")
+                    .format(sql.Identifier(template)))
+    conn.close()
+
+    _create_replication_slot()
+    update_progress(op_save, 100)
+    complete_operation(op_save)
+    info(f"Набор данных сохранён как шаблон {template}")
+
+def restore_dataset_template(key):
+    """
+    Пересоздаёт рабочую базу из шаблона с ключом key и заново создаёт слот репликации.
+    Возвращает False, если такого шаблона нет.
+    """
+    if not dataset_template_exists(key):
+        return False
+
+    op_restore = start_operation("Восстановление набора данных из шаблона", 100)
+    dbname = PG_CONN_PARAMS["dbname"]
+    template = dataset_template_name(key)
+    conn = _admin_connection()
+    with conn.cursor() as cur:
+        _disconnect_database(cur, dbname)
+        cur.execute(sql.SQL("DROP DATABASE IF EXISTS {};").format(sql.Identifier(dbname)))
+        update_progress(op_restore, 30)
+        cur.execute(sql.SQL("CREATE DATABASE {} TEMPLATE {};").format(sql.Identifier(dbname), sql.Identifier(template)))
+        update_progress(op_restore, 90)
+    conn.close()
+
+    _create_replication_slot()
+    update_progress(op_restore, 100)
+    complete_operation(op_restore)
+    info(f"База {dbname} восстановлена из шаблона {template}")
+    return True
+
+##########################################################################
+# PostgreSQL: Кэш сгенерированных наборов данных на диске
+##########################################################################
+
+def schema_fingerprint(cur):
+    """Хэш описания колонок таблиц набора данных в том виде, в каком их создала схема."""
     cur.execute("""
-        SELECT l.id AS lec_id, c.id_department AS dept_id
-        FROM lecture l
-        JOIN course c ON l.id_course = c.id
-    """)
-    lecture_depts = cur.fetchall()
-    update_progress(op_special, 30)
+        SELECT table_name, column_name, data_type, COALESCE(column_default, ''), is_nullable
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = ANY(%s)
+        ORDER BY table_name, ordinal_position;
+    """, (list(MANIFEST_COLUMNS),))
+    return hashlib.sha1(repr(cur.fetchall()).encode("utf-8")).hexdigest()
 
-    # определяем dept_id для нашей группы
-    target_dept_id = None
-    for dept_id, dept_groups in groups.items():
-        if any(gid == target_group_id for gid, _ in dept_groups):
-            target_dept_id = dept_id
-            break
-    update_progress(op_special, 50)
+def _cached_columns(cur, table):
+    """Колонки для выгрузки: все, кроме отметок времени со значением по умолчанию NOW()."""
+    cur.execute("""
+        SELECT column_name
+        FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = %s AND COALESCE(column_default, '') <> 'now()'
+        ORDER BY ordinal_position;
+    """, (table,))
+    return [row[0] for row in cur.fetchall()]
 
-    if target_dept_id is None:
-        info(f"Группа {target_group_id} не найдена — спец-лекции не добавлены")
-    else:
-        # отбираем лекции из других кафедр
-        other_lects = [lec for lec, d in lecture_depts if d != target_dept_id]
-        special_sample = random.sample(other_lects, min(2, len(other_lects)))
-        
-        update_progress(op_special, 60)
+def reset_serial_sequences(cur, tables):
+    """Сдвигает последовательности SERIAL за максимальный id после вставки строк с явными id."""
+    for table in sorted(tables):
+        cur.execute(sql.SQL(
+            "SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {}), 0) + 1, false);"
+        ).format(sql.Identifier(table)), (table,))
 
-        # удаляем старые schedule и attendance для этих лекций
-        cur.execute(
-            "DELETE FROM attendance WHERE id_schedule IN "
-            "(SELECT id FROM schedule WHERE id_group = %s AND id_lecture = ANY(%s))",
-            (target_group_id, special_sample)
-        )
-        cur.execute(
-            "DELETE FROM schedule WHERE id_group = %s AND id_lecture = ANY(%s)",
-            (target_group_id, special_sample)
-        )
-        conn.commit()
-        update_progress(op_special, 70)
+def _copy_statement(table, columns, direction):
+    """COPY таблицы в STDOUT (direction="TO") или из STDIN (direction="FROM")."""
+    stream = "STDOUT" if direction == "TO" else "STDIN"
+    return sql.SQL(f"COPY {{}} ({{}}) {direction} {stream}").format(
+        sql.Identifier(table), sql.SQL(", ").join(sql.Identifier(c) for c in columns))
 
-        # создаём новые schedule и собираем их id
-        new_sched_ids = []
-        for lec_id in special_sample:
-            cur.execute(
-                "INSERT INTO schedule(id_lecture, id_group, timestamp, location) "
-                "VALUES (%s, %s, %s, %s) RETURNING id;",
-                (lec_id, target_group_id, base_datetime, f"Спец-Ауд-{random.randint(1,5)}")
-            )
-            new_sched_ids.append(cur.fetchone()[0])
-        update_progress(op_special, 80)
+class DatasetCache:
+    """
+    Кэш результата populate_postgres на локальном диске. Ключ – зерно, параметры генерации,
+    отпечаток схемы и DATASET_CACHE_VERSION; запись – каталог с COPY-выгрузками таблиц
+    и манифестом загрузки. При попадании генерация пропускается, таблицы загружаются
+    через COPY. Объём кэша ограничен DATASET_CACHE_MAX_MB: лишние записи удаляются
+    в порядке давности последнего использования.
+    """
 
-        # получаем всех студентов группы
-        cur.execute("SELECT student_number FROM student WHERE id_group = %s;", (target_group_id,))
-        student_numbers = [row[0] for row in cur.fetchall()]
-        
-        update_progress(op_special, 90)
+    def __init__(self, directory=DATASET_CACHE_DIR, max_mb=DATASET_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
 
-        # для каждого студента вставляем 1 или 2 записи attendance
-        attendance_batch = []
-        for stu_num in student_numbers:
-            # случайно выбираем, сколько сессий у этого студента: 1 или 2 (если спец-лекций 2)
-            count_for_student = random.randint(1, len(new_sched_ids))
-            chosen = random.sample(new_sched_ids, count_for_student)
-            for sched_id in chosen:
-                status = random.random() < 0.8
-                attendance_batch.append((base_datetime, 
-                                       (base_datetime - datetime.timedelta(days=base_datetime.weekday())).date(), 
-                                       stu_num, sched_id, status))
+    def key(self, conn, seed, params):
+        with conn.cursor() as cur:
+            fingerprint = schema_fingerprint(cur)
+        payload = json.dumps({"version": DATASET_CACHE_VERSION, "seed": seed, "params": params,
+                              "schema": fingerprint}, sort_keys=True)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
-        if attendance_batch:
-            values = ','.join(cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8') for row in attendance_batch)
-            sql_stmt = f"INSERT INTO attendance (timestamp, week_start, id_student, id_schedule, status) VALUES {values}"
-            cur.execute(sql_stmt)
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def load(self, conn, key, params=None):
+        """Загружает набор данных из записи key; возвращает False, если записи нет."""
+        meta_path = os.path.join(self._path(key), "meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        # Время изменения meta.json – время последнего использования записи
+        os.utime(meta_path)
+
+        op_load = start_operation("Загрузка набора данных из кэша", len(meta["files"]))
+        load_manifest.reset()
+        create_postgres_objects(conn)
+        backpressure = ReplicationBackpressure()
+        cur = conn.cursor()
+
+        # Посещаемость идёт последней и грузится в партиции через обычный загрузчик,
+        # чтобы поэтапный режим так же подключил их через ATTACH PARTITION
+        attendance_loader = None
+        for i, entry in enumerate(meta["files"]):
+            if entry["partition"] and attendance_loader is None:
+                attendance_loader = create_attendance_loader(conn, None, backpressure)
+                attendance_loader.start()
+            target = entry["partition"] or entry["table"]
+            with open(os.path.join(self._path(key), entry["file"]), encoding="utf-8") as f:
+                cur.copy_expert(_copy_statement(target, entry["columns"], "FROM"), f)
             conn.commit()
-                
-        update_progress(op_special, 100)
-    
-    complete_operation(op_special)
-    update_progress(op_main, 100)
-    complete_operation(op_main)
+            backpressure.maybe_wait()
+            update_progress(op_load, i + 1)
+        if attendance_loader:
+            attendance_loader.finish()
+
+        # Значения SERIAL загружены явно, последовательности нужно сдвинуть
+        reset_serial_sequences(cur, {entry["table"] for entry in meta["files"] if "id" in entry["columns"]})
+        # Сводка в кэш не выгружается: она строится по загруженной посещаемости
+        if ATTENDANCE_ROLLUP:
+            refresh_attendance_rollup(cur)
+        conn.commit()
+        backpressure.close()
+        cur.close()
+
+        if meta.get("manifest"):
+            load_manifest.counts = dict(meta["manifest"]["counts"])
+            load_manifest.checksums = {t: int(v) for t, v in meta["manifest"]["checksums"].items()}
+            load_manifest.save(conn, params=params)
+        complete_operation(op_load)
+        return True
+
+    def store(self, conn, key, params=None):
+        """Выгружает только что сгенерированные таблицы в новую запись кэша."""
+        sources = [(table, None) for table in MANIFEST_COLUMNS if table != "attendance"]
+        sources += [("attendance", name) for name, _, _ in ATTENDANCE_PARTITIONS]
+        op_store = start_operation("Сохранение набора данных в кэш", len(sources))
+
+        path = self._path(key)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        cur = conn.cursor()
+        files = []
+        for i, (table, partition) in enumerate(sources):
+            columns = _cached_columns(cur, table)
+            file_name = f"{partition or table}.copy"
+            with open(os.path.join(tmp_path, file_name), "w", encoding="utf-8") as f:
+                cur.copy_expert(_copy_statement(partition or table, columns, "TO"), f)
+            files.append({"table": table, "partition": partition, "file": file_name, "columns": columns})
+            update_progress(op_store, i + 1)
+        conn.commit()
+        cur.close()
+
+        meta = {
+            "key": key,
+            "seed": GENERATION_SEED,
+            "params": params,
+            "version": DATASET_CACHE_VERSION,
+            "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            "files": files,
+            "manifest": {
+                "counts": load_manifest.counts,
+                "checksums": {t: str(v) for t, v in load_manifest.checksums.items()},
+            } if LOAD_MANIFEST else None,
+        }
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # Запись появляется атомарно: прерванная выгрузка не оставит неполный каталог
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+        complete_operation(op_store)
+        self.evict(keep=key)
+
+    def _entries(self):
+        """Записи кэша как (время последнего использования, размер, ключ), старые первыми."""
+        entries = []
+        for name in os.listdir(self.directory):
+            entry_path = self._path(name)
+            meta_path = os.path.join(entry_path, "meta.json")
+            if not os.path.exists(meta_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_path, f)) for f in os.listdir(entry_path))
+            entries.append((os.path.getmtime(meta_path), size, name))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            shutil.rmtree(self._path(name), ignore_errors=True)
+            total -= size
+            info(f"Кэш наборов данных: удалена запись {name[:12]} ({format_bytes(size)})")
+        info(f"Кэш наборов данных: {format_bytes(total)} из {format_bytes(self.max_bytes)}")
+
+def populate_postgres_cached(conn, params=None):
+    """
+    populate_postgres с кэшем: при совпадении ключа таблицы загружаются из выгрузок,
+    иначе набор генерируется и сохраняется. Без зерна генерации кэш не используется.
+    Возвращает True, если набор загружен из кэша.
+    """
+    params = params or GENERATION_PARAMS
+    if not DATASET_CACHE or GENERATION_SEED is None:
+        if DATASET_CACHE:
+            info("Кэш наборов данных не используется: не задано зерно генерации (GENERATION_SEED)")
+        populate_postgres(conn, params)
+        return False
+
+    cache = DatasetCache()
+    key = cache.key(conn, GENERATION_SEED, params)
+    try:
+        if cache.load(conn, key, params):
+            info(f"Набор данных загружен из кэша: {key[:12]}")
+            return True
+    except Exception as e:
+        conn.rollback()
+        error(f"Ошибка при загрузке из кэша, набор будет сгенерирован заново: {e}")
+        create_postgres_schema(conn)
+
+    populate_postgres(conn, params)
+    try:
+        cache.store(conn, key, params)
+        info(f"Набор данных сохранён в кэш: {key[:12]}")
+    except Exception as e:
+        conn.rollback()
+        error(f"Ошибка при сохранении в кэш: {e}")
+    return False
+
+##########################################################################
+# PostgreSQL: Учётные записи users с bcrypt-хэшами паролей
+##########################################################################
+
+def _hash_passwords(passwords, rounds):
+    """Выполняется в процессе пула: bcrypt-хэши паролей, у каждого своя соль."""
+    bcrypt = lazy_import("bcrypt")
+    return [bcrypt.hashpw(p.encode("utf-8"), bcrypt.gensalt(rounds)).decode("ascii") for p in passwords]
+
+def generate_user_credentials(count):
+    """Логины и пароли учётных записей; при зафиксированном зерне воспроизводимы."""
+    return [(f"{fake.user_name()}{i}", fake.password(length=12)) for i in range(count)]
+
+def hash_passwords(passwords, rounds=USERS_BCRYPT_ROUNDS, workers=USERS_HASH_WORKERS):
+    """Хэширует пароли в пуле из workers процессов; порядок хэшей совпадает с порядком паролей."""
+    op_hash = start_operation(f"Хэширование паролей ({workers} процессов)", len(passwords))
+    chunk = max(1, min(500, len(passwords) // (workers * 4)))
+    chunks = [passwords[i:i + chunk] for i in range(0, len(passwords), chunk)]
+    hashes = [None] * len(chunks)
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_hash_passwords, part, rounds): i for i, part in enumerate(chunks)}
+        for future in as_completed(futures):
+            index = futures[future]
+            hashes[index] = future.result()
+            done += len(chunks[index])
+            update_progress(op_hash, done)
+    complete_operation(op_hash)
+    return [h for part in hashes for h in part]
+
+def _users_cache_path(seed, count, rounds):
+    # format 2: в кэше только (логин, хэш)
+    payload = json.dumps({"seed": seed, "count": count, "rounds": rounds, "format": 2}, sort_keys=True)
+    return os.path.join(USERS_CACHE_DIR, hashlib.sha1(payload.encode("utf-8")).hexdigest() + ".tsv")
+
+def load_users_cache(path):
+    """Учётные записи (логин, хэш) из кэша; None, если записи нет."""
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return [tuple(line.rstrip("\n").split("\t")) for line in f]
+
+def store_users_cache(path, users):
+    """Сохраняет (логин, хэш); пароли не кэшируются – они восстанавливаются по зерну."""
+    os.makedirs(USERS_CACHE_DIR, exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.writelines(f"{username}\t{hashed}\n" for username, hashed in users)
+    os.replace(tmp_path, path)
+
+def populate_users(conn, count=USERS_COUNT):
+    """
+    Заполняет users: логины и пароли генерируются Faker, bcrypt-хэши считаются в пуле
+    процессов, строки загружаются пакетами через insert_rows. При заданном зерне генерации
+    готовые хэши берутся из кэша USERS_CACHE_DIR, а логины и пароли заново выводятся
+    из зерна, поэтому пароли на диск не попадают. Только если задан
+    USERS_CREDENTIALS_PATH, логины и пароли сохраняются в него для нагрузочных тестов.
+    """
+    if count <= 0:
+        info("Учётные записи users не создаются (USERS_COUNT=0)")
+        return
+    if GENERATION_SEED is not None:
+        seed_generators(f"{GENERATION_SEED}:users")
+    cache_path = _users_cache_path(GENERATION_SEED, count, USERS_BCRYPT_ROUNDS) \
+        if GENERATION_SEED is not None else None
+
+    credentials = generate_user_credentials(count)
+    cached = load_users_cache(cache_path) if cache_path else None
+    if cached is not None and [username for username, _ in cached] == [username for username, _ in credentials]:
+        hashes = [hashed for _, hashed in cached]
+        info(f"Хэши паролей {count} учётных записей взяты из кэша")
+    else:
+        started = time.perf_counter()
+        hashes = hash_passwords([password for _, password in credentials])
+        info(f"Хэши паролей {count} учётных записей вычислены за {time.perf_counter() - started:.1f} с")
+        if cache_path:
+            store_users_cache(cache_path, [(username, hashed) for (username, _), hashed in zip(credentials, hashes)])
+    users = [(username, password, hashed) for (username, password), hashed in zip(credentials, hashes)]
+
+    op_users = start_operation("Загрузка учётных записей users", len(users))
+    cur = conn.cursor()
+    cur.execute("TRUNCATE users RESTART IDENTITY;")
+    rows = [(username, hashed) for username, _, hashed in users]
+    for i in range(0, len(rows), 10000):
+        insert_rows(cur, "users", ("username", "hash_password"), rows[i:i + 10000])
+        update_progress(op_users, min(i + 10000, len(rows)))
+    conn.commit()
     cur.close()
+    complete_operation(op_users)
+
+    if USERS_CREDENTIALS_PATH:
+        with open(USERS_CREDENTIALS_PATH, "w", encoding="utf-8") as f:
+            f.write("username,password\n")
+            f.writelines(f"{username},{password}\n" for username, password, _ in users)
+        info(f"Логины и пароли сохранены в {USERS_CREDENTIALS_PATH}")
+
+##########################################################################
+# Компактный каталог сгенерированных сущностей для следующих этапов
+##########################################################################
+
+class StringColumn:
+    """
+    Строковая колонка с повторами (аудитории, названия групп и курсов): уникальные
+    значения хранятся один раз, строки – их номера в array('I').
+    """
+
+    def __init__(self):
+        self.values = []
+        self.codes = array("I")
+        self._lookup = {}
+
+    def append(self, value):
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self._lookup[value] = code
+        self.codes.append(code)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        return self.values[self.codes[i]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+    def nbytes(self):
+        return (self.codes.itemsize * len(self.codes) + sys.getsizeof(self.values) + sys.getsizeof(self._lookup)
+                + sum(sys.getsizeof(v) for v in self.values))
+
+class TextColumn:
+    """
+    Строковая колонка почти без повторов (номера студентов, ФИО): значения в UTF-8
+    подряд в одном bytearray, границы строк – в array('Q'). Словарь уникальных
+    значений здесь занимал бы больше памяти, чем сами строки.
+    """
 
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, value):
+        self.data += value.encode("utf-8")
+        self.offsets.append(len(self.data))
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        return self.data[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def __iter__(self):
+        data, offsets = self.data, self.offsets
+        return (data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1))
+
+    def nbytes(self):
+        return sys.getsizeof(self.data) + self.offsets.itemsize * len(self.offsets)
+
+# Строковые типы колонок каталога: "str" – со словарём значений, "text" – без повторов
+STRING_COLUMNS = {"str": StringColumn, "text": TextColumn}
+
+class CatalogTable:
+    """
+    Таблица каталога: числовые колонки – array заданного типа, строковые – StringColumn
+    (тип "str") или TextColumn (тип "text").
+    """
+
+    def __init__(self, **columns):
+        self.kinds = columns
+        self.columns = {name: STRING_COLUMNS[kind]() if kind in STRING_COLUMNS else array(kind)
+                        for name, kind in columns.items()}
+
+    def append(self, *values):
+        for column, value in zip(self.columns.values(), values):
+            column.append(value)
+
+    def __len__(self):
+        return len(next(iter(self.columns.values())))
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def rows(self, *names):
+        return zip(*(self.columns[name] for name in names))
+
+    def discard(self, column, values):
+        """Удаляет строки, у которых column входит в values (редкая операция, таблица пересобирается)."""
+        values = set(values)
+        index = list(self.columns).index(column)
+        kept = [row for row in self.rows(*self.columns) if row[index] not in values]
+        self.__init__(**self.kinds)
+        for row in kept:
+            self.append(*row)
+
+    def nbytes(self):
+        return sum(col.nbytes() if isinstance(col, (StringColumn, TextColumn)) else col.itemsize * len(col)
+                   for col in self.columns.values())
+
+def _positions_by_id(ids):
+    """array, в котором по id (плотные целые от 1) лежит номер строки; -1 – нет строки."""
+    positions = array("i", [-1]) * ((max(ids) + 1) if len(ids) else 1)
+    for position, row_id in enumerate(ids):
+        positions[row_id] = position
+    return positions
+
+class Catalog:
+    """
+    Сущности, сгенерированные populate_postgres: кафедры, группы, студенты, курсы, лекции
+    и расписание с их связями. Колонки – array, StringColumn и TextColumn, связи – целочисленные id,
+    время занятия – секунды от SEMESTER_START. Этапы Neo4j и Elasticsearch читают
+    каталог вместо повторных полных выборок из PostgreSQL. Если набор данных получен
+    другим путём (кэш, шаблон, шарды), каталог один раз заполняется из PostgreSQL.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.departments = CatalogTable(id="i", name="str")
+        self.groups = CatalogTable(id="i", name="str", id_department="i")
+        self.students = CatalogTable(student_number="text", fullname="text", id_group="i")
+        self.courses = CatalogTable(id="i", name="str", id_department="i")
+        self.lectures = CatalogTable(id="i", name="str", id_course="i", tech_equipment="b")
+        self.schedule = CatalogTable(id="i", id_lecture="i", id_group="i", offset="i", location="str")
+        self.complete = False
+
+    @staticmethod
+    def schedule_offset(moment):
+        return int((moment - SEMESTER_START).total_seconds())
+
+    def add_schedule(self, schedule_id, lecture_id, group_id, moment, location):
+        self.schedule.append(schedule_id, lecture_id, group_id, self.schedule_offset(moment), location)
+
+    def lecture_rows(self):
+        """(id лекции, название, название курса, техоснащение, id кафедры) для каждой лекции."""
+        course_positions = _positions_by_id(self.courses["id"])
+        course_names = self.courses["name"]
+        course_departments = self.courses["id_department"]
+        for lecture_id, name, course_id, tech_equipment in self.lectures.rows("id", "name", "id_course",
+                                                                              "tech_equipment"):
+            position = course_positions[course_id]
+            yield lecture_id, name, course_names[position], bool(tech_equipment), course_departments[position]
+
+    def schedule_rows(self):
+        """(id группы, id лекции, время, аудитория) для каждого занятия."""
+        for group_id, lecture_id, offset, location in self.schedule.rows("id_group", "id_lecture", "offset",
+                                                                         "location"):
+            yield group_id, lecture_id, SEMESTER_START + datetime.timedelta(seconds=offset), location
+
+    def load_from_postgres(self, conn):
+        """Заполняет каталог одной потоковой выборкой на таблицу."""
+        self.reset()
+        op_catalog = start_operation("Загрузка каталога из PostgreSQL", 6)
+        queries = [
+            (self.departments, "SELECT id, name FROM department ORDER BY id;", None),
+            (self.groups, "SELECT id, name, id_department FROM groups ORDER BY id;", None),
+            (self.students, "SELECT student_number, fullname, id_group FROM student ORDER BY student_number;", None),
+            (self.courses, "SELECT id, name, id_department FROM course ORDER BY id;", None),
+            (self.lectures, "SELECT id, name, id_course, tech_equipment::int FROM lecture ORDER BY id;", None),
+            (self.schedule, "SELECT id, id_lecture, id_group, timestamp, location FROM schedule ORDER BY id;",
+             lambda row: row[:3] + (self.schedule_offset(row[3]), row[4])),
+        ]
+        for i, (table, query, convert) in enumerate(queries):
+            # Именованный курсор читает строки порциями, не держа всю выборку в памяти
+            with conn.cursor(name="catalog_load") as cur:
+                cur.itersize = 50000
+                cur.execute(query)
+                for row in cur:
+                    table.append(*(convert(row) if convert else row))
+            update_progress(op_catalog, i + 1)
+        conn.commit()
+        self.complete = True
+        complete_operation(op_catalog)
+
+    def nbytes(self):
+        return sum(table.nbytes() for table in (self.departments, self.groups, self.students,
+                                                 self.courses, self.lectures, self.schedule))
+
+    def summary(self):
+        return (f"Каталог: {len(self.departments)} кафедр, {len(self.groups)} групп, "
+                f"{len(self.students)} студентов, {len(self.lectures)} лекций, "
+                f"{len(self.schedule)} занятий; ~{format_bytes(self.nbytes())} в памяти")
+
+# Каталог текущего набора данных
+catalog = Catalog()
+
+def ensure_catalog(conn):
+    """Каталог текущего набора; если генерация шла не через populate_postgres, читается из PostgreSQL."""
+    if not catalog.complete:
+        catalog.load_from_postgres(conn)
+        info(catalog.summary())
+    return catalog
 
 ##########################################################################
 # Neo4j: Полное заполнение: создаются узлы для кафедр, лекций, групп и студентов;
@@ -864,9 +3774,32 @@ def populate_postgres(conn):
 #  – Student -[BELONGS_TO]-> Group
 ##########################################################################
 
+def _run_unwind(tx, query, rows):
+    tx.run(query, {"rows": rows}).consume()
+
+def create_neo4j_relationships(session, name, query, rows, total):
+    """
+    Создаёт total отношений из итератора rows пакетами по NEO4J_RELATIONSHIP_BATCH строк:
+    каждый пакет – один запрос UNWIND $rows в явной транзакции записи (execute_write
+    повторяет её при временных ошибках), вместо отдельного запроса и автокоммита на
+    каждое отношение. В памяти одновременно только один пакет.
+    """
+    op = start_operation(name, total)
+    rows = iter(rows)
+    done = 0
+    while True:
+        batch = list(islice(rows, NEO4J_RELATIONSHIP_BATCH))
+        if not batch:
+            break
+        session.execute_write(_run_unwind, query, batch)
+        done += len(batch)
+        update_progress(op, done)
+    complete_operation(op)
+    info(f"Создано {done} отношений: {name}")
+
 def populate_neo4j(pg_conn):
     """
-    Полностью переносит данные из PostgreSQL в Neo4j:
+    Полностью переносит данные в Neo4j (из каталога, см. ensure_catalog):
       1. Создаются узлы Department.
       2. Создаются узлы Lecture с отношением к соответствующей кафедре (по данным JOIN lecture+course).
       3. Создаются узлы Group.
@@ -877,22 +3810,21 @@ def populate_neo4j(pg_conn):
            - (Student)-[:BELONGS_TO]->(Group)
     """
     op_neo4j = start_operation("Заполнение Neo4j", 100)
+    entities = ensure_catalog(pg_conn)
     
-    driver = GraphDatabase.driver(NEO4J_URI, auth=NEO4J_AUTH)
+    driver = backends.neo4j_driver()
     with driver.session() as session:
         # Очищаем базу Neo4j
         info("Очистка существующих данных в Neo4j...")
         session.run("MATCH (n) DETACH DELETE n")
+        # Без индексов каждый MATCH при создании отношений просматривает все узлы метки
+        for label, prop in NEO4J_INDEXES:
+            session.run(f"CREATE INDEX {label.lower()}_{prop} IF NOT EXISTS FOR (n:{label}) ON (n.{prop})")
         update_progress(op_neo4j, 10)
         
         # 1. Создаем узлы Department
-        info("Извлечение данных о кафедрах из PostgreSQL...")
-        cur = pg_conn.cursor()
-        cur.execute("SELECT id, name FROM department;")
-        depts = cur.fetchall()
-        cur.close()
-        
-        dept_nodes = [{"id": d[0], "name": d[1], "neo_id": f"neo_dept_{d[0]}"} for d in depts]
+        dept_nodes = [{"id": d_id, "name": name, "neo_id": f"neo_dept_{d_id}"}
+                      for d_id, name in entities.departments.rows("id", "name")]
         session.run(
             "UNWIND $nodes AS node CREATE (d:Department {id: node.id, name: node.name, neo_id: node.neo_id})",
             {"nodes": dept_nodes}
@@ -901,15 +3833,7 @@ def populate_neo4j(pg_conn):
         update_progress(op_neo4j, 30)
         
         # 2. Создаем узлы Lecture и связи ORIGINATES_FROM
-        cur = pg_conn.cursor()
-        cur.execute(
-            """
-            SELECT l.id, l.name, c.id_department
-            FROM lecture l JOIN course c ON l.id_course = c.id;
-            """
-        )
-        lectures = cur.fetchall()
-        cur.close()
+        lectures = [(lec_id, name, dept_id) for lec_id, name, _, _, dept_id in entities.lecture_rows()]
         
         lecture_nodes = [{"id": lec[0], "name": lec[1]} for lec in lectures]
         session.run(
@@ -917,24 +3841,25 @@ def populate_neo4j(pg_conn):
             {"nodes": lecture_nodes}
         )
         
-        lecture_relations_op = start_operation("Создание связей для лекций", len(lectures))
-        for i, lec in enumerate(lectures):
-            lec_id, _, dept_id = lec
-            session.run(
-                "MATCH (l:Lecture {id: $lec_id}), (d:Department {id: $dept_id}) CREATE (l)-[:ORIGINATES_FROM]->(d)",
-                {"lec_id": lec_id, "dept_id": dept_id}
-            )
-            update_progress(lecture_relations_op, i+1)
-        complete_operation(lecture_relations_op)
+        session.run("CALL db.awaitIndexes()").consume()
+        create_neo4j_relationships(
+            session, "Создание связей для лекций",
+            "UNWIND $rows AS row MATCH (l:Lecture {id: row.lec_id}), (d:Department {id: row.dept_id}) "
+            + "CREATE (l)-[:ORIGINATES_FROM]->(d)",
+            ({"lec_id": lec_id, "dept_id": dept_id} for lec_id, _, dept_id in lectures),
+            len(lectures)
+        )
         update_progress(op_neo4j, 50)
         
-        # 3. Создаем узлы Group
+        # 3. Создаем узлы Group. mongo_id нет в каталоге: его заполняет update_postgres_ids,
+        #    и при отдельном запуске этапа neo4j после ids он читается из PostgreSQL
         cur = pg_conn.cursor()
-        cur.execute("SELECT id, name, mongo_id FROM groups;")
-        groups = cur.fetchall()
+        cur.execute("SELECT id, mongo_id FROM groups WHERE mongo_id IS NOT NULL;")
+        mongo_ids = dict(cur.fetchall())
         cur.close()
-        
-        group_nodes = [{"id": g[0], "name": g[1], "mongo_id": g[2]} for g in groups]
+        pg_conn.commit()
+        group_nodes = [{"id": g_id, "name": name, "mongo_id": mongo_ids.get(g_id)}
+                       for g_id, name in entities.groups.rows("id", "name")]
         session.run(
             "UNWIND $nodes AS node CREATE (g:Group {id: node.id, name: node.name, mongo_id: node.mongo_id})",
             {"nodes": group_nodes}
@@ -942,54 +3867,48 @@ def populate_neo4j(pg_conn):
         info(f"Создано {len(group_nodes)} узлов Group")
         update_progress(op_neo4j, 60)
         
-        # 4. Создаем узлы Student и связи BELONGS_TO
-        cur = pg_conn.cursor()
-        cur.execute("SELECT student_number, fullname, redis_key, id_group FROM student;")
-        students = cur.fetchall()
-        cur.close()
-        
-        student_nodes = [{"student_number": s[0], "fullname": s[1], "redis_key": s[2], "id_group": s[3]} for s in students]
+        # 4. Создаем узлы Student и связи BELONGS_TO (пакеты строятся из каталога по мере записи)
+        students = entities.students
+        student_rows = students.rows("student_number", "fullname")
         batch_size = 1000
+        student_batcher = AdaptiveBatcher("Neo4j Student", initial=batch_size, min_size=100, max_size=50000)
         
-        student_batch_op = start_operation("Создание узлов Student", len(student_nodes))
-        for i in range(0, len(student_nodes), batch_size):
-            batch = student_nodes[i:i+batch_size]
-            session.run(
-                "UNWIND $nodes AS node CREATE (st:Student {student_number: node.student_number, fullname: node.fullname, redis_key: node.redis_key})",
-                {"nodes": batch}
-            )
-            update_progress(student_batch_op, min(i+batch_size, len(student_nodes)))
+        student_batch_op = start_operation("Создание узлов Student", len(students))
+        i = 0
+        while i < len(students):
+            batch = [{"student_number": number, "fullname": fullname, "redis_key": f"student:{number}"}
+                     for number, fullname in islice(student_rows, student_batcher.size)]
+            with student_batcher.measure(len(batch), batch[0]):
+                session.run(
+                    "UNWIND $nodes AS node CREATE (st:Student {student_number: node.student_number, fullname: node.fullname, redis_key: node.redis_key})",
+                    {"nodes": batch}
+                ).consume()
+            i += len(batch)
+            update_progress(student_batch_op, i)
         complete_operation(student_batch_op)
+        info(student_batcher.summary())
         
-        student_relations_op = start_operation("Создание связей для студентов", len(student_nodes))
-        for i, s in enumerate(student_nodes):
-            session.run(
-                "MATCH (st:Student {student_number: $student_number}), (g:Group {id: $group_id}) CREATE (st)-[:BELONGS_TO]->(g)",
-                {"student_number": s["student_number"], "group_id": s["id_group"]}
-            )
-            if (i+1) % batch_size == 0 or i+1 == len(student_nodes):
-                update_progress(student_relations_op, i+1)
-        complete_operation(student_relations_op)
+        session.run("CALL db.awaitIndexes()").consume()
+        create_neo4j_relationships(
+            session, "Создание связей для студентов",
+            "UNWIND $rows AS row MATCH (st:Student {student_number: row.student_number}), (g:Group {id: row.group_id}) "
+            + "CREATE (st)-[:BELONGS_TO]->(g)",
+            ({"student_number": number, "group_id": group_id}
+             for number, group_id in students.rows("student_number", "id_group")),
+            len(students)
+        )
         
         # 5. Создаем отношения HAS_SCHEDULE
-        cur = pg_conn.cursor()
-        cur.execute("SELECT id_group, id_lecture, timestamp, location FROM schedule;")
-        schedule_pairs = cur.fetchall()
-        cur.close()
-        
-        schedule_op = start_operation("Создание отношений HAS_SCHEDULE", len(schedule_pairs))
-        for i, (group_id, lecture_id, timestamp, location) in enumerate(schedule_pairs):
-            ts = timestamp.replace(tzinfo=None).isoformat()
-            session.run(
-                "MATCH (g:Group {id: $group_id}), (l:Lecture {id: $lecture_id}) "
-                + "CREATE (g)-[:HAS_SCHEDULE {date: datetime($timestamp), location: $location}]->(l)",
-                {"group_id": group_id, "lecture_id": lecture_id, "timestamp": ts, "location": location}
-            )
-            if (i+1) % 100 == 0 or i+1 == len(schedule_pairs):
-                update_progress(schedule_op, i+1)
-        complete_operation(schedule_op)
+        create_neo4j_relationships(
+            session, "Создание отношений HAS_SCHEDULE",
+            "UNWIND $rows AS row MATCH (g:Group {id: row.group_id}), (l:Lecture {id: row.lecture_id}) "
+            + "CREATE (g)-[:HAS_SCHEDULE {date: datetime(row.timestamp), location: row.location}]->(l)",
+            ({"group_id": group_id, "lecture_id": lecture_id,
+              "timestamp": timestamp.replace(tzinfo=None).isoformat(), "location": location}
+             for group_id, lecture_id, timestamp, location in entities.schedule_rows()),
+            len(entities.schedule)
+        )
     
-    driver.close()
     update_progress(op_neo4j, 100)
     complete_operation(op_neo4j)
 
@@ -999,27 +3918,28 @@ def populate_neo4j(pg_conn):
 
 def populate_elasticsearch(pg_conn):
     """
-    Извлекает данные по лекциям из PostgreSQL и индексирует их в Elasticsearch.
+    Берёт лекции из каталога (см. ensure_catalog) и индексирует их в Elasticsearch.
     Каждый документ включает id, имя лекции, подробное описание и дату создания.
     """
     op_elastic = start_operation("Заполнение Elasticsearch", 100)
     
     # Подключаемся к Elasticsearch
     info("Подключение к Elasticsearch...")
-    es = Elasticsearch(ES_HOSTS)
+    es = backends.elasticsearch_client()
+    helpers = lazy_import("elasticsearch.helpers")
     update_progress(op_elastic, 10)
     
-    # Получаем лекции с информацией о курсе
-    info("Извлечение данных о лекциях из PostgreSQL...")
+    # Лекции с информацией о курсе из каталога; время создания каждой лекции задаёт
+    # база (DEFAULT NOW()), поэтому оно читается отдельно – одна выборка по первичному ключу
+    entities = ensure_catalog(pg_conn)
     cur = pg_conn.cursor()
-    cur.execute("""
-        SELECT l.id, l.name, c.name as course_name, l.tech_equipment, l.created_at 
-        FROM lecture l
-        JOIN course c ON l.id_course = c.id
-    """)
-    lectures = cur.fetchall()
-    info(f"Получено {len(lectures)} лекций")
+    cur.execute("SELECT id, created_at FROM lecture;")
+    created_at_by_id = dict(cur.fetchall())
     cur.close()
+    pg_conn.commit()
+    lectures = [(lec_id, name, course_name, tech_equipment, created_at_by_id[lec_id])
+                for lec_id, name, course_name, tech_equipment, _ in entities.lecture_rows()]
+    info(f"Получено {len(lectures)} лекций")
     update_progress(op_elastic, 20)
 
     # Удаляем индекс, если существует, и создаем новый
@@ -1046,48 +3966,21 @@ def populate_elasticsearch(pg_conn):
         },
         ignore=400
     )
-    update_progress(op_elastic, 30)
-
-    # Генерация тематических описаний для лекций на основе их названий
-    info("Подготовка шаблонов описаний лекций...")
-    lecture_descriptions = {
-        "Docker": "Docker - успешная технология контейнеризации, которая позволяет упаковывать приложения и их зависимости в изолированные контейнеры. Это делает их переносимыми и согласованными в любой среде. Контейнеры запускаются в изолированном пространстве, совместно используя ядро операционной системы.",
-        "Kubernetes": "Kubernetes - это платформа для управления контейнерными приложениями в масштабе. Она автоматизирует управление и развертывание, обеспечивает высокую доступность, масштабируемость и управление ресурсами.",
-        "CI/CD": "Continuous Integration и Continuous Delivery - это методологии разработки, которые обеспечивают автоматическую сборку, тестирование и доставку кода в рабочую среду, что позволяет команде разработчиков работать быстрее и качественнее.",
-        "Python": "Python - один из самых популярных языков программирования, известный своей простотой, читаемостью и обширной экосистемой библиотек. Широко используется в анализе данных, машинном обучении, веб-разработке и автоматизации.",
-        "DevOps": "DevOps - это набор практик, которые объединяют разработку программного обеспечения и IT-операции с целью сокращения жизненного цикла системы и обеспечения непрерывной поставки высококачественного программного обеспечения.",
-        "Database": "Базы данных - это организованные коллекции структурированных данных. Они обеспечивают эффективное хранение, поиск, обновление и управление информацией в приложениях и информационных системах.",
-        "Security": "Безопасность и защита данных - важнейший аспект современных информационных систем. Включает аутентификацию, авторизацию, шифрование, защиту от атак и уязвимостей, соответствие нормативным требованиям.",
-        "API": "API (интерфейс программирования приложений) определяет взаимодействие между программными компонентами. RESTful API строится на принципах REST и использует HTTP методы для CRUD операций над ресурсами.",
-        "Architecture": "Архитектура программного обеспечения - это высокоуровневая структура системы, определяющая ее компоненты, их взаимодействие и ограничения. Включает принципы проектирования, паттерны и стили архитектуры.",
-        "Algorithm": "Алгоритмы - это последовательности шагов для решения вычислительных задач. Правильный выбор алгоритма существенно влияет на эффективность программы, особенно при работе с большими объемами данных."
-    }
     update_progress(op_elastic, 40)
 
     # Индексируем лекции
     info(f"Индексация {len(lectures)} лекций в Elasticsearch...")
     
     lecture_index_op = start_operation("Индексация лекций", len(lectures))
+    es_batcher = AdaptiveBatcher("Elasticsearch lectures", initial=500, min_size=50, max_size=10000)
     
+    actions = []
+    indexed = 0
     for i, lec in enumerate(lectures):
         lec_id, name, course_name, tech_equipment, created_at = lec
         
         # Генерируем осмысленное описание на основе ключевых слов в названии лекции
-        description = ""
-        for keyword, template in lecture_descriptions.items():
-            if keyword in name or keyword in course_name:
-                description = template
-                break
-        
-        # Если подходящего шаблона не найдено, используем общее описание с элементами из названия
-        if not description:
-            description = f"Лекция посвящена теме '{name}' в рамках курса '{course_name}'. "
-            description += "Рассматриваются основные концепции, методологии и практические аспекты применения. "
-            description += "Студенты получат теоретические знания и практические навыки в данной области."
-        
-        # Если описание слишком длинное, обрезаем его
-        if len(description) > 200:
-            description = description[:197] + "..."
+        description = lecture_description(name, course_name)
         
         doc = {
             "id": lec_id,
@@ -1098,12 +3991,17 @@ def populate_elasticsearch(pg_conn):
             "created_at": created_at.strftime("%Y-%m-%d %H:%M:%S"),
             "lecture_id": lec_id
         }
-        es.index(index="lectures", id=lec_id, body=doc)
+        actions.append({"_index": "lectures", "_id": lec_id, "_source": doc})
         
-        if (i+1) % 50 == 0 or i+1 == len(lectures):
-            update_progress(lecture_index_op, i+1)
-            update_progress(op_elastic, 40 + int(60 * (i+1) / len(lectures)))
+        if len(actions) >= es_batcher.size or i+1 == len(lectures):
+            with es_batcher.measure(len(actions), doc):
+                helpers.bulk(es, actions)
+            indexed += len(actions)
+            actions = []
+            update_progress(lecture_index_op, indexed)
+            update_progress(op_elastic, 40 + int(60 * indexed / len(lectures)))
     
+    info(es_batcher.summary())
     complete_operation(lecture_index_op)
     update_progress(op_elastic, 100)
     complete_operation(op_elastic)
@@ -1158,9 +4056,44 @@ def update_postgres_ids(pg_conn):
 # Основной запуск: заполнение всех БД и обновление id в Postgres
 ##########################################################################
 
+def await_backends(names):
+    """
+    Ждёт готовности баз names; базы проверяются одновременно, поэтому ожидание длится
+    до готовности самой медленной. Время до готовности каждой базы попадает в сводку.
+    Возвращает список неготовых баз.
+    """
+    results = backends.wait_for_backends(names)
+    for name, result in results.items():
+        (info if result["ready"] else error)(f"Готовность {backends.describe_readiness(name, result)}")
+        record_operation(f"Готовность {name}", result["started_at"], result["finished_at"])
+    return [name for name, result in results.items() if not result["ready"]]
+
 def main():
+    generation_started = time.time()
     info("=== Начало процесса генерации данных ===")
+    memory_metrics = enable_stage_memory_metrics()
+
+    if GENERATION_SEED is not None:
+        info(f"Зерно генерации: {GENERATION_SEED}")
+        seed_generators(GENERATION_SEED)
+
+    # Шарду нужен только PostgreSQL; без PostgreSQL запуск не имеет смысла
+    if "postgres" in await_backends(["postgres"] if GENERATION_ROLE == "shard" else ["postgres", "elasticsearch"]):
+        return
     
+    # Восстановление готового набора данных из шаблонной базы
+    key = dataset_key(GENERATION_SEED, GENERATION_PARAMS)
+    restored = False
+    template_mode = DATASET_TEMPLATE
+    if template_mode != "off" and GENERATION_SEED is None:
+        info("Снимки наборов данных не используются: не задано зерно генерации (GENERATION_SEED)")
+        template_mode = "off"
+    if template_mode == "reuse":
+        try:
+            restored = restore_dataset_template(key)
+        except Exception as e:
+            error(f"Ошибка при восстановлении из шаблона: {e}")
+
     # Подключение к PostgreSQL
     try:
         info("Подключение к PostgreSQL...")
@@ -1170,38 +4103,87 @@ def main():
         error(f"Ошибка подключения к PostgreSQL: {e}")
         return
 
-    # Создаем схему и заполняем PostgreSQL
-    try:
-        info("=== Этап 1: Создание и заполнение PostgreSQL ===")
-        create_postgres_schema(pg_conn)
-        populate_postgres(pg_conn)
-    except Exception as e:
-        error(f"Ошибка при создании и заполнении PostgreSQL: {e}")
+    # Шард только генерирует свои кафедры; остальные этапы выполняет координатор
+    if GENERATION_ROLE == "shard":
+        try:
+            run_generation_shard(pg_conn)
+        except Exception as e:
+            error(f"Ошибка при генерации шарда {SHARD_INDEX + 1}/{SHARD_COUNT}: {e}")
         pg_conn.close()
+        report_import_times()
+        report_stage_memory(memory_metrics)
+        show_summary()
         return
 
-    # Выводим количество записей в таблицах для контроля
-    info("Проверка количества созданных записей в PostgreSQL:")
-    check_tables = [
-        "university", "institute", "department", "groups", 
-        "student", "course", "lecture", "schedule", "attendance"
-    ]
-    
-    op_check = start_operation("Проверка количества записей", len(check_tables))
-    
-    cur = pg_conn.cursor()
+    stage_metrics = enable_stage_db_metrics()
+
+    # Оценка объёма до генерации: отказ, если не хватит места или памяти
+    if PREFLIGHT and not restored:
+        try:
+            info("=== Предварительная оценка запуска ===")
+            _, fits = preflight_check()
+        except Exception as e:
+            pg_conn.rollback()
+            error(f"Ошибка при предварительной оценке: {e}")
+            fits = True
+        if not fits and not PREFLIGHT_FORCE:
+            error("Генерация не запущена: ресурсов недостаточно (PREFLIGHT_FORCE=1 – запустить всё равно)")
+            pg_conn.close()
+            return
+
+    if restored:
+        info("=== Этапы 1-2 пропущены: набор данных восстановлен из шаблона ===")
+    else:
+        # Создаем схему и заполняем PostgreSQL
+        try:
+            info("=== Этап 1: Создание и заполнение PostgreSQL ===")
+            load_started = time.perf_counter()
+            start_lsn = current_wal_lsn(pg_conn)
+            if GENERATION_ROLE == "coordinator":
+                # Шарды пишут напрямую в общие партиции attendance
+                create_postgres_schema(pg_conn, ingest_mode="direct")
+                populate_postgres_coordinated(pg_conn)
+                from_cache = False
+            else:
+                create_postgres_schema(pg_conn)
+                from_cache = populate_postgres_cached(pg_conn)
+        except Exception as e:
+            error(f"Ошибка при создании и заполнении PostgreSQL: {e}")
+            pg_conn.close()
+            return
+
+        # Индексы и статистика строятся после загрузки, чтобы вставки не тратили время на их поддержку
+        try:
+            info("=== Этап 2: Построение индексов и сбор статистики ===")
+            build_postgres_indexes(pg_conn)
+        except Exception as e:
+            pg_conn.rollback()
+            error(f"Ошибка при построении индексов: {e}")
+
+        # Замеры сгенерированного (не взятого из кэша) набора уточняют следующие оценки
+        if not from_cache:
+            try:
+                record_preflight_measurements(pg_conn, start_lsn, time.perf_counter() - load_started)
+            except Exception as e:
+                pg_conn.rollback()
+                error(f"Ошибка при сохранении замеров запуска: {e}")
+
+        try:
+            info("=== Этап 3: Заполнение учётных записей users ===")
+            populate_users(pg_conn)
+        except Exception as e:
+            pg_conn.rollback()
+            error(f"Ошибка при заполнении users: {e}")
+
+    # Сверяем загрузку с манифестом (по оценкам каталога, без полного сканирования)
+    info("Проверка созданных записей в PostgreSQL по манифесту загрузки:")
     total_records = 0
-    
-    for i, tbl in enumerate(check_tables):
-        cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(tbl)))
-        count = cur.fetchone()[0]
-        total_records += count
-        info(f"Таблица {tbl}: {count} записей")
-        update_progress(op_check, i+1)
-    
-    cur.close()
-    complete_operation(op_check)
-    info(f"Всего в PostgreSQL создано {total_records} записей")
+    try:
+        total_records, _ = verify_load(pg_conn)
+        info(f"Всего в PostgreSQL создано {total_records} записей")
+    except Exception as e:
+        pg_conn.rollback()
+        error(f"Ошибка при проверке загрузки: {e}")
 
     # Заполнение внешних БД
     try:
@@ -1217,7 +4199,25 @@ def main():
     except Exception as e:
         error(f"Ошибка при обновлении идентификаторов: {e}")
 
+    # Генерация завершена только тогда, когда изменения дошли до Debezium
+    try:
+        info("=== Этап 7: Ожидание выгрузки слота репликации ===")
+        wait_for_cdc_drain(generation_started)
+    except Exception as e:
+        error(f"Ошибка при ожидании выгрузки слота репликации: {e}")
+
+    if stage_metrics:
+        stage_metrics.close()
     pg_conn.close()
+    backends.close_clients()
+
+    # Снимок сохраняется последним: для копирования базы все сеансы к ней завершаются
+    if template_mode in ("save", "reuse") and not restored:
+        try:
+            info("=== Этап 8: Сохранение снимка набора данных ===")
+            save_dataset_template(key, GENERATION_PARAMS)
+        except Exception as e:
+            error(f"Ошибка при сохранении снимка: {e}")
     
     info("=== Процесс генерации данных завершен ===")
     
@@ -1228,7 +4228,159 @@ def main():
         info(f"ВНИМАНИЕ! Сгенерировано менее 30000 записей ({total_records})")
         
     # Показываем финальную сводку
+    report_import_times()
+    report_stage_memory(memory_metrics)
+    show_summary()
+
+##########################################################################
+# Запуск выбранных этапов против существующей базы
+##########################################################################
+
+# Этапы в порядке выполнения и этапы, данные которых им нужны
+STAGES = {
+    "schema": (),
+    "postgres": ("schema",),
+    "indexes": ("postgres",),
+    "users": ("schema",),
+    "verify": ("postgres",),
+    "neo4j": ("postgres",),
+    "elasticsearch": ("postgres",),
+    "ids": ("postgres",),
+}
+# Этапы полного запуска main()
+DEFAULT_STAGES = ("schema", "postgres", "indexes", "users", "verify", "elasticsearch", "ids")
+
+def _table_exists(cur, table):
+    cur.execute("SELECT to_regclass(%s) IS NOT NULL;", (table,))
+    return cur.fetchone()[0]
+
+def _table_has_rows(cur, table):
+    cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {});").format(sql.Identifier(table)))
+    return cur.fetchone()[0]
+
+def stage_dependency_problems(cur, stage, selected):
+    """
+    Почему этап stage нельзя выполнить против текущей базы, если вместе с ним запускаются
+    этапы selected (пустой список – можно). Зависимость, запущенная в этом же вызове,
+    считается выполненной.
+    """
+    problems = []
+    for dependency in STAGES[stage]:
+        if dependency in selected:
+            continue
+        if not all(_table_exists(cur, t) for t in MANIFEST_COLUMNS):
+            problems.append("схема не создана (нужен этап schema)")
+        elif dependency == "schema" and stage == "postgres" and _table_has_rows(cur, "lecture"):
+            problems.append("таблицы уже заполнены (добавьте этап schema, чтобы пересоздать их)")
+        elif dependency == "postgres" and not _table_has_rows(cur, "lecture"):
+            problems.append("PostgreSQL не заполнен (нужен этап postgres)")
+    if stage == "verify" and "postgres" not in selected and not _table_exists(cur, "load_manifest"):
+        problems.append("нет манифеста загрузки load_manifest (LOAD_MANIFEST=0 при генерации?)")
+    return problems
+
+def _run_stage(conn, stage):
+    if stage == "schema":
+        create_postgres_schema(conn)
+    elif stage == "postgres":
+        populate_postgres_cached(conn)
+    elif stage == "indexes":
+        build_postgres_indexes(conn)
+    elif stage == "users":
+        populate_users(conn)
+    elif stage == "verify":
+        total_records, ok = verify_load(conn, full_scan=VERIFY_FULL_SCAN)
+        info(f"Всего в PostgreSQL {total_records} записей по манифесту")
+        if not ok:
+            raise RuntimeError("данные не совпадают с манифестом")
+    elif stage == "neo4j":
+        populate_neo4j(conn)
+    elif stage == "elasticsearch":
+        populate_elasticsearch(conn)
+    elif stage == "ids":
+        update_postgres_ids(conn)
+
+def run_stages(stages, dry_run=False):
+    """
+    Выполняет выбранные этапы в порядке STAGES. Перед запуском проверяются зависимости:
+    данные, которые этап читает, должны быть в базе или создаваться в этом же запуске.
+    При dry_run выводится только план. Возвращает код завершения процесса.
+    """
+    selected = [stage for stage in STAGES if stage in stages]
+    if GENERATION_SEED is not None:
+        seed_generators(GENERATION_SEED)
+    memory_metrics = None if dry_run else enable_stage_memory_metrics()
+
+    needed = ["postgres"] + [stage for stage in ("neo4j", "elasticsearch") if stage in selected]
+    if "postgres" in await_backends(needed):
+        return 1
+
+    try:
+        conn = psycopg2.connect(**PG_CONN_PARAMS)
+    except Exception as e:
+        error(f"Ошибка подключения к PostgreSQL: {e}")
+        return 1
+
+    cur = conn.cursor()
+    problems = {stage: stage_dependency_problems(cur, stage, selected) for stage in selected}
+    conn.commit()
+    cur.close()
+
+    info(f"План запуска: {', '.join(selected)}")
+    for stage in selected:
+        dependencies = ", ".join(STAGES[stage]) or "нет"
+        status = "; ".join(problems[stage]) if problems[stage] else "зависимости выполнены"
+        info(f"  {stage:<14} зависит от: {dependencies:<10} {status}")
+    blocked = [stage for stage in selected if problems[stage]]
+    if blocked:
+        error(f"Этапы не могут быть выполнены: {', '.join(blocked)}")
+        conn.close()
+        return 1
+    if dry_run:
+        info("Пробный запуск (--dry-run): этапы не выполнялись")
+        conn.close()
+        return 0
+
+    exit_code = 0
+    for stage in selected:
+        info(f"=== Этап {stage} ===")
+        try:
+            _run_stage(conn, stage)
+        except Exception as e:
+            conn.rollback()
+            error(f"Ошибка на этапе {stage}: {e}")
+            exit_code = 1
+            break
+    conn.close()
+    backends.close_clients()
+    report_import_times()
+    report_stage_memory(memory_metrics)
     show_summary()
+    return exit_code
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Генерация тестовых данных. Без --stages выполняется полный запуск.")
+    parser.add_argument("--stages", default=None,
+                        help=f"этапы через запятую: {','.join(STAGES)} (выполняются в этом порядке)")
+    parser.add_argument("--dry-run", action="store_true", help="показать план и проверку зависимостей")
+    parser.add_argument("--profile", action="store_true", default=PROFILE,
+                        help=f"профилировать этапы; pstats и collapsed-стеки сохраняются в {PROFILE_DIR}")
+    return parser.parse_args()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    args = parse_args()
+    stage_profiler = enable_stage_profiling() if args.profile and not args.dry_run else None
+    exit_code = 0
+    try:
+        if args.stages is None and not args.dry_run:
+            main()
+        else:
+            stages = [s for s in (args.stages or ",".join(DEFAULT_STAGES)).split(",") if s]
+            unknown = [s for s in stages if s not in STAGES]
+            if unknown:
+                sys.exit(f"Неизвестные этапы: {', '.join(unknown)}. Доступны: {', '.join(STAGES)}")
+            exit_code = run_stages(stages, args.dry_run)
+    finally:
+        if stage_profiler:
+            stage_profiler.save_summary()
+    sys.exit(exit_code)
@@ -93,6 +93,8 @@ class TerminalVisualizer:
         self.start_time = time.time()
         self.operation_stats = {}
         self.max_operation_lines = 0
+        self.start_hooks = []
+        self.complete_hooks = []
 
     def _get_terminal_width(self):
         try:
@@ -133,10 +135,37 @@ class TerminalVisualizer:
                 "end_time": None,
                 "items_processed": 0
             }
+            for hook in self.start_hooks:
+                self._call_hook(hook, operation_name)
 
         self._render()
         return operation_name
 
+    def add_operation_hooks(self, on_start=None, on_complete=None):
+        """
+        Регистрирует функции, вызываемые при старте и завершении операции.
+        on_complete может вернуть {"columns": {заголовок: значение}, "details": [строки]} –
+        эти метрики попадут в итоговую сводку.
+        """
+        if on_start:
+            self.start_hooks.append(on_start)
+        if on_complete:
+            self.complete_hooks.append(on_complete)
+
+    def remove_operation_hooks(self, on_start=None, on_complete=None):
+        """Отменяет регистрацию функций, добавленных add_operation_hooks."""
+        if on_start in self.start_hooks:
+            self.start_hooks.remove(on_start)
+        if on_complete in self.complete_hooks:
+            self.complete_hooks.remove(on_complete)
+
+    def _call_hook(self, hook, operation_name):
+        try:
+            return hook(operation_name)
+        except Exception as e:
+            self.log_info(f"Ошибка сбора метрик для '{operation_name}': {e}")
+            return None
+
     def update_progress(self, operation=None, current=None, total=None, increment=None):
         if operation is None:
             return
@@ -173,6 +202,12 @@ class TerminalVisualizer:
         op["progress_bar"].update(op["progress_bar"].total)
         op["type"] = OperationType.SUCCESS if success else OperationType.WARNING
         self.operation_stats[operation]["end_time"] = op["end_time"]
+        for hook in self.complete_hooks:
+            metrics = self._call_hook(hook, operation)
+            if metrics:
+                stored = self.operation_stats[operation].setdefault("metrics", {"columns": {}, "details": []})
+                stored["columns"].update(metrics.get("columns", {}))
+                stored["details"].extend(metrics.get("details", []))
         self._render()
 
     def log_info(self, message):
@@ -185,6 +220,34 @@ class TerminalVisualizer:
         self.operations_order.append(operation_id)
         self._render()
 
+    def log_error(self, message):
+        operation_id = f"ERROR:{time.time()}"
+        self.operations[operation_id] = {
+            "type": OperationType.ERROR,
+            "message": message,
+            "time": time.time()
+        }
+        self.operations_order.append(operation_id)
+        self._render()
+
+    def record_operation(self, operation_name, start_time, end_time, items_processed=0):
+        """Регистрирует уже завершённую операцию (например, выполненную в другом потоке)."""
+        self.operations[operation_name] = {
+            "type": OperationType.SUCCESS,
+            "progress_bar": ProgressBar(total=items_processed, prefix=operation_name, bar_length=20),
+            "start_time": start_time,
+            "end_time": end_time,
+            "items_processed": items_processed
+        }
+        self.operations_order.append(operation_name)
+        self.operation_stats[operation_name] = {
+            "start_time": start_time,
+            "total": items_processed,
+            "end_time": end_time,
+            "items_processed": items_processed
+        }
+        self._render()
+
     def _clear_previous_output(self):
         if self.last_lines_count > 0:
             sys.stdout.write(f"\033[{self.last_lines_count}A\033[J")
@@ -227,7 +290,7 @@ class TerminalVisualizer:
                 duration = op["end_time"] - op["start_time"]
                 lines.append(f"{Colors.GREEN}✓ {op_name[:col1_width]}{Colors.RESET} {Colors.DIM}Completed in {duration:.2f}s ({op['items_processed']} items){Colors.RESET}")
             elif op["type"] == OperationType.ERROR:
-                lines.append(f"{Colors.RED}✗ {op_name[:col1_width]}{Colors.RESET} {Colors.DIM}{op['message']}{Colors.RESET}")
+                lines.append(f"{Colors.RED}✗ ERROR:{Colors.RESET} {op['message']}")
 
         # Fill remaining lines
         while len(lines) < self.max_operation_lines:
@@ -289,6 +352,8 @@ class TerminalVisualizer:
             )
             lines.append(" | ".join(line))
 
+        lines += self._render_metrics()
+
         # Footer
         lines.append(f"{Colors.DIM}{'=' * self.terminal_width}{Colors.RESET}")
         lines.append(f"{Colors.BOLD}Total time:{Colors.RESET} {time.strftime('%H:%M:%S', time.gmtime(total_time))} "
@@ -297,6 +362,32 @@ class TerminalVisualizer:
 
         print("\n".join(lines))
 
+    def _render_metrics(self):
+        """Таблица дополнительных метрик, собранных хуками завершения операций."""
+        measured = [(name, stats["metrics"]) for name, stats in self.operation_stats.items()
+                    if stats.get("metrics")]
+        if not measured:
+            return []
+
+        columns = []
+        for _, metrics in measured:
+            for column in metrics["columns"]:
+                if column not in columns:
+                    columns.append(column)
+
+        headers = [f"{'Operation':<30}"] + [f"{column:>12}" for column in columns]
+        lines = [
+            f"{Colors.DIM}{'-' * self.terminal_width}{Colors.RESET}",
+            f"{Colors.BOLD}{' | '.join(headers)}{Colors.RESET}",
+            f"{Colors.DIM}{'-' * self.terminal_width}{Colors.RESET}"
+        ]
+        for name, metrics in measured:
+            values = [f"{str(metrics['columns'].get(c, '')):>12}" for c in columns]
+            lines.append(" | ".join([f"{name[:30]:<30}"] + values))
+            for detail in metrics["details"]:
+                lines.append(f"{Colors.DIM}    {detail[:self.terminal_width - 4]}{Colors.RESET}")
+        return lines
+
 # Глобальный объект визуализатора
 visualizer = TerminalVisualizer()
 
@@ -304,6 +395,9 @@ visualizer = TerminalVisualizer()
 def info(message):
     visualizer.log_info(message)
 
+def error(message):
+    visualizer.log_error(message)
+
 def start_operation(name, total=100):
     return visualizer.start_operation(name, OperationType.PROGRESS, total)
 
@@ -313,5 +407,14 @@ def update_progress(operation=None, current=None, total=None, increment=None):
 def complete_operation(operation=None, success=True):
     visualizer.complete_operation(operation, success)
 
+def record_operation(name, start_time, end_time, items_processed=0):
+    visualizer.record_operation(name, start_time, end_time, items_processed)
+
+def add_operation_hooks(on_start=None, on_complete=None):
+    visualizer.add_operation_hooks(on_start, on_complete)
+
+def remove_operation_hooks(on_start=None, on_complete=None):
+    visualizer.remove_operation_hooks(on_start, on_complete)
+
 def show_summary():
     visualizer.show_summary()
\ No newline at end of file
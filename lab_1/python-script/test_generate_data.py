@@ -0,0 +1,191 @@
+"""
+Проверки чистых функций generate_data.py, не требующие баз данных:
+
+    python -m pytest test_generate_data.py
+
+Сверка манифеста загрузки опирается на то, что _manifest_value даёт ровно тот же текст,
+что и ::text в PostgreSQL; ожидаемые строки ниже – вывод PostgreSQL для тех же значений.
+"""
+import datetime
+import hashlib
+from array import array
+
+import pytest
+
+import generate_data as gd
+
+
+def pg_checksum(text):
+    """То же, что ('x' || substr(md5(text), 1, 16))::bit(64)::bigint в PostgreSQL."""
+    value = int(hashlib.md5(text.encode("utf-8")).hexdigest()[:16], 16)
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+##########################################################################
+# Текстовое представление значений и контрольные суммы строк
+##########################################################################
+
+@pytest.mark.parametrize("value, pg_text", [
+    (None, ""),                                                  # COALESCE(NULL::text, '')
+    (True, "true"),                                              # true::text
+    (False, "false"),
+    (42, "42"),
+    ("Иванов Иван", "Иванов Иван"),
+    (datetime.datetime(2023, 10, 11, 14, 0), "2023-10-11 14:00:00"),
+    (datetime.datetime(2023, 10, 11, 14, 0, 0, 500000), "2023-10-11 14:00:00.5"),
+    (datetime.datetime(2023, 10, 11, 14, 0, 0, 123456), "2023-10-11 14:00:00.123456"),
+    (datetime.datetime(2023, 10, 11, 14, 0, 0, 120), "2023-10-11 14:00:00.00012"),
+    (datetime.date(2023, 10, 9), "2023-10-09"),
+    ([1, 2, 3], "{1,2,3}"),                                      # ARRAY[1,2,3]::text
+    ([], "{}"),
+    (["s1", "a b", None, "", "NULL", 'q"\\'],                    # text[]
+     '{s1,"a b",NULL,"","NULL","q\\"\\\\"}'),
+    ([True, False], "{t,f}"),                                    # boolean[]
+    ("0110", "0110"),                                            # B'0110'::bit varying::text
+])
+def test_manifest_value_matches_postgres_text(value, pg_text):
+    assert gd._manifest_value(value) == pg_text
+
+
+@pytest.mark.parametrize("value, copy_text", [
+    (None, "\\N"),
+    (["s1", "s2"], "{s1,s2}"),
+    # Литерал массива {"a b",NULL,"",",","q\"\\"}, обратные косые черты удвоены для COPY
+    (["a b", None, "", ",", 'q"\\'], '{"a b",NULL,"",",","q\\\\"\\\\\\\\"}'),
+    ("x\ty", "x\\ty"),
+])
+def test_format_copy_value(value, copy_text):
+    assert gd.format_copy_value(value) == copy_text
+
+
+def test_row_checksum_matches_postgres():
+    # SELECT ('x' || substr(md5(concat_ws('|', '42', 'Иванов Иван', '2023-10-11 14:00:00.5',
+    #         '2023-10-09', 'true', '')), 1, 16))::bit(64)::bigint;
+    row = (42, "Иванов Иван", datetime.datetime(2023, 10, 11, 14, 0, 0, 500000),
+           datetime.date(2023, 10, 9), True, None)
+    assert gd.row_checksum(row) == -7513075253141947096
+    assert gd.row_checksum(row) == pg_checksum("42|Иванов Иван|2023-10-11 14:00:00.5|2023-10-09|true|")
+
+    row = (7, [1, 2, 3], ["a b", None, "c"], "0110", False)
+    assert gd.row_checksum(row) == 7914197879420842374
+    assert gd.row_checksum(row) == pg_checksum('7|{1,2,3}|{"a b",NULL,c}|0110|false')
+
+##########################################################################
+# Планируемые количества строк и id шардов
+##########################################################################
+
+SMALL_PARAMS = {
+    "num_universities": 2,
+    "institutes_per_univ": 2,
+    "departments_per_inst": 3,
+    "groups_per_department": 4,
+    "students_per_group": 5,
+    "courses_per_department": 3,
+    "lectures_per_course": 2,
+}
+
+
+def all_ids(params):
+    """Все id, которые выдаёт ShardIds при генерации по кафедрам."""
+    ids = gd.ShardIds(params)
+    result = {"groups": [], "student": [], "course": [], "lecture": [], "schedule": []}
+    for dept in range(gd.total_departments(params)):
+        for g in range(ids.groups):
+            result["groups"].append(ids.group(dept, g))
+            result["student"].extend(ids.student(dept, g, s) for s in range(ids.students))
+        for c in range(ids.courses):
+            result["course"].append(ids.course(dept, c))
+            for l in range(ids.lectures):
+                lecture_id = ids.lecture(dept, c, l)
+                result["lecture"].append(lecture_id)
+                result["schedule"].extend(ids.schedule(lecture_id, g, w)
+                                          for g in range(ids.groups) for w in range(ids.weeks))
+    return result
+
+
+def test_plan_row_counts():
+    counts = gd.plan_row_counts(SMALL_PARAMS)
+    assert list(counts) == list(gd.MANIFEST_COLUMNS)
+    main_schedules, special = gd.planned_sessions(SMALL_PARAMS)
+    departments = 2 * 2 * 3
+    assert counts["university"] == (2, 2)
+    assert counts["department"] == (departments, departments)
+    assert departments == gd.total_departments(SMALL_PARAMS)
+    assert counts["groups"] == (departments * 4, departments * 4)
+    assert counts["student"] == (departments * 4 * 5, departments * 4 * 5)
+    assert counts["schedule"] == (main_schedules + special, main_schedules + special)
+    low, high = counts["attendance"]
+    assert low <= high
+    assert low == main_schedules * 5 + (5 if special else 0)
+    assert high == main_schedules * 5 + 5 * special
+
+
+def test_plan_row_counts_match_shard_ids():
+    counts = gd.plan_row_counts(SMALL_PARAMS)
+    main_schedules, _ = gd.planned_sessions(SMALL_PARAMS)
+    ids = all_ids(SMALL_PARAMS)
+    for table in ("groups", "student", "course", "lecture"):
+        assert len(ids[table]) == counts[table][0]
+    assert len(ids["schedule"]) == main_schedules
+
+
+def test_shard_ids_are_unique_and_dense():
+    # Плотные id от 1 без пропусков: шарды не пересекаются, а последовательности
+    # после загрузки продолжаются с max(id) + 1
+    for table, values in all_ids(SMALL_PARAMS).items():
+        assert sorted(values) == list(range(1, len(values) + 1)), table
+
+
+def test_shard_departments_cover_all_departments():
+    total = gd.total_departments(SMALL_PARAMS)
+    for shard_count in (1, 2, 5, total):
+        covered = [dept for shard in range(shard_count)
+                   for dept in gd.shard_departments(shard, shard_count, SMALL_PARAMS)]
+        assert covered == list(range(total))
+
+##########################################################################
+# Сводка посещаемости
+##########################################################################
+
+def test_rollup_period_week(monkeypatch):
+    monkeypatch.setattr(gd, "ATTENDANCE_ROLLUP_GRAIN", "week")
+    assert gd.rollup_period(datetime.date(2023, 10, 30)) == datetime.date(2023, 10, 30)
+
+
+def test_rollup_period_month(monkeypatch):
+    monkeypatch.setattr(gd, "ATTENDANCE_ROLLUP_GRAIN", "month")
+    # Неделя, начавшаяся в конце октября, относится к октябрю
+    assert gd.rollup_period(datetime.date(2023, 10, 30)) == datetime.date(2023, 10, 1)
+    assert gd.rollup_period(datetime.date(2023, 11, 6)) == datetime.date(2023, 11, 1)
+
+
+def test_rollup_period_unknown_grain(monkeypatch):
+    monkeypatch.setattr(gd, "ATTENDANCE_ROLLUP_GRAIN", "year")
+    with pytest.raises(ValueError):
+        gd.rollup_period(datetime.date(2023, 10, 30))
+
+##########################################################################
+# Каталог
+##########################################################################
+
+def test_catalog_table_discard():
+    table = gd.CatalogTable(id="i", name="str", number="text")
+    for i in range(1, 6):
+        table.append(i, f"name{i % 2}", f"S{i:04d}")
+    table.discard("id", [2, 4, 10])
+    assert len(table) == 3
+    assert list(table.rows("id", "name", "number")) == [
+        (1, "name1", "S0001"), (3, "name1", "S0003"), (5, "name1", "S0005")]
+    assert isinstance(table["id"], array)
+    assert isinstance(table["name"], gd.StringColumn)
+    assert isinstance(table["number"], gd.TextColumn)
+    # После пересборки таблица продолжает принимать строки
+    table.append(6, "name0", "S0006")
+    assert list(table["number"]) == ["S0001", "S0003", "S0005", "S0006"]
+
+
+def test_catalog_table_discard_by_string_column():
+    table = gd.CatalogTable(id="i", name="str")
+    for i, name in enumerate(["a", "b", "a", "c"], start=1):
+        table.append(i, name)
+    table.discard("name", {"a"})
+    assert list(table.rows("id", "name")) == [(2, "b"), (4, "c")]